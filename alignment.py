@@ -0,0 +1,171 @@
+"""
+Tempo-invariant scoring of a whole attempt against a reference.
+
+Both landmark sequences are turned into per-frame pose features (joint
+angles plus hip-centred, shoulder-scaled positions of the limbs) and
+aligned with banded dynamic time warping. The step pattern is the
+asymmetric one: every reference frame i is matched to exactly one
+attempt frame j, and j moves on by 0, 1 or 2 per reference frame. So
+the attempt may run anywhere from half to any slower tempo than the
+reference. Each DP row then only depends on the previous row and is
+one vectorised NumPy step, so the cost is O(T * band).
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+import similarity
+from landmark_store import load_landmarks
+
+# limbs used for the position part of the feature vector
+FEATURE_LANDMARKS = [11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28]
+ANGLE_WEIGHT = 2.0
+# cost for a pair with nothing in common (e.g. no pose in either frame)
+MISSING_COST = 1.0
+BAND_SECONDS = 3.0
+_ROWS_PER_CHUNK = 512
+
+
+def pose_features(arr):
+    """
+    (T, 33, 4) landmarks -> (T, D) features and (T, D) validity mask.
+    Invisible parts are zero in the features and False in the mask.
+    """
+    arr = similarity.to_array(arr)
+    vis = similarity.visible(arr)
+
+    angles = similarity.joint_angles(arr) / 180.0 * ANGLE_WEIGHT
+    a_ok = similarity.joint_visible(arr)
+
+    hips_ok = vis[:, 23] & vis[:, 24]
+    centre = np.where(hips_ok[:, None], (arr[:, 23, :2] + arr[:, 24, :2]) / 2,
+                      (arr[:, 11, :2] + arr[:, 12, :2]) / 2)
+    pos = (arr[:, FEATURE_LANDMARKS, :2] - centre[:, None]) / similarity.body_scale(arr)[:, None, None]
+    p_ok = vis[:, FEATURE_LANDMARKS] & (hips_ok | (vis[:, 11] & vis[:, 12]))[:, None]
+
+    feats = np.concatenate([angles, pos.reshape(len(arr), -1)], axis=1)
+    mask = np.concatenate([a_ok, np.repeat(p_ok, 2, axis=1)], axis=1)
+    feats = np.where(mask, feats, 0.0)
+    return feats.astype(np.float32), mask
+
+
+def _band_costs(fr, mr, fa, ma, cols):
+    """
+    Mean squared feature distance over the dims valid in both frames, for
+    every (i, cols[i, k]) pair. Features are zero where masked, so
+    sum(m_r m_a (f_r - f_a)^2) expands into plain dot products; each block
+    of rows is one matmul against the attempt columns its band covers.
+    """
+    n_a = len(fa)
+    mr, ma = mr.astype(np.float32), ma.astype(np.float32)
+    left = np.concatenate([mr, -2 * fr, fr * fr, mr], axis=1)
+    right_d = np.concatenate([fa * fa, fa, ma], axis=1)
+
+    D = fr.shape[1]
+    cost = np.full(cols.shape, np.inf, np.float32)
+    for s in range(0, len(fr), _ROWS_PER_CHUNK):
+        e = min(s + _ROWS_PER_CHUNK, len(fr))
+        lo = max(int(cols[s:e].min()), 0)
+        hi = min(int(cols[s:e].max()) + 1, n_a)
+        if lo >= hi:
+            continue
+        d = left[s:e, :3 * D] @ right_d[lo:hi].T
+        n = left[s:e, 3 * D:] @ ma[lo:hi].T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            block = np.where(n > 0, np.maximum(d, 0) / n, MISSING_COST)
+        c = cols[s:e]
+        inside = (c >= lo) & (c < hi)
+        rows = np.arange(e - s)[:, None]
+        cost[s:e] = np.where(inside, block[rows, np.clip(c - lo, 0, hi - lo - 1)], np.inf)
+    return cost
+
+
+def dtw_path(ref_feats, ref_mask, att_feats, att_mask, band):
+    """
+    Returns, for every reference frame, the index of the attempt frame it
+    is aligned to. The search is limited to +/- band frames around the
+    straight line from (0, 0) to (T_ref, T_att); start and end are free
+    inside that band so a late or early start shows up as lag. Raises
+    ValueError when no path fits, see the step pattern above.
+    """
+    n_r, n_a = len(ref_feats), len(att_feats)
+    k = 2 * band + 1
+    slope = (n_a - 1) / max(n_r - 1, 1)
+    centre = np.rint(np.arange(n_r) * slope).astype(np.int64)
+    cols = centre[:, None] - band + np.arange(k)[None]
+    cost = _band_costs(ref_feats, ref_mask, att_feats, att_mask, cols)
+
+    back = np.zeros((n_r, k), np.uint8)
+    acc = cost[0].astype(np.float64)
+    # previous row padded with inf: band position y lives at pad[y + 2]
+    shifts = np.diff(centre)
+    pad = np.full(k + 4 + (int(shifts.max()) if n_r > 1 else 0), np.inf)
+    for i in range(1, n_r):
+        pad[2:k + 2] = acc
+        sh = shifts[i - 1]
+        # column j - s of the previous row sits at band position x + shift - s
+        c0, c1, c2 = pad[sh + 2:sh + 2 + k], pad[sh + 1:sh + 1 + k], pad[sh:sh + k]
+        best = np.minimum(c0, c1)
+        step = (c1 < c0).astype(np.uint8)
+        take2 = c2 < best
+        step[take2] = 2
+        acc = cost[i] + np.minimum(best, c2)
+        back[i] = step
+
+    if not np.isfinite(acc).any():
+        # j moves on by 2 at most per reference frame, so an attempt more
+        # than about twice as long (plus the band) cannot be walked through
+        raise ValueError("attempt/reference length ratio out of range")
+    path = np.empty(n_r, np.int64)
+    pos = int(np.argmin(acc))
+    for i in range(n_r - 1, -1, -1):
+        path[i] = cols[i, pos]
+        if i:
+            pos = int(pos + centre[i] - centre[i - 1] - back[i, pos])
+    return path
+
+
+class Alignment(NamedTuple):
+    path: np.ndarray        # attempt frame aligned to each reference frame
+    scores: np.ndarray      # similarity.compare score per reference frame
+    lag: np.ndarray         # seconds the attempt trails (+) or leads (-) per frame
+    overall: float
+    median_lag: float
+    grade: str
+
+
+def grade(score):
+    """Same buckets as the live overlay."""
+    return "Great" if score >= 0.8 else ("Acceptable" if score >= 0.5 else "Wrong")
+
+
+def align(ref, att, fps=30.0, band=None):
+    """
+    Aligns attempt landmarks to reference landmarks, both (T, 33, 4)
+    arrays (or anything similarity.to_array accepts), and scores every
+    reference frame against the attempt frame it landed on.
+    """
+    ref, att = similarity.to_array(ref), similarity.to_array(att)
+    if not len(ref) or not len(att):
+        raise ValueError("cannot align an empty landmark sequence")
+    band = int(band if band is not None else BAND_SECONDS * fps)
+    band = max(band, 1)
+
+    fr, mr = pose_features(ref)
+    fa, ma = pose_features(att)
+    path = dtw_path(fr, mr, fa, ma, band)
+
+    scores = similarity.compare(ref, att[path]).score
+    lag = (path - np.arange(len(ref))) / fps
+    present = ~np.isnan(ref[:, 0, 0])
+    overall = float(scores[present].mean()) if present.any() else 0.0
+    median_lag = float(np.median(lag[present])) if present.any() else 0.0
+    return Alignment(path, scores, lag, overall, median_lag, grade(overall))
+
+
+def score_files(ref_path, att_path, band_seconds=None):
+    """align() for two landmark files, using the reference's fps."""
+    ref, att = load_landmarks(ref_path), load_landmarks(att_path)
+    fps = ref.fps or att.fps or 30.0
+    band = None if band_seconds is None else band_seconds * fps
+    return align(ref.landmarks, att.landmarks, fps=fps, band=band), fps
@@ -1,36 +1,108 @@
 import os
+import time
 import uuid
-import pickle
+import threading
+import multiprocessing
 import cv2
-import numpy as np
-import mediapipe as mp
-import openai
-from mediapipe.framework.formats import landmark_pb2
 from flask import Flask, request, jsonify, url_for, send_file, abort, Response
 from flask_cors import CORS
 from hello import (
-    preprocess_and_annotate_video,
-    calculate_similarity,
-    calculate_angle,
-    generate_feedback,
-    draw_colored_skeleton,
-    resize_to_height,
-    angleData,
-    LengthData,
-    draw_lines
+    PREPROCESS_WORKERS,
+    as_points,
+    POSE_SETTINGS,
+    PREPROCESS_STRIDE,
+    INFER_HEIGHT,
+    POSE_ROI
 )
+from landmark_store import load_landmarks
+from reference_index import load_index
+from pipeline import ComparisonPipeline
+from landmark_stream import LandmarkStream
+from handoff import Closed
+import camera
+import catalog
+import coach
+import inference
+import metrics
+import overlay
+import progressive
+import pose_pool
+import proxy
+from alignment import score_files
+from jobs import JobQueue, QueueFull
+from batch import BatchGrader, summarize
+from upload_cache import save_and_hash, cache_key, lookup
 
 app = Flask(__name__)
 CORS(app)
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 UPLOAD_FOLDER = os.path.join(app.root_path, "uploads")
 PROCESSED_FOLDER = os.path.join(app.root_path, "static", "processed")
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+# spawned workers (jobs, batch, segments, inference, the Manager) run this
+# module again as __mp_main__; background upkeep only belongs to the top one
+MAIN_PROCESS = multiprocessing.current_process().name == "MainProcess"
+
+UPLOAD_WORKERS = int(os.getenv("DANCE_UPLOAD_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+UPLOAD_QUEUE_SIZE = int(os.getenv("DANCE_UPLOAD_QUEUE", 32))
+
+jobs = JobQueue(workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE)
+
+BATCH_WORKERS = int(os.getenv("DANCE_BATCH_WORKERS", os.cpu_count() or 1))
+grader = BatchGrader(workers=BATCH_WORKERS)
+
+# /generate_feedback replies, by landmark content and prompt version
+llm = coach.get_client()
+feedback_cache = coach.ResponseCache(os.getenv("DANCE_FEEDBACK_CACHE", os.path.join(UPLOAD_FOLDER, "feedback")))
+
+# what is on disk and when it was last used; evicts cold assets over
+# DANCE_DISK_QUOTA_MB. A worker's job queues are empty, so one started
+# there would see nothing in use and could evict what this process serves
+assets = None
+if MAIN_PROCESS:
+    assets = catalog.Catalog(os.getenv("DANCE_CATALOG", os.path.join(UPLOAD_FOLDER, "catalog.sqlite3")),
+                             [UPLOAD_FOLDER, PROCESSED_FOLDER],
+                             in_use=lambda: jobs.in_use() + grader.in_use()).start()
+
+def asset_path(name, folder=None, reference=False):
+    """
+    Path of an uploaded or processed file by name, None if it is not on
+    disk; marks its asset as used (as a reference).
+    """
+    name = os.path.basename(name)
+    path = assets.find(name) or os.path.join(folder or UPLOAD_FOLDER, name)
+    if not os.path.isfile(path):
+        return None
+    assets.touch(name, reference)
+    return path
+
+# what an upload's cached outputs depend on; the fast modes only join the
+# key when on, so outputs cached before they existed still hit
+CACHE_SETTINGS = dict(POSE_SETTINGS)
+if PREPROCESS_STRIDE > 1 or INFER_HEIGHT:
+    CACHE_SETTINGS.update(stride=PREPROCESS_STRIDE, infer_height=INFER_HEIGHT)
+if POSE_ROI:
+    CACHE_SETTINGS.update(roi=True)
+
+# live pose in DANCE_INFERENCE_WORKERS processes instead of this one
+inference_pool = None
+if inference.WORKERS and MAIN_PROCESS:
+    inference_pool = inference.InferencePool(warm=[camera.CAMERA_POSE_SETTINGS]).start()
+    pose_pool.use(inference_pool)
+
+# live Pose graphs built in the background at startup, 0 builds them on
+# first use; workers never run the live feeds, so they build none
+POSE_WARMUP = int(os.getenv("DANCE_POSE_WARMUP", 1))
+if POSE_WARMUP and MAIN_PROCESS:
+    pose_pool.warm_async(camera.CAMERA_POSE_SETTINGS, count=POSE_WARMUP)
+
+# running /compare_feed streams by session id
+live_sessions = {}
+sessions_lock = threading.Lock()
+
 @app.route("/upload", methods=["POST"])
 def upload_video():
     if "video" not in request.files:
@@ -41,138 +113,147 @@ def upload_video():
         return jsonify({"error": "Empty filename"}), 400
 
     ext = os.path.splitext(f.filename)[1]
-    uid = uuid.uuid4().hex
+    tmp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.part")
+    uid = cache_key(save_and_hash(f.stream, tmp_path), CACHE_SETTINGS)
     in_name = f"{uid}{ext}"
     out_name = f"{uid}_annotated{ext}"
-    lm_name = f"{uid}.pkl"
+    lm_name = f"{uid}.lmk"
 
     in_path = os.path.join(UPLOAD_FOLDER, in_name)
     out_path = os.path.join(PROCESSED_FOLDER, out_name)
     lm_path = os.path.join(UPLOAD_FOLDER, lm_name)
 
-    f.save(in_path)
+    os.replace(tmp_path, in_path)
+    assets.add(in_path, kind="upload", original_name=f.filename)
+
+    webm_path = os.path.splitext(out_path)[0] + ".webm"
+    manifest_url = url_for("segment_file", name=os.path.basename(webm_path), filename=progressive.MANIFEST,
+                           _external=True) if progressive.SEGMENT_SECONDS > 0 and PREPROCESS_WORKERS <= 1 else None
+    if lookup(webm_path, lm_path):
+        assets.touch(lm_name)
+        job_id = jobs.add_done(webm_path, frames=len(load_landmarks(lm_path)), cached=True,
+                               raw_filename=in_name, landmarks_filename=lm_name)
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for("job_status", job_id=job_id, _external=True),
+            "video_url": url_for("processed_video", filename=os.path.basename(webm_path), _external=True),
+            "raw_filename": in_name,
+            "landmarks_filename": lm_name
+        })
 
-    webm_path = preprocess_and_annotate_video(in_path, out_path, lm_path)
-    webm_name = os.path.basename(webm_path)
+    try:
+        job_id = jobs.submit(in_path, out_path, lm_path, key=uid, manifest_url=manifest_url,
+                             raw_filename=in_name, landmarks_filename=lm_name)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
 
     return jsonify({
-        "video_url": url_for("processed_video", filename=webm_name, _external=True),
+        "job_id": job_id,
+        "status_url": url_for("job_status", job_id=job_id, _external=True),
+        # segments are listed here while the job runs, see progressive.py
+        "manifest_url": manifest_url,
         "raw_filename": in_name,
         "landmarks_filename": lm_name
-    })
+    }), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    st = jobs.status(job_id)
+    if st is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if st["state"] == "done":
+        webm_name = os.path.basename(st.pop("result"))
+        st["video_url"] = url_for("processed_video", filename=webm_name, _external=True)
+    return jsonify(st)
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if not jobs.cancel(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(jobs.status(job_id))
 
 @app.route("/processed/<path:filename>")
 def processed_video(filename):
-    full = os.path.join(PROCESSED_FOLDER, filename)
-    if not os.path.isfile(full):
+    full = asset_path(filename, PROCESSED_FOLDER)
+    if full is None:
         abort(404)
     mimetype = "video/webm" if filename.lower().endswith(".webm") else "video/mp4"
     return send_file(full, mimetype=mimetype, conditional=True)
 
-mp_pose = mp.solutions.pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-mp_drawing = mp.solutions.drawing_utils
-
-def generate_frames():
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise RuntimeError("Could not start camera.")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = mp_pose.process(rgb)
+@app.route("/processed/<name>/segments/<filename>")
+def segment_file(name, filename):
+    """
+    manifest.json and the finished segments of an upload still being
+    processed; name is the .webm the job will produce.
+    """
+    webm_path = os.path.join(PROCESSED_FOLDER, os.path.basename(name))
+    folder = progressive.parts_dir(webm_path)
+    manifest = progressive.read_manifest(folder)
+    if manifest is None:
+        # stitched, and the segments since removed
+        if filename != progressive.MANIFEST or not os.path.exists(webm_path):
+            abort(404)
+        manifest = progressive.done_manifest(webm_path)
+    if filename == progressive.MANIFEST:
+        if manifest["complete"]:
+            manifest["video_url"] = url_for("processed_video", filename=manifest["video"], _external=True)
+        resp = jsonify(manifest)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    # only segments the manifest lists are complete files
+    if filename not in {seg["file"] for seg in manifest["segments"]}:
+        abort(404)
+    return send_file(os.path.join(folder, filename), mimetype="video/webm", conditional=True,
+                     max_age=86400)
 
-        if results.pose_landmarks:
-            draw_lines(frame, results.pose_landmarks)
-            mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+_t_feed_draw = metrics.timer("video_feed", "draw")
+_t_feed_encode = metrics.timer("video_feed", "encode")
 
-        success, buf = cv2.imencode('.jpg', frame)
-        if not success:
-            continue
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buf.tobytes() + b'\r\n')
+def generate_frames():
+    # the camera and its pose graph are shared with every other open stream
+    sub = camera.subscribe()
+    try:
+        while True:
+            try:
+                cf = sub.get()
+            except Closed:
+                break
+
+            t0 = time.perf_counter()
+            frame = cf.image.copy()
+            if cf.landmarks:
+                # what draw_lines and then mediapipe's default style left on screen
+                overlay.draw_landmarks(frame, as_points(cf.landmarks))
+            t1 = time.perf_counter()
+            success, buf = cv2.imencode('.jpg', frame)
+            _t_feed_draw.observe(t1 - t0)
+            _t_feed_encode.observe(time.perf_counter() - t1)
+            if not success:
+                continue
+            yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buf.tobytes() + b'\r\n')
+    finally:
+        sub.close()
 
 @app.route("/video_feed")
 def video_feed():
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def generate_comparison_frames(video_path, landmarks_path):
-    with open(landmarks_path, 'rb') as f:
-        all_lm = pickle.load(f)
-
-    vid = cv2.VideoCapture(video_path)
-    cam = cv2.VideoCapture(0)
-    pose = mp.solutions.pose.Pose(model_complexity=0, min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    mp_drawing = mp.solutions.drawing_utils
-
-    history = []
-    idx = 0
-
-    while True:
-        ok1, fv = vid.read()
-        ok2, fc = cam.read()
-        if not ok1 or not ok2:
-            break
-
-        fv = cv2.flip(fv, 1)
-        fv = resize_to_height(fv, 480)
-        raw = all_lm[idx]
-        ref_list = None
-
-        if raw:
-            mirrored = [(1-x, y, z, v) for x, y, z, v in raw]
-            ref_list = landmark_pb2.NormalizedLandmarkList(landmark=[landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=v) for x, y, z, v in mirrored])
-
-        fc = cv2.flip(fc, 1)
-        res2 = pose.process(cv2.cvtColor(fc, cv2.COLOR_BGR2RGB))
-
-        if res2.pose_landmarks and ref_list:
-            cam_raw = [(p.x, p.y, p.z, p.visibility) for p in res2.pose_landmarks.landmark]
-            ref_raw = [(p.x, p.y, p.z, p.visibility) for p in ref_list.landmark]
-            s = calculate_similarity(ref_raw, cam_raw)
-            history.append(s)
-            if len(history) > 3:
-                history.pop(0)
-            avg = sum(history) / len(history)
-        else:
-            avg = 0.0
-
-        if ref_list:
-            draw_colored_skeleton(fv, ref_list, avg)
-        if res2.pose_landmarks:
-            draw_colored_skeleton(fc, res2.pose_landmarks, avg)
-
-        if ref_list:
-            y_off = 30
-            for a, b, c, name in [(11,13,15,"Left Elbow"), (12,14,16,"Right Elbow"), (13,11,23,"Left Shoulder"), (14,12,24,"Right Shoulder")]:
-                lm = ref_list.landmark
-                if lm[a].visibility > 0.5 and lm[b].visibility > 0.5 and lm[c].visibility > 0.5:
-                    ang = calculate_angle((lm[a].x, lm[a].y), (lm[b].x, lm[b].y), (lm[c].x, lm[c].y))
-                    cv2.putText(fv, f"{name}: {ang:.1f}\u00b0", (10, y_off), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,0,0), 1)
-                    y_off += 25
-
-        if res2.pose_landmarks and ref_list:
-            cv2.putText(fc, f"Sim: {avg:.2f}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
-            cv2.putText(fc, f"Pos: {LengthData:.2f}", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
-            mp_drawing.draw_landmarks(fc, res2.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
-
-        combined = np.hstack((fv, fc))
-        fb = "Great" if avg >= 0.8 else ("Acceptable" if avg >= 0.5 else "Wrong")
-        ts, _ = cv2.getTextSize(fb, cv2.FONT_HERSHEY_SIMPLEX, 1.0, 2)
-        x = (combined.shape[1] - ts[0]) // 2
-        cv2.putText(combined, fb, (x, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 2)
-
-        for i, msg in enumerate(generate_feedback(angleData, LengthData)):
-            cv2.putText(combined, msg, (10, combined.shape[0] - 100 + 30*i), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2)
-
-        ret, buf = cv2.imencode('.jpg', combined)
-        if not ret:
-            continue
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buf.tobytes() + b'\r\n')
-
-        idx = (idx + 1) % len(all_lm)
+def generate_comparison_frames(video_path, landmarks_path, session_id=None):
+    all_lm = load_index(landmarks_path)
+    session_id = session_id or uuid.uuid4().hex
+
+    # a reference's proxy is built the first time it is compared against
+    pipe = ComparisonPipeline(video_path, all_lm, on_proxy_built=assets.add).start()
+    with sessions_lock:
+        live_sessions[session_id] = pipe
+    try:
+        for jpg in pipe:
+            yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n')
+    finally:
+        with sessions_lock:
+            if live_sessions.get(session_id) is pipe:
+                del live_sessions[session_id]
+        pipe.stop()
 
 @app.route("/compare_feed")
 def compare_feed():
@@ -180,11 +261,174 @@ def compare_feed():
     landmarks = request.args.get("landmarks")
     if not video or not landmarks:
         abort(400, "Provide ?video=... & landmarks=...")
-    vp = os.path.join(UPLOAD_FOLDER, video)
-    lp = os.path.join(UPLOAD_FOLDER, landmarks)
-    if not os.path.isfile(vp) or not os.path.isfile(lp):
+    vp = asset_path(video, reference=True)
+    lp = asset_path(landmarks, reference=True)
+    if vp is None and asset_path(proxy.proxy_path(video)) is not None:
+        # the upload itself was evicted, its proxy has every frame shown
+        vp = os.path.join(UPLOAD_FOLDER, os.path.basename(video))
+    if vp is None or lp is None:
+        abort(404)
+    # the client may pick the id so it can poll /sessions/<id> for latency
+    session_id = request.args.get("session") or uuid.uuid4().hex
+    resp = Response(generate_comparison_frames(vp, lp, session_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+    resp.headers["X-Session-Id"] = session_id
+    return resp
+
+def generate_landmark_messages(landmarks_path, session_id, fmt):
+    stream = LandmarkStream(load_index(landmarks_path))
+    with sessions_lock:
+        live_sessions[session_id] = stream
+    try:
+        yield from (stream.sse() if fmt == "sse" else stream.binary())
+    finally:
+        with sessions_lock:
+            if live_sessions.get(session_id) is stream:
+                del live_sessions[session_id]
+        stream.stop()
+
+@app.route("/compare_stream")
+def compare_stream():
+    """
+    Like /compare_feed but landmarks and scores only, the client draws
+    (see landmark_stream.py). ?format=sse for EventSource, default binary.
+    """
+    landmarks = request.args.get("landmarks")
+    if not landmarks:
+        abort(400, "Provide ?landmarks=...")
+    lp = asset_path(landmarks, reference=True)
+    if lp is None:
         abort(404)
-    return Response(generate_comparison_frames(vp, lp), mimetype='multipart/x-mixed-replace; boundary=frame')
+    fmt = request.args.get("format", "binary")
+    if fmt not in ("binary", "sse"):
+        abort(400, "format is binary or sse")
+    session_id = request.args.get("session") or uuid.uuid4().hex
+    mimetype = "text/event-stream" if fmt == "sse" else "application/octet-stream"
+    resp = Response(generate_landmark_messages(lp, session_id, fmt), mimetype=mimetype)
+    resp.headers["X-Session-Id"] = session_id
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/cameras", methods=["GET"])
+def list_cameras():
+    return jsonify(camera.active())
+
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
+    with sessions_lock:
+        current = dict(live_sessions)
+    return jsonify({sid: pipe.status() for sid, pipe in current.items()})
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def session_status(session_id):
+    with sessions_lock:
+        pipe = live_sessions.get(session_id)
+    if pipe is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"id": session_id, **pipe.status()})
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    with sessions_lock:
+        n_sessions = len(live_sessions)
+    depth = jobs.depth()
+    text = metrics.render(gauges=[
+        ("dance_active_sessions", "Open /compare_feed streams.", [({}, n_sessions)]),
+        ("dance_camera_subscribers", "Streams reading each shared camera.",
+         [({"source": src}, n) for src, n in camera.active().items()]),
+        ("dance_job_queue_depth", "Upload jobs waiting for or holding a worker.",
+         [({"state": state}, n) for state, n in depth.items()]),
+        ("dance_batch_queue_depth", "Batch grading attempts waiting for or holding a worker.",
+         [({"state": state}, n) for state, n in grader.depth().items()]),
+        ("dance_disk_bytes", "Bytes of uploads and their derived files, by role.",
+         [({"role": role}, n) for role, n in assets.usage()["by_role"].items()]),
+        ("dance_inference_in_flight", "Frames submitted to each inference worker and not answered yet.",
+         [({"worker": w["worker"]}, w["in_flight"]) for w in (inference_pool.stats() if inference_pool else [])]),
+    ])
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+@app.route("/assets", methods=["GET"])
+def asset_usage():
+    return jsonify(assets.usage())
+
+@app.route("/assets/<asset_id>", methods=["GET"])
+def asset_info(asset_id):
+    info = assets.asset(asset_id)
+    if info is None:
+        return jsonify({"error": "Unknown asset"}), 404
+    return jsonify(info)
+
+@app.route("/assets/<asset_id>/pin", methods=["POST", "DELETE"])
+def pin_asset(asset_id):
+    """Pinned assets are never evicted."""
+    if assets.asset(asset_id) is None:
+        return jsonify({"error": "Unknown asset"}), 404
+    assets.pin(asset_id, request.method == "POST")
+    return jsonify(assets.asset(asset_id))
+
+@app.route("/score", methods=["POST"])
+def score_attempt():
+    data = request.get_json() or {}
+    ref_name, att_name = data.get("reference"), data.get("attempt")
+    if not ref_name or not att_name:
+        return jsonify({"error": "Provide reference and attempt landmark filenames"}), 400
+
+    ref_path = asset_path(ref_name, reference=True)
+    att_path = asset_path(att_name)
+    if ref_path is None or att_path is None:
+        return jsonify({"error": "Landmarks file not found"}), 404
+
+    try:
+        res, fps = score_files(ref_path, att_path, data.get("band_seconds"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(summarize(res, fps))
+
+@app.route("/batch", methods=["POST"])
+def submit_batch():
+    """
+    Grades many attempt videos (files "videos") against one processed
+    reference (form field "reference", a .lmk from /upload). Poll the
+    status_url: attempts report progress and their results as they finish.
+    """
+    ref_name = request.form.get("reference")
+    videos = [f for f in request.files.getlist("videos") if f.filename]
+    if not ref_name or not videos:
+        return jsonify({"error": "Provide a reference landmark filename and videos"}), 400
+    ref_path = asset_path(ref_name, reference=True)
+    if ref_path is None:
+        return jsonify({"error": "Reference landmarks not found"}), 404
+    band = request.form.get("band_seconds", type=float)
+
+    attempts = []
+    for f in videos:
+        # same naming as /upload, so an attempt uploaded before is not run again
+        tmp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.part")
+        uid = cache_key(save_and_hash(f.stream, tmp_path), CACHE_SETTINGS)
+        in_path = os.path.join(UPLOAD_FOLDER, uid + os.path.splitext(f.filename)[1])
+        os.replace(tmp_path, in_path)
+        assets.add(in_path, kind="attempt", original_name=f.filename)
+        attempts.append((f.filename, in_path, os.path.join(UPLOAD_FOLDER, f"{uid}.lmk")))
+
+    batch_id = grader.submit(ref_path, attempts, band)
+    return jsonify({
+        "batch_id": batch_id,
+        "status_url": url_for("batch_status", batch_id=batch_id, _external=True),
+        "attempts": len(attempts)
+    }), 202
+
+@app.route("/batch/<batch_id>", methods=["GET"])
+def batch_status(batch_id):
+    st = grader.status(batch_id, with_timeline=request.args.get("timeline", "1") != "0")
+    if st is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    return jsonify(st)
+
+@app.route("/batch/<batch_id>", methods=["DELETE"])
+def cancel_batch(batch_id):
+    if not grader.cancel(batch_id):
+        return jsonify({"error": "Unknown batch"}), 404
+    return jsonify(grader.status(batch_id, with_timeline=False))
 
 @app.route("/generate_feedback", methods=["POST"])
 def generate_feedback_from_landmarks():
@@ -194,37 +438,13 @@ def generate_feedback_from_landmarks():
     if not landmarks_filename:
         return jsonify({"error": "No landmarks filename provided"}), 400
 
-    landmarks_path = os.path.join(UPLOAD_FOLDER, landmarks_filename)
-    if not os.path.isfile(landmarks_path):
+    landmarks_path = asset_path(landmarks_filename)
+    if landmarks_path is None:
         return jsonify({"error": "Landmarks file not found"}), 404
 
-    with open(landmarks_path, 'rb') as f:
-        landmarks = pickle.load(f)
-
-    simplified_landmarks = []
-    for frame in landmarks:
-        if frame:
-            simplified_landmarks.append([{"x": l[0], "y": l[1], "z": l[2], "visibility": l[3]} for l in frame])
-
-    prompt = f"""
-You are a dance coach AI. Analyze the following body movement data over time.
-Here is the data:
-{simplified_landmarks[:5]}
-Focus on overall posture, balance, mistakes, and general improvement tips.
-"""
-
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a professional dance instructor."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=400
-        )
-        feedback = response['choices'][0]['message']['content']
-        return jsonify({"feedback": feedback})
+        text, cached = coach.feedback(load_landmarks(landmarks_path), llm, feedback_cache)
+        return jsonify({"feedback": text, "cached": cached})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,213 @@
+"""
+Grades a whole class: many recorded attempts against one reference.
+
+Each attempt is one task on a process pool: pose over the video (no
+annotated output, only landmarks, saved as .lmk so a re-run or a later
+/score skips that part), then alignment.align against the reference.
+Results come back per attempt as they finish, so a batch is usable
+while it is still running.
+
+    python batch.py uploads/<ref>.lmk attempts/*.mp4 --out grades.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import as_completed
+
+import cv2
+import numpy as np
+
+from alignment import score_files
+from hello import annotate_range, PREPROCESS_STRIDE, INFER_HEIGHT, POSE_ROI
+from jobs import ProcessQueue, KEEP_FINISHED, reporter, worker_pose
+from landmark_store import save_landmarks
+
+
+def summarize(res, fps):
+    """The /score response for an alignment.Alignment."""
+    return {
+        "overall": round(res.overall, 4),
+        "grade": res.grade,
+        "median_lag_seconds": round(res.median_lag, 3),
+        "fps": fps,
+        "timeline": [round(float(s), 4) for s in res.scores],
+        "lag": [round(float(l), 3) for l in res.lag],
+        "aligned_frames": res.path.tolist(),
+    }
+
+
+def extract_landmarks(video_path, lm_path, pose, progress=None):
+    """Pose over a whole video into lm_path, without drawing or encoding anything."""
+    vid = cv2.VideoCapture(video_path)
+    if not vid.isOpened():
+        raise IOError(f"Cannot open {video_path}")
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    total = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
+    try:
+        landmarks, interpolated = annotate_range(
+            vid, pose, None, stride=PREPROCESS_STRIDE, infer_height=INFER_HEIGHT, track_roi=POSE_ROI,
+            progress=progress and (lambda n: progress(n, max(total, n))))
+    finally:
+        vid.release()
+    save_landmarks(lm_path, landmarks, fps, *size, interpolated=interpolated)
+
+
+# ---- worker side ----
+
+def _grade(task_id, ref_path, video_path, lm_path, band_seconds, progress, cancelled):
+    if not os.path.isfile(lm_path):
+        with worker_pose() as pose:
+            extract_landmarks(video_path, lm_path, pose,
+                              progress=reporter(task_id, progress, cancelled))
+    res, fps = score_files(ref_path, lm_path, band_seconds)
+    return summarize(res, fps)
+
+
+# ---- parent side ----
+
+class Batch:
+    def __init__(self, batch_id, reference, attempts):
+        self.id = batch_id
+        self.reference = reference
+        self.attempts = attempts        # [{"name", "video", "landmarks"}]
+        self.futures = []
+        self.created = time.time()
+
+    def done(self):
+        return all(f.done() for f in self.futures)
+
+
+class BatchGrader(ProcessQueue):
+    """
+    Process pool for batches. submit() returns a batch id right away;
+    status() has every attempt's state and the results finished so far.
+    Finished batches beyond keep_finished are dropped, oldest first.
+    """
+
+    def __init__(self, workers=None, pose_settings=None, keep_finished=KEEP_FINISHED):
+        super().__init__(workers or os.cpu_count() or 1, pose_settings, keep_finished)
+        self._batches = {}
+
+    def submit(self, ref_path, attempts, band_seconds=None):
+        """
+        attempts: (name, video_path, landmarks_path) tuples; an existing
+        landmarks_path is scored as is, otherwise the video is run first.
+        """
+        batch_id = uuid.uuid4().hex
+        batch = Batch(batch_id, ref_path,
+                      [{"name": n, "video": v, "landmarks": l} for n, v, l in attempts])
+        with self._lock:
+            self._start()
+            for i, a in enumerate(batch.attempts):
+                task_id = f"{batch_id}:{i}"
+                self._progress[task_id] = (0, 0)
+                batch.futures.append(self._pool.submit(
+                    _grade, task_id, ref_path, a["video"], a["landmarks"], band_seconds,
+                    self._progress, self._cancelled))
+            self._batches[batch_id] = batch
+            self._drop_oldest(self._batches, Batch.done, self._dropped)
+        return batch_id
+
+    def _dropped(self, batch_id, batch):
+        for i in range(len(batch.futures)):
+            self._forget(f"{batch_id}:{i}")
+
+    def _attempt_status(self, batch, i, with_timeline=True):
+        a, fut = batch.attempts[i], batch.futures[i]
+        st = {"name": a["name"], "landmarks_filename": os.path.basename(a["landmarks"]),
+              **self._state(f"{batch.id}:{i}", fut)}
+        if st["state"] == "done":
+            res = fut.result()
+            if not with_timeline:
+                res = {k: v for k, v in res.items() if k not in ("timeline", "lag", "aligned_frames")}
+            st.update(res)
+        return st
+
+    def status(self, batch_id, with_timeline=True):
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+        attempts = [self._attempt_status(batch, i, with_timeline) for i in range(len(batch.attempts))]
+        graded = [a for a in attempts if a["state"] == "done"]
+        counts = {}
+        for a in attempts:
+            counts[a["state"]] = counts.get(a["state"], 0) + 1
+        scores = [a["overall"] for a in graded]
+        return {
+            "id": batch_id,
+            "state": "done" if batch.done() else "running",
+            "reference": os.path.basename(batch.reference),
+            "total": len(attempts),
+            "counts": counts,
+            "summary": {
+                "graded": len(graded),
+                "mean": round(float(np.mean(scores)), 4) if scores else None,
+                "median": round(float(np.median(scores)), 4) if scores else None,
+                "ranking": [a["name"] for a in sorted(graded, key=lambda a: -a["overall"])],
+            },
+            "attempts": attempts,
+        }
+
+    def depth(self):
+        """Attempts not finished yet, over all batches, by state."""
+        return self._depth([f for b in list(self._batches.values()) for f in b.futures])
+
+    def in_use(self):
+        """Files of the batches not finished yet."""
+        return [p for b in list(self._batches.values()) if not b.done()
+                for p in [b.reference] + [a[k] for a in b.attempts for k in ("video", "landmarks")]]
+
+    def cancel(self, batch_id):
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            return False
+        for i, fut in enumerate(batch.futures):
+            self._cancel(f"{batch.id}:{i}", fut)
+        return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Grade many attempt videos against one reference.")
+    ap.add_argument("reference", help="reference landmark file (.lmk)")
+    ap.add_argument("videos", nargs="+")
+    ap.add_argument("--workers", type=int, default=None, help="default: all cores")
+    ap.add_argument("--band-seconds", type=float, default=None)
+    ap.add_argument("--landmarks-dir", help="where attempt .lmk files go (default: next to each video)")
+    ap.add_argument("--out", help="results JSON, rewritten as each attempt finishes")
+    args = ap.parse_args()
+
+    attempts = []
+    for v in args.videos:
+        base = os.path.splitext(v)[0]
+        if args.landmarks_dir:
+            base = os.path.join(args.landmarks_dir, os.path.basename(base))
+        attempts.append((os.path.basename(v), v, base + ".lmk"))
+    if args.landmarks_dir:
+        os.makedirs(args.landmarks_dir, exist_ok=True)
+
+    grader = BatchGrader(workers=args.workers)
+    batch_id = grader.submit(args.reference, attempts, args.band_seconds)
+    batch = grader._batches[batch_id]
+    t0 = time.perf_counter()
+    try:
+        for n, fut in enumerate(as_completed(batch.futures), 1):
+            st = grader._attempt_status(batch, batch.futures.index(fut))
+            score = f"{st['overall']:.3f} {st['grade']}" if st["state"] == "done" else st.get("error", st["state"])
+            print(f"[{n}/{len(attempts)} {time.perf_counter() - t0:6.1f}s] {st['name']}: {score}", file=sys.stderr)
+            if args.out:
+                tmp = args.out + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(grader.status(batch_id), f, indent=2)
+                os.replace(tmp, args.out)
+        if not args.out:
+            print(json.dumps(grader.status(batch_id, with_timeline=False), indent=2))
+    finally:
+        grader.shutdown()
+
+
+if __name__ == "__main__":
+    main()
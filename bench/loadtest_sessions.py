@@ -0,0 +1,132 @@
+"""
+Runs N comparison sessions at once in threads of one process and checks
+they do not leak into each other.
+
+Every session gets its own reference routine and its own fake webcam
+(another upload, scaled to 640x480). Each one is first run alone to
+record the expected score, position score, per-joint breakdown and
+rendered frame per step; then all N run together, stepping in lockstep
+so their calls interleave as much as possible, and must reproduce those
+exactly.
+
+    python bench/loadtest_sessions.py --sessions 8 --frames 60
+"""
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import threading
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comparison import ComparisonSession
+from reference_index import load_index
+
+UPLOADS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+
+
+def read_frames(path, n, size=None):
+    vid = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < n:
+        ok, frame = vid.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, size) if size else frame)
+    vid.release()
+    return frames
+
+
+def find_routines(folder):
+    """(video, landmarks) pairs that have both files."""
+    pairs = []
+    for video in sorted(glob.glob(os.path.join(folder, "*.mp4"))):
+        base = os.path.splitext(video)[0]
+        for ext in (".lmk", ".pkl"):
+            if os.path.exists(base + ext):
+                pairs.append((video, base + ext))
+                break
+    return pairs
+
+
+def run_session(reference, ref_frames, cam_frames, barrier=None):
+    trace = []
+    with ComparisonSession(reference) as session:
+        for fv, fc in zip(ref_frames, cam_frames):
+            if barrier is not None:
+                barrier.wait()
+            out = session.step(fv.copy(), fc.copy())
+            breakdown = tuple(sorted((k, round(d["diff"], 6)) for k, d in session.angle_data.items()))
+            trace.append((round(session.avg, 6), round(session.pos_sim, 6), breakdown,
+                          hashlib.md5(out.tobytes()).hexdigest()))
+    return trace
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--frames", type=int, default=60)
+    ap.add_argument("--uploads", default=UPLOADS)
+    args = ap.parse_args()
+
+    routines = find_routines(args.uploads)
+    if len(routines) < 2:
+        sys.exit(f"need at least two video + landmark pairs in {args.uploads}")
+
+    inputs, names = [], []
+    for i in range(args.sessions):
+        video, lm = routines[i % len(routines)]
+        cam_video, _ = routines[(i + 1) % len(routines)]
+        ref_frames = read_frames(video, args.frames)
+        cam_frames = read_frames(cam_video, args.frames, size=(640, 480))
+        n = min(len(ref_frames), len(cam_frames))
+        inputs.append((load_index(lm), ref_frames[:n], cam_frames[:n]))
+        names.append(os.path.basename(video))
+
+    t0 = time.perf_counter()
+    expected = [run_session(*inp) for inp in inputs]
+    solo = time.perf_counter() - t0
+
+    results = [None] * args.sessions
+    errors = []
+    steps = min(len(inp[1]) for inp in inputs)
+    barrier = threading.Barrier(args.sessions)
+
+    def worker(i):
+        ref, fv, fc = inputs[i]
+        try:
+            results[i] = run_session(ref, fv[:steps], fc[:steps], barrier)
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    together = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+
+    bad = 0
+    for i, (want, got) in enumerate(zip(expected, results)):
+        mismatched = [k for k, (a, b) in enumerate(zip(want, got)) if a != b]
+        status = "ok" if not mismatched else f"{len(mismatched)} frames differ (first {mismatched[0]})"
+        bad += bool(mismatched)
+        print(f"session {i}: {names[i]} {len(got)} frames {status}")
+
+    frames = steps * args.sessions
+    print(f"solo {frames / solo:.1f} fps total, {args.sessions} concurrent {frames / together:.1f} fps total")
+    if bad:
+        sys.exit(f"{bad} of {args.sessions} sessions saw cross-talk")
+    print(f"no cross-talk across {args.sessions} sessions")
+
+
+if __name__ == "__main__":
+    main()
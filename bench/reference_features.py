@@ -0,0 +1,82 @@
+"""
+Per webcam frame cost of the reference side of the live comparison.
+
+  rebuild   mirror the raw frame, build a NormalizedLandmarkList, turn it
+            back into tuples, compute angles / scale / visibility (the old
+            per-frame path)
+  lookup    reference_index frame lookup
+  compare_* the whole similarity.compare call with each reference side
+
+Uses a landmark file if given, synthetic landmarks otherwise.
+
+    python bench/reference_features.py [uploads/my_ref.lmk] [--frames 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import similarity
+from comparison import mirrored_landmark_list
+from landmark_store import load_landmarks
+from reference_index import build_index
+
+
+def per_frame(fn, n, repeat=3):
+    """Best of `repeat` passes, microseconds per call."""
+    fn(0)
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for i in range(n):
+            fn(i)
+        best = min(best, time.perf_counter() - t)
+    return best / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("landmarks", nargs="?")
+    ap.add_argument("--frames", type=int, default=2000)
+    args = ap.parse_args()
+
+    if args.landmarks:
+        raw = np.asarray(load_landmarks(args.landmarks).landmarks)
+    else:
+        rng = np.random.default_rng(0)
+        raw = rng.random((args.frames, 33, 4)).astype(np.float32)
+        raw[..., 3] = 0.9
+    raw = raw[~np.isnan(raw[:, 0, 0])]
+    n = min(args.frames, len(raw))
+    cam = similarity.features(np.random.default_rng(1).random((33, 4)) * [1, 1, 1, 0] + [0, 0, 0, 0.9])
+
+    t = time.perf_counter()
+    idx = build_index(raw)
+    build_us = (time.perf_counter() - t) / len(raw) * 1e6
+
+    def rebuild(i):
+        lm = mirrored_landmark_list(raw[i])
+        return similarity.features([(p.x, p.y, p.z, p.visibility) for p in lm.landmark])
+
+    def lookup(i):
+        return idx[i]
+
+    res = {
+        "frames": n,
+        "index_build_us_per_frame": round(build_us, 2),
+        "rebuild_us": round(per_frame(rebuild, n), 2),
+        "lookup_us": round(per_frame(lookup, n), 2),
+        "compare_rebuild_us": round(per_frame(lambda i: similarity.compare(rebuild(i), cam), n), 2),
+        "compare_indexed_us": round(per_frame(lambda i: similarity.compare(idx[i], cam), n), 2),
+    }
+    res["reference_speedup"] = round(res["rebuild_us"] / res["lookup_us"], 1)
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
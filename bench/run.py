@@ -0,0 +1,453 @@
+"""
+Benchmark suite for the hot paths. Needs no camera and no network: every
+input comes from bench/synthetic.py and lands in a temp directory.
+
+    python bench/run.py --out bench-$(git rev-parse --short HEAD).json
+    python bench/run.py --only similarity,encode --quick
+    python bench/run.py --compare old.json new.json
+
+Benchmarks:
+  preprocess   hello.preprocess_and_annotate_video on a synthetic clip, fps.
+               MediaPipe rarely finds a person in the stick figure, so this
+               times the detector-only path; pass --video for a real clip
+  similarity   calculate_similarity calls/s, and similarity.compare on a
+               whole sequence at once, frames/s
+  skeleton     draw_colored_skeleton and the landmark overlay (draw_lines),
+               microseconds per call
+  encode       cv2.imencode of a side by side 1280x480 frame, ms
+  compare_feed /compare_feed through the Flask test client with a fake
+               camera, output fps and capture-to-output latency
+  metrics      cost of one stage timing (two clock reads and observe()),
+               and of rendering /metrics, microseconds
+  proxy        a 720p reference frame as the comparison shows it: decoded,
+               mirrored and scaled per session, against a read from its
+               shared proxy, ms
+  feedback     coach.feedback with the offline stub client: the motion
+               summary of a long routine, and a cache miss and hit, ms
+  roi          pose on a wide shot (a real clip shrunk into a 1080p frame):
+               the whole frame against roi.RoiTracker's crop, ms per frame,
+               and how far apart their landmarks are, px. Uses --video, or
+               advfinal1.mp4 from the repo
+  inference    STREAMS threads running pose on frames of a real clip (as
+               for roi): local graphs in this process against an
+               inference.InferencePool of 1 and of `cpus` workers, total
+               frames/s, and one stream alone, ms per frame;
+               inference_scaling is pool`cpus` over pool1 throughput (None
+               with one core)
+
+Every metric is written with its unit in the name; for *_fps, *_per_s
+higher is better, for *_ms, *_us lower is better. --compare prints the
+change per metric between two result files.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+
+def _best(fn, n, repeat=3):
+    """Best of `repeat` runs of n calls, seconds per call."""
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, time.perf_counter() - t)
+    return best / n
+
+
+def bench_preprocess(tmp, quick, video=None):
+    from hello import preprocess_and_annotate_video
+    from landmark_store import load_landmarks
+
+    src = video or os.path.join(tmp, "pre.avi")
+    if not video:
+        synthetic.video(src, 60 if quick else 300)
+    lm_path = os.path.join(tmp, "pre.lmk")
+    # first call pays for imports and the graph, as in a warm worker it would not
+    preprocess_and_annotate_video(src, os.path.join(tmp, "warm.mp4"), os.path.join(tmp, "warm.lmk"), workers=1)
+    t = time.perf_counter()
+    preprocess_and_annotate_video(src, os.path.join(tmp, "pre_out.mp4"), lm_path, workers=1)
+    dt = time.perf_counter() - t
+    lm = load_landmarks(lm_path)
+    n = len(lm)
+    return {"preprocess_fps": n / dt, "preprocess_frames": n,
+            "preprocess_detected_frac": float(lm.present.mean()) if len(lm) else 0.0}
+
+
+def bench_similarity(tmp, quick, video=None):
+    import similarity
+    from hello import calculate_similarity
+
+    n = 500 if quick else 5000
+    ref = synthetic.landmarks(n, seed=1)
+    cam = synthetic.landmarks(n, seed=2)
+    pairs = [(list(map(tuple, ref[i])), list(map(tuple, cam[i]))) for i in range(n)]
+
+    t = time.perf_counter()
+    for a, b in pairs:
+        calculate_similarity(a, b)
+    per_call = (time.perf_counter() - t) / n
+
+    seq = _best(lambda: similarity.compare(ref, cam), 1)
+    return {"similarity_calls_per_s": 1 / per_call, "similarity_batch_frames_per_s": n / seq}
+
+
+def bench_skeleton(tmp, quick, video=None):
+    from hello import draw_colored_skeleton, draw_lines
+    import similarity
+
+    lm = synthetic.landmarks(2, seed=3)
+    angle_data = similarity.compare(lm[0], lm[1]).angle_data()
+    frame = np.zeros((480, 640, 3), np.uint8)
+    n = 200 if quick else 2000
+    per = _best(lambda: draw_colored_skeleton(frame, lm[0], 0.7, angle_data), n)
+    # the preprocessing / /video_feed overlay, from the landmark list pose returns
+    from comparison import mirrored_landmark_list
+    lmlist = mirrored_landmark_list(lm[1])
+    lines = _best(lambda: draw_lines(frame, lmlist), n)
+    return {"skeleton_us": per * 1e6, "landmarks_us": lines * 1e6}
+
+
+def bench_encode(tmp, quick, video=None):
+    import cv2
+
+    lm = synthetic.landmarks(1)[0]
+    frame = np.hstack([synthetic.draw(np.full((480, 640, 3), 60, np.uint8), lm)] * 2)
+    n = 50 if quick else 300
+    per = _best(lambda: cv2.imencode(".jpg", frame), n)
+    return {"encode_ms": per * 1e3, "encode_jpeg_kb": len(cv2.imencode(".jpg", frame)[1]) / 1024}
+
+
+def bench_compare_feed(tmp, quick, video=None):
+    import camera
+    from landmark_store import save_landmarks
+    from reference_index import save_index
+
+    # high nominal fps so neither the fake camera nor the reference pacing
+    # is the limit; what comes out is what the pipeline can sustain
+    n = 90 if quick else 300
+    ref_video = os.path.join(tmp, "ref.avi")
+    ref_lm = synthetic.video(ref_video, n, fps=240)
+    lm_path = os.path.join(tmp, "ref.lmk")
+    save_landmarks(lm_path, ref_lm, 240, 640, 480)
+    save_index(lm_path)
+    cam_video = os.path.join(tmp, "cam.avi")
+    synthetic.video(cam_video, n, fps=240, seed=5)
+
+    # importing app starts the asset catalog: keep its database and the
+    # feedback cache in tmp, and never let it evict the real uploads
+    os.environ.update(DANCE_POSE_WARMUP="0", DANCE_DISK_QUOTA_MB="0",
+                      DANCE_CATALOG=os.path.join(tmp, "catalog.sqlite3"),
+                      DANCE_FEEDBACK_CACHE=os.path.join(tmp, "feedback"))
+    import app as web
+    if web.assets.quota:
+        sys.exit("catalog was imported with a disk quota before the benchmark set none")
+    web.assets.stop()
+    web.UPLOAD_FOLDER = tmp
+    camera.CAMERA_SOURCE = cam_video
+
+    client = web.app.test_client()
+    resp = client.get("/compare_feed?video=ref.avi&landmarks=ref.lmk&session=bench")
+    frames, skip = 0, 10
+    t0 = time.perf_counter()
+    for _ in resp.response:
+        frames += 1
+        if frames == skip:
+            # graphs are warm by now, time the steady part
+            t0 = time.perf_counter()
+        if frames >= n - skip:
+            break
+    dt = time.perf_counter() - t0
+    status = client.get("/sessions/bench").get_json()
+    resp.close()
+    lat = status.get("latency_ms", {})
+    return {"compare_feed_fps": max(frames - skip, 0) / dt,
+            "compare_feed_latency_p50_ms": lat.get("p50"),
+            "compare_feed_latency_p95_ms": lat.get("p95"),
+            "compare_feed_dropped": sum(status.get("dropped", {}).values())}
+
+
+def bench_metrics(tmp, quick, video=None):
+    import metrics
+
+    reg = metrics.Registry()
+    t = reg.timer("bench", "stage")
+    clock = time.perf_counter
+
+    def timed():
+        t0 = clock()
+        t.observe(clock() - t0)
+
+    n = 20000 if quick else 200000
+    per = _best(timed, n)
+    for p in ("a", "b", "c"):
+        for s in ("decode", "pose", "draw", "encode"):
+            reg.timer(p, s).observe(0.01)
+    render = _best(reg.render, 20 if quick else 200)
+    return {"metrics_observe_us": per * 1e6, "metrics_render_us": render * 1e6}
+
+
+def bench_proxy(tmp, quick, video=None):
+    import cv2
+    import proxy
+
+    src = video or os.path.join(tmp, "proxy.avi")
+    if not video:
+        synthetic.video(src, 60 if quick else 300, size=(1280, 720))
+    path = proxy.build(src, os.path.join(tmp, "ref.proxy"))
+    px = proxy.cache.get(path)
+
+    vid = cv2.VideoCapture(src)
+    t = time.perf_counter()
+    n = 0
+    while True:
+        ok, frame = vid.read()
+        if not ok:
+            break
+        proxy.proxy_frame(frame).copy()
+        n += 1
+    decode = (time.perf_counter() - t) / n
+    vid.release()
+
+    # the copy is what render() draws on
+    read = _best(lambda: [px[i].copy() for i in range(len(px))], 1) / len(px)
+    return {"proxy_decode_ms": decode * 1e3, "proxy_read_ms": read * 1e3,
+            "proxy_mb_per_frame": px.nbytes / len(px) / 1e6}
+
+
+def bench_feedback(tmp, quick, video=None):
+    import coach
+    import motion_summary
+    from landmark_store import save_landmarks, load_landmarks
+
+    n = 3000 if quick else 30000
+    lm_path = os.path.join(tmp, "routine.lmk")
+    save_landmarks(lm_path, synthetic.landmarks(n), 30.0, 640, 480)
+    lm = load_landmarks(lm_path)
+    client = coach.StubClient(delay=0)
+
+    summary = _best(lambda: motion_summary.summarize(lm), 1)
+    size = len(coach.build_prompt(motion_summary.summarize(lm)))
+
+    def miss():
+        coach.feedback(lm, client, coach.ResponseCache(os.path.join(tmp, f"fb{client.calls}")))
+
+    cache = coach.ResponseCache(os.path.join(tmp, "fb"))
+    coach.feedback(lm, client, cache)
+    hit = _best(lambda: coach.feedback(lm, client, cache), 5)
+    return {"feedback_summary_ms": summary * 1e3, "feedback_miss_ms": _best(miss, 1) * 1e3,
+            "feedback_hit_ms": hit * 1e3, "feedback_frames": n, "feedback_prompt_bytes": size}
+
+
+def bench_roi(tmp, quick, video=None):
+    import cv2
+    import mediapipe as mp
+    import roi
+    from hello import POSE_SETTINGS
+
+    vid = cv2.VideoCapture(video or os.path.join(ROOT, "advfinal1.mp4"))
+    frames = []
+    while len(frames) < (60 if quick else 300):
+        ok, frame = vid.read()
+        if not ok:
+            break
+        # the clip at half the height of a 1080p frame, in its bottom right
+        small = cv2.resize(frame, (round(frame.shape[1] * 540 / frame.shape[0]), 540))[:, :960]
+        wide = np.zeros((1080, 1920, 3), np.uint8)
+        wide[540:, 1920 - small.shape[1]:] = small
+        frames.append(wide)
+    vid.release()
+
+    def run(track):
+        pose = mp.solutions.pose.Pose(**POSE_SETTINGS)
+        tracker = roi.RoiTracker(pose)
+        pose.process(np.zeros((256, 256, 3), np.uint8))
+        out = []
+        t = time.perf_counter()
+        for f in frames:
+            lm = tracker.process(f) if track else \
+                pose.process(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)).pose_landmarks
+            out.append(lm and np.array([(p.x * 1920, p.y * 1080, p.visibility) for p in lm.landmark]))
+        dt = (time.perf_counter() - t) / len(frames)
+        pose.close()
+        return dt, out
+
+    full, ref = run(False)
+    crop, got = run(True)
+    both = [(a, b) for a, b in zip(ref, got) if a is not None and b is not None]
+    err = [np.linalg.norm(a[:, :2] - b[:, :2], axis=1)[(a[:, 2] > 0.5) & (b[:, 2] > 0.5)].mean()
+           for a, b in both]
+    return {"roi_full_pose_ms": full * 1e3, "roi_crop_pose_ms": crop * 1e3,
+            "roi_found_full": sum(a is not None for a in ref) / len(frames),
+            "roi_found_crop": sum(b is not None for b in got) / len(frames),
+            "roi_landmark_diff_px": float(np.mean(err)) if err else None}
+
+
+def _clip(video, n):
+    import cv2
+    vid = cv2.VideoCapture(video or os.path.join(ROOT, "advfinal1.mp4"))
+    frames = []
+    while len(frames) < n:
+        ok, frame = vid.read()
+        if not ok:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    vid.release()
+    return frames
+
+
+def bench_inference(tmp, quick, video=None, streams=4):
+    from concurrent.futures import ThreadPoolExecutor
+    import inference
+    import pose_pool
+    from camera import CAMERA_POSE_SETTINGS as settings
+
+    frames = _clip(video, 30 if quick else 120)
+
+    def run(open_pose):
+        poses = [open_pose() for _ in range(streams)]
+        for p in poses:
+            p.process(frames[0])
+        t = time.perf_counter()
+        with ThreadPoolExecutor(streams) as ex:
+            list(ex.map(lambda p: [p.process(f) for f in frames], poses))
+        fps = streams * len(frames) / (time.perf_counter() - t)
+        for p in poses:
+            pose_pool.checkin(p)
+        return fps
+
+    def one(pose):
+        pose.process(frames[0])
+        t = time.perf_counter()
+        for f in frames:
+            pose.process(f)
+        return (time.perf_counter() - t) / len(frames) * 1e3
+
+    out = {"inference_local_fps": run(lambda: pose_pool.checkout(**settings))}
+    with pose_pool.pose(**settings) as pose:
+        out["inference_local_stream_ms"] = one(pose)
+    for n in sorted({1, os.cpu_count() or 1}):
+        pool = inference.InferencePool(workers=n, warm=[settings]).start()
+        try:
+            out[f"inference_pool{n}_fps"] = run(lambda: pool.open(**settings))
+            p = pool.open(**settings)
+            out[f"inference_pool{n}_stream_ms"] = one(p)
+            p.close()
+        finally:
+            pool.close()
+    out["inference_streams"] = streams
+    out["inference_cpus"] = os.cpu_count()
+    # what the pool is for; None on a one-core box, where there is nothing to scale to
+    n = os.cpu_count() or 1
+    out["inference_scaling"] = out[f"inference_pool{n}_fps"] / out["inference_pool1_fps"] if n > 1 else None
+    return out
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "similarity": bench_similarity,
+    "skeleton": bench_skeleton,
+    "encode": bench_encode,
+    "compare_feed": bench_compare_feed,
+    "metrics": bench_metrics,
+    "proxy": bench_proxy,
+    "feedback": bench_feedback,
+    "roi": bench_roi,
+    "inference": bench_inference,
+}
+
+
+def _meta():
+    import cv2
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit or None, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__, "cv2": cv2.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+_HIGHER = ("_fps", "_per_s")
+_LOWER = ("_ms", "_us", "_dropped")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old["meta"].get("quick") != new["meta"].get("quick"):
+        print("note: one of the runs used --quick, inputs differ", file=sys.stderr)
+    old, new = old["results"], new["results"]
+    for k in sorted(set(old) & set(new)):
+        a, b = old[k], new[k]
+        # sizes and counts describe the run, they are not scores
+        if not k.endswith(_HIGHER + _LOWER) or not isinstance(a, (int, float)) \
+                or not isinstance(b, (int, float)) or not a:
+            continue
+        change = (b - a) / a * 100
+        lower_better = k.endswith(_LOWER)
+        better = change < 0 if lower_better else change > 0
+        flag = "" if abs(change) < 5 else ("  better" if better else "  WORSE")
+        print(f"{k:36s} {a:12.3f} -> {b:12.3f}  {change:+7.1f}%{flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--only", help="comma separated subset of: " + ",".join(BENCHMARKS))
+    ap.add_argument("--quick", action="store_true", help="smaller inputs, for a smoke run")
+    ap.add_argument("--video", help="real clip for the preprocess benchmark")
+    ap.add_argument("--out", help="write results JSON here (default: stdout only)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="dance-bench-")
+    try:
+        for name in names:
+            t = time.perf_counter()
+            # a folder each: file names like ref.avi / ref.proxy must not meet
+            work = os.path.join(tmp, name)
+            os.makedirs(work)
+            res = BENCHMARKS[name](work, args.quick, video=args.video)
+            results.update({k: round(v, 3) if isinstance(v, float) else v for k, v in res.items()})
+            print(f"{name}: done in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    doc = {"meta": {**_meta(), "quick": args.quick, "video": args.video}, "results": results}
+    text = json.dumps(doc, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold start numbers, each measured in a fresh interpreter:
+
+  import_app     time to `import app` (the web process start-up cost)
+  cold_first     new Pose + first process() on a real frame, nothing loaded
+  warm_first     checkout + first frame from a pose_pool that warm() filled
+  *_steady       median per-frame time once running
+
+    python bench/startup.py [--video uploads/my_ref.mp4] [--repeat 3]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_APP = """
+import time, json
+t = time.perf_counter()
+import app
+print(json.dumps({"import_app": time.perf_counter() - t}))
+"""
+
+_FIRST_FRAME = """
+import sys, time, json
+import cv2
+vid = cv2.VideoCapture(sys.argv[1])
+frames = [cv2.cvtColor(vid.read()[1], cv2.COLOR_BGR2RGB) for _ in range(30)]
+settings = dict(model_complexity=0, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+out = {}
+if sys.argv[2] == "cold":
+    t = time.perf_counter()
+    import mediapipe as mp
+    pose = mp.solutions.pose.Pose(**settings)
+    pose.process(frames[0])
+    out["cold_first"] = time.perf_counter() - t
+    mode = "cold"
+else:
+    import pose_pool
+    pose_pool.warm(settings)
+    t = time.perf_counter()
+    pose = pose_pool.checkout(**settings)
+    pose.process(frames[0])
+    out["warm_first"] = time.perf_counter() - t
+    mode = "warm"
+times = []
+for f in frames[1:]:
+    t = time.perf_counter()
+    pose.process(f)
+    times.append(time.perf_counter() - t)
+out[mode + "_steady"] = sorted(times)[len(times) // 2]
+print(json.dumps(out))
+"""
+
+
+def run(code, *args):
+    env = dict(os.environ, DANCE_POSE_WARMUP="0", GLOG_minloglevel="2")
+    res = subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video", default=os.path.join(ROOT, "uploads", "my_ref.mp4"))
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    samples = {}
+    for _ in range(args.repeat):
+        for res in (run(_IMPORT_APP), run(_FIRST_FRAME, args.video, "cold"),
+                    run(_FIRST_FRAME, args.video, "warm")):
+            for k, v in res.items():
+                samples.setdefault(k, []).append(v)
+
+    # best of N, in milliseconds
+    print(json.dumps({k: round(min(v) * 1e3, 1) for k, v in samples.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Speed / accuracy of the strided and downscaled preprocessing modes
+(DANCE_PREPROCESS_STRIDE, DANCE_INFER_HEIGHT) against the full pass.
+
+    python bench/stride_accuracy.py uploads/<clip>.mp4 [more clips]
+    python bench/stride_accuracy.py clip.mp4 --strides 1,2,4 --heights 0,480 --out acc.json
+
+Each clip is preprocessed once per (stride, height) with a single worker.
+Against stride 1 at native height, per mode:
+
+  fps          frames written per second, and speedup over the full pass
+  pose_x       speedup of the decode + pose stages alone (from metrics);
+               without ffmpeg the VP8 writer can dominate the wall time
+  present      frames where both passes agree on whether there is a pose
+  err_pct      mean distance of visible landmarks, in % of shoulder width,
+               for inferred and for interpolated frames, and its p95
+  angle_deg    mean error of the scored joint angles (similarity.JOINTS)
+
+Synthetic clips are no use here, MediaPipe rarely sees a person in them.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics
+import similarity
+from hello import preprocess_and_annotate_video
+from landmark_store import load_landmarks
+
+
+def run(clip, tmp, stride, height):
+    lm_path = os.path.join(tmp, f"s{stride}h{height}.lmk")
+    metrics.reset()
+    t = time.perf_counter()
+    preprocess_and_annotate_video(clip, os.path.join(tmp, f"s{stride}h{height}.mp4"), lm_path,
+                                  workers=1, stride=stride, infer_height=height)
+    dt = time.perf_counter() - t
+    pose_s = metrics.timer("preprocess", "decode").sum + metrics.timer("preprocess", "pose").sum
+    lm = load_landmarks(lm_path)
+    return np.array(lm.landmarks, np.float64), np.array(lm.interpolated), len(lm) / dt, pose_s
+
+
+def accuracy(full, fast, interpolated):
+    both = ~np.isnan(full[:, 0, 0]) & ~np.isnan(fast[:, 0, 0])
+    out = {"present_agree": float(np.mean(np.isnan(full[:, 0, 0]) == np.isnan(fast[:, 0, 0])))}
+
+    scale = similarity.body_scale(full)
+    dist = np.linalg.norm(full[..., :2] - fast[..., :2], axis=-1) / scale[:, None] * 100
+    vis = (full[..., 3] > similarity.VIS_THRESH) & both[:, None]
+    for name, sel in (("inferred", ~interpolated), ("interpolated", interpolated)):
+        d = dist[vis & sel[:, None]]
+        out[f"err_pct_{name}"] = float(d.mean()) if d.size else None
+    d = dist[vis]
+    out["err_pct_p95"] = float(np.percentile(d, 95)) if d.size else None
+
+    fa, fb = similarity.features(full), similarity.features(fast)
+    ok = fa.joint_ok & fb.joint_ok
+    out["angle_deg"] = float(np.abs(fa.angles - fb.angles)[ok].mean()) if ok.any() else None
+    return out
+
+
+def _fmt(v, spec):
+    return "-" if v is None else format(v, spec)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("clips", nargs="+")
+    ap.add_argument("--strides", default="1,2,3,4")
+    ap.add_argument("--heights", default="0,720,480,360", help="0 = native")
+    ap.add_argument("--out", help="write results JSON here")
+    args = ap.parse_args()
+    strides = [int(s) for s in args.strides.split(",")]
+    heights = [int(h) for h in args.heights.split(",")]
+
+    results = []
+    for clip in args.clips:
+        tmp = tempfile.mkdtemp(prefix="dance-stride-")
+        try:
+            # first run pays for the imports and the graph
+            run(clip, tmp, 1, 0)
+            full, _, full_fps, full_pose = run(clip, tmp, 1, 0)
+            print(f"\n{os.path.basename(clip)}: {len(full)} frames, full pass {full_fps:.1f} fps")
+            print(f"{'stride':>6} {'height':>6} {'fps':>7} {'speedup':>7} {'pose_x':>6} {'present':>7} "
+                  f"{'err%inf':>7} {'err%int':>7} {'err%p95':>7} {'angle':>6}")
+            for stride in strides:
+                for height in heights:
+                    if stride == 1 and height == 0:
+                        lm, interp, fps, pose_s = full, np.zeros(len(full), bool), full_fps, full_pose
+                    else:
+                        lm, interp, fps, pose_s = run(clip, tmp, stride, height)
+                    acc = accuracy(full, lm, interp)
+                    row = {"clip": clip, "stride": stride, "height": height, "fps": fps,
+                           "speedup": fps / full_fps, "pose_speedup": full_pose / pose_s, **acc}
+                    results.append(row)
+                    print(f"{stride:>6} {height or 'native':>6} {fps:7.1f} {fps / full_fps:7.2f} {full_pose / pose_s:6.2f} "
+                          f"{acc['present_agree']:7.3f} {_fmt(acc['err_pct_inferred'], '7.2f')} "
+                          f"{_fmt(acc['err_pct_interpolated'], '7.2f')} {_fmt(acc['err_pct_p95'], '7.2f')} "
+                          f"{_fmt(acc['angle_deg'], '6.2f')}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
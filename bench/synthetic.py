@@ -0,0 +1,76 @@
+"""
+Synthetic inputs for the benchmarks: no camera, no network, no uploads.
+
+landmarks(T) is a stick figure swinging its arms and bobbing, as a
+(T, 33, 4) float32 array in MediaPipe's normalised coordinates with
+every landmark visible. video(path, T) renders the same figure into a
+video file with cv2, as a person-shaped but plainly synthetic clip.
+"""
+import cv2
+import numpy as np
+
+# rough standing pose, (x, y) per MediaPipe landmark index
+_BASE = np.array([
+    (0.50, 0.15),                                                   # 0 nose
+    (0.49, 0.13), (0.48, 0.13), (0.47, 0.13),                       # 1-3 left eye
+    (0.51, 0.13), (0.52, 0.13), (0.53, 0.13),                       # 4-6 right eye
+    (0.46, 0.14), (0.54, 0.14),                                     # 7-8 ears
+    (0.49, 0.17), (0.51, 0.17),                                     # 9-10 mouth
+    (0.42, 0.25), (0.58, 0.25),                                     # 11-12 shoulders
+    (0.38, 0.37), (0.62, 0.37),                                     # 13-14 elbows
+    (0.36, 0.48), (0.64, 0.48),                                     # 15-16 wrists
+    (0.35, 0.50), (0.65, 0.50), (0.35, 0.51), (0.65, 0.51),         # 17-20 hands
+    (0.36, 0.50), (0.64, 0.50),                                     # 21-22 thumbs
+    (0.45, 0.52), (0.55, 0.52),                                     # 23-24 hips
+    (0.45, 0.70), (0.55, 0.70),                                     # 25-26 knees
+    (0.45, 0.87), (0.55, 0.87),                                     # 27-28 ankles
+    (0.44, 0.89), (0.56, 0.89), (0.46, 0.90), (0.54, 0.90),         # 29-32 feet
+], dtype=np.float32)
+
+_ARMS = {11: (13, 15, 17, 19, 21), 12: (14, 16, 18, 20, 22)}
+_BONES = [(11, 12), (11, 13), (13, 15), (12, 14), (14, 16), (11, 23), (12, 24),
+          (23, 24), (23, 25), (25, 27), (24, 26), (26, 28)]
+
+
+def landmarks(n_frames, fps=30.0, seed=0):
+    """(n_frames, 33, 4) float32: x, y, z, visibility."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_frames, dtype=np.float32) / fps
+    pts = np.repeat(_BASE[None], n_frames, axis=0)
+
+    # arms swing around the shoulders in opposite phase
+    for side, (shoulder, joints) in enumerate(_ARMS.items()):
+        angle = 0.9 * np.sin(2 * np.pi * 0.5 * t + side * np.pi)
+        c, s = np.cos(angle)[:, None], np.sin(angle)[:, None]
+        rel = pts[:, joints] - pts[:, shoulder:shoulder + 1]
+        pts[:, joints, 0] = pts[:, shoulder:shoulder + 1, 0] + c * rel[..., 0] - s * rel[..., 1]
+        pts[:, joints, 1] = pts[:, shoulder:shoulder + 1, 1] + s * rel[..., 0] + c * rel[..., 1]
+
+    pts[..., 1] += 0.02 * np.sin(2 * np.pi * t)[:, None]
+    pts += rng.normal(0, 0.002, pts.shape).astype(np.float32)
+
+    out = np.empty((n_frames, 33, 4), np.float32)
+    out[..., :2] = pts
+    out[..., 2] = rng.normal(0, 0.05, (n_frames, 33))
+    out[..., 3] = 0.95
+    return out
+
+
+def draw(frame, lm):
+    h, w = frame.shape[:2]
+    px = (lm[:, :2] * (w, h)).astype(int)
+    for a, b in _BONES:
+        cv2.line(frame, tuple(px[a]), tuple(px[b]), (220, 200, 180), max(2, w // 40))
+    cv2.circle(frame, tuple(px[0]), max(4, w // 25), (200, 190, 170), -1)
+    return frame
+
+
+def video(path, n_frames, size=(640, 480), fps=30.0, seed=0):
+    """Writes the figure to path (MJPG, so any .avi works). Returns its landmarks."""
+    lms = landmarks(n_frames, fps, seed)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    bg = np.full((size[1], size[0], 3), 60, np.uint8)
+    for lm in lms:
+        out.write(draw(bg.copy(), lm))
+    out.release()
+    return lms
@@ -0,0 +1,241 @@
+"""
+One capture + pose thread per camera, shared by every stream that shows it.
+
+    sub = camera.subscribe()          # opens the device on first use
+    frame = sub.get()                 # newest CameraFrame, waits if needed
+    sub.close()                       # last one out closes the device
+
+/video_feed and /compare_feed used to open cv2.VideoCapture(0) and run
+their own Pose per request, so a second tab either could not get the
+camera or doubled the CPU. A CameraBroadcaster reads the device once,
+runs pose once per frame and puts the result in every subscriber's
+LatestSlot; a slow subscriber just skips frames.
+
+DANCE_CAMERA picks the device: a number for a real camera, or a path to a
+video file, which is played in a loop at its own fps as a fake camera.
+With DANCE_POSE_ROI=1 pose runs on a crop around the dancer (roi.py).
+"""
+import os
+import time
+import threading
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+import metrics
+import pose_pool
+import roi
+from handoff import LatestSlot
+
+CAMERA_SOURCE = os.getenv("DANCE_CAMERA", "0")
+# shared by every stream, so it favours speed like the live comparison did
+CAMERA_POSE_SETTINGS = dict(model_complexity=0, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+_t_read = metrics.timer("camera", "read")
+_t_pose = metrics.timer("camera", "pose")
+
+
+class CameraFrame(NamedTuple):
+    seq: int
+    captured_at: float      # time.perf_counter() when the frame was read
+    image: np.ndarray       # BGR, as the camera delivers it; read-only, copy before drawing
+    landmarks: Optional[object]   # NormalizedLandmarkList, or (33, 4) array from an inference worker
+
+
+class FileCamera:
+    """cv2.VideoCapture look-alike that loops a video file in real time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._vid = cv2.VideoCapture(path)
+        self._period = 1.0 / (self._vid.get(cv2.CAP_PROP_FPS) or 30)
+        self._next = time.perf_counter()
+
+    def isOpened(self):
+        return self._vid.isOpened()
+
+    def read(self):
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self._period, time.perf_counter() - self._period)
+        ok, frame = self._vid.read()
+        if not ok:
+            self._vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._vid.read()
+        return ok, frame
+
+    def release(self):
+        self._vid.release()
+
+
+def open_camera(source):
+    """A device number (int or digit string) or a video file path."""
+    if isinstance(source, int) or str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    return FileCamera(source)
+
+
+class Subscription:
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.slot = LatestSlot("camera")
+        self._closed = False
+
+    def get(self, timeout=None):
+        """Next CameraFrame; raises handoff.Closed when the camera stops."""
+        return self.slot.get(timeout)
+
+    @property
+    def dropped(self):
+        return self.slot.dropped
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            _release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CameraBroadcaster:
+    """Reads one camera on a thread and fans every frame out to subscribers."""
+
+    def __init__(self, source, pose_settings=None, track_roi=None):
+        self.source = source
+        self.pose_settings = pose_settings or CAMERA_POSE_SETTINGS
+        self.track_roi = roi.ENABLED if track_roi is None else track_roi
+        self.frames = 0
+        self._subs = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._cap = None
+
+    def start(self):
+        self._cap = open_camera(self.source)
+        if not self._cap.isOpened():
+            self._cap.release()
+            raise RuntimeError("Could not start camera.")
+        self._thread = threading.Thread(target=self._run, name=f"camera-{self.source}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        pose = pose_pool.checkout(**self.pose_settings)
+        tracker = roi.RoiTracker(pose) if self.track_roi else None
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                ok, image = self._cap.read()
+                if not ok:
+                    break
+                t = time.perf_counter()
+                if tracker:
+                    lm = tracker.process(image)
+                else:
+                    lm = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).pose_landmarks
+                _t_read.observe(t - t0)
+                _t_pose.observe(time.perf_counter() - t)
+                image.flags.writeable = False
+                frame = CameraFrame(self.frames, t, image, lm)
+                self.frames += 1
+                with self._lock:
+                    subs = list(self._subs)
+                for sub in subs:
+                    sub.slot.put(frame)
+        finally:
+            pose_pool.checkin(pose)
+            self._cap.release()
+            with self._lock:
+                subs, self._subs = self._subs, []
+            for sub in subs:
+                sub.slot.close()
+
+    def subscribe(self):
+        sub = Subscription(self)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        """Drops a subscriber, returns how many are left."""
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+            left = len(self._subs)
+        sub.slot.close()
+        return left
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return len(self._subs)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+_broadcasters = {}
+# broadcasters of the last subscriber gone, still releasing their device
+_stopping = {}
+_registry_lock = threading.Lock()
+
+
+def subscribe(source=None):
+    """
+    Subscribes to a camera, starting its broadcaster if nobody is using it
+    yet. Close the subscription when done; the device is released once the
+    last subscriber has gone.
+    """
+    source = CAMERA_SOURCE if source is None else source
+    while True:
+        with _registry_lock:
+            old = _stopping.get(source)
+            if old is None:
+                b = _broadcasters.get(source)
+                if b is None or not b.running:
+                    b = CameraBroadcaster(source)
+                    b.start()
+                    _broadcasters[source] = b
+                return b.subscribe()
+        # the device is not free before the old broadcaster has let go of it
+        old.stop()
+        with _registry_lock:
+            if _stopping.get(source) is old:
+                del _stopping[source]
+
+
+def _release(sub):
+    b = sub.broadcaster
+    with _registry_lock:
+        # out of the registry under its lock, so a concurrent subscribe()
+        # does not join a broadcaster that is shutting down, and waits for
+        # it before opening the device again (see subscribe)
+        if b.unsubscribe(sub) != 0:
+            return
+        if _broadcasters.get(b.source) is b:
+            del _broadcasters[b.source]
+            _stopping[b.source] = b
+    # joining the thread takes a while (pose checkin, a last read): not
+    # with every other camera's subscribe and release waiting on the lock
+    b.stop()
+    with _registry_lock:
+        if _stopping.get(b.source) is b:
+            del _stopping[b.source]
+
+
+def active():
+    """{source: subscriber count} for cameras currently open."""
+    with _registry_lock:
+        return {src: b.subscribers for src, b in _broadcasters.items() if b.running}
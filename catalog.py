@@ -0,0 +1,283 @@
+"""
+SQLite catalog of what is on disk in uploads/ and static/processed/, and
+eviction under a disk quota.
+
+Every upload is an asset, keyed by the id its files are named after
+(upload_cache.cache_key, or the uuid of older uploads). Its files:
+
+    raw        <id>.mp4 (any video)       the upload itself
+    landmarks  <id>.lmk / <id>.pkl
+    index      <id>.ref                   reference_index, rebuilt on load
+    annotated  <id>_annotated.webm
+    parts      <id>_annotated.parts/      progressive segments
+    proxy      <id>.proxy                 proxy.py, mirrored 480p reference frames
+
+with their sizes, and per asset fps, frame count, size, original name,
+kind (upload / attempt), when it was last used and last used as a
+reference. Lookups by file name go through an index. scan() brings the
+tables in line with the folders (files written by worker processes, or
+before the catalog existed) and runs in the background with eviction.
+
+Eviction (DANCE_DISK_QUOTA_MB, 0 = never) deletes files of cold assets,
+least recently used first, until they are under EVICT_TO of the quota:
+raw uploads and segments first, then annotated videos, proxies and
+indexes, the landmarks last, taking the rest of the asset with them. An
+asset is hot, and kept whole, while it was used as a reference in the last
+HOT_SECONDS, was used at all in the last MIN_AGE seconds, is pinned, or
+is in use (a queued or running job).
+"""
+import os
+import re
+import time
+import shutil
+import sqlite3
+import threading
+
+QUOTA_MB = float(os.getenv("DANCE_DISK_QUOTA_MB", 0))
+EVICT_TO = 0.9
+HOT_SECONDS = float(os.getenv("DANCE_HOT_SECONDS", 7 * 86400))
+MIN_AGE = float(os.getenv("DANCE_EVICT_MIN_AGE", 3600))
+INTERVAL = float(os.getenv("DANCE_EVICT_INTERVAL", 60))
+
+# which file of an asset goes first
+RANK = {"raw": 0, "parts": 0, "annotated": 1, "proxy": 1, "index": 2, "landmarks": 3}
+
+_NAME = re.compile(r"^(?P<id>[^._][^.]*?)(?P<suffix>_annotated\.parts|_annotated\.\w+|\.ref|\.proxy|\.lmk|\.pkl|\.\w+)$")
+_VIDEO = {".mp4", ".mov", ".webm", ".avi", ".mkv", ".m4v"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL DEFAULT 'upload',
+    original_name TEXT,
+    fps REAL,
+    frames INTEGER,
+    width INTEGER,
+    height INTEGER,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    last_reference REAL,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    asset_id TEXT NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_asset ON files(asset_id);
+CREATE INDEX IF NOT EXISTS assets_lru ON assets(last_access);
+"""
+
+
+def parse(name):
+    """(asset id, role) for a file name in uploads/ or processed/, or None."""
+    m = _NAME.match(name)
+    if m is None:
+        return None
+    suffix = m["suffix"]
+    if suffix == "_annotated.parts":
+        return m["id"], "parts"
+    if suffix.startswith("_annotated."):
+        return m["id"], "annotated"
+    if suffix == ".ref":
+        return m["id"], "index"
+    if suffix == ".proxy":
+        return m["id"], "proxy"
+    if suffix in (".lmk", ".pkl"):
+        return m["id"], "landmarks"
+    if suffix.lower() in _VIDEO:
+        return m["id"], "raw"
+    return None
+
+
+def _size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+
+class Catalog:
+
+    def __init__(self, db_path, folders, quota_mb=QUOTA_MB, in_use=None):
+        """
+        folders: the directories assets live in. in_use: optional callable
+        returning paths of files in use, their assets are not evicted.
+        """
+        self.db_path = db_path
+        self.folders = folders
+        self.quota = int(quota_mb * 1024 * 1024)
+        self.in_use = in_use or (lambda: ())
+        self.evicted = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _q(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    # ---- recording ----
+
+    def add(self, path, kind=None, original_name=None, **meta):
+        """Records the file at path (and its asset). meta: fps, frames, width, height."""
+        name = os.path.basename(path)
+        parsed = parse(name)
+        if parsed is None or not os.path.exists(path):
+            return None
+        asset_id, role = parsed
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO assets (id, created, last_access) VALUES (?, ?, ?)",
+                             (asset_id, now, now))
+            if kind or original_name:
+                self._db.execute("UPDATE assets SET kind = coalesce(?, kind), "
+                                 "original_name = coalesce(?, original_name) WHERE id = ?",
+                                 (kind, original_name, asset_id))
+            if meta:
+                cols = ", ".join(f"{k} = ?" for k in meta)
+                self._db.execute(f"UPDATE assets SET {cols} WHERE id = ?", (*meta.values(), asset_id))
+            self._db.execute("INSERT OR REPLACE INTO files (name, path, asset_id, role, bytes) "
+                             "VALUES (?, ?, ?, ?, ?)", (name, path, asset_id, role, _size(path)))
+        self._wake.set()
+        return asset_id
+
+    def add_landmarks(self, path, **kw):
+        """add() for a landmark file, with fps, frames and size from its header."""
+        from landmark_store import load_landmarks
+        lm = load_landmarks(path)
+        return self.add(path, fps=lm.fps, frames=len(lm), width=lm.width, height=lm.height, **kw)
+
+    def touch(self, name, reference=False):
+        """Marks the asset a file name belongs to as used (as a reference)."""
+        parsed = parse(os.path.basename(name))
+        if parsed is None:
+            return
+        now = time.time()
+        if reference:
+            self._q("UPDATE assets SET last_access = ?, last_reference = ? WHERE id = ?",
+                    (now, now, parsed[0]))
+        else:
+            self._q("UPDATE assets SET last_access = ? WHERE id = ?", (now, parsed[0]))
+
+    def pin(self, asset_id, pinned=True):
+        self._q("UPDATE assets SET pinned = ? WHERE id = ?", (int(pinned), asset_id))
+
+    # ---- lookups ----
+
+    def find(self, name):
+        """The recorded path of a file name, or None."""
+        rows = self._q("SELECT path FROM files WHERE name = ?", (os.path.basename(name),))
+        return rows[0]["path"] if rows else None
+
+    def asset(self, asset_id):
+        rows = self._q("SELECT * FROM assets WHERE id = ?", (asset_id,))
+        if not rows:
+            return None
+        out = dict(rows[0])
+        out["pinned"] = bool(out["pinned"])
+        out["files"] = [dict(r) for r in self._q(
+            "SELECT name, role, bytes FROM files WHERE asset_id = ? ORDER BY name", (asset_id,))]
+        return out
+
+    def usage(self):
+        """Bytes on disk by role, and the totals."""
+        by_role = {r["role"]: r["n"] for r in self._q("SELECT role, sum(bytes) AS n FROM files GROUP BY role")}
+        assets = self._q("SELECT count(*) AS n FROM assets")[0]["n"]
+        return {"bytes": sum(by_role.values()), "quota_bytes": self.quota, "assets": assets,
+                "by_role": by_role, "evicted_files": self.evicted,
+                "error": str(self.error) if self.error else None}
+
+    # ---- upkeep ----
+
+    def scan(self):
+        """Records untracked files, refreshes sizes, drops rows of files that are gone."""
+        seen = set()
+        for folder in self.folders:
+            for e in os.scandir(folder):
+                if e.name.endswith((".tmp", ".part")) or parse(e.name) is None:
+                    continue
+                seen.add(e.name)
+                if e.name.endswith((".lmk", ".pkl")) and not self.find(e.name):
+                    try:
+                        self.add_landmarks(e.path)
+                        continue
+                    except (OSError, ValueError, EOFError):
+                        pass
+                self.add(e.path)
+        gone = [r["name"] for r in self._q("SELECT name FROM files") if r["name"] not in seen]
+        with self._lock:
+            self._db.executemany("DELETE FROM files WHERE name = ?", [(n,) for n in gone])
+            self._db.execute("DELETE FROM assets WHERE id NOT IN (SELECT asset_id FROM files)")
+
+    def evict(self):
+        """Deletes cold files until under EVICT_TO of the quota. Returns the names removed."""
+        if not self.quota:
+            return []
+        total = self.usage()["bytes"]
+        target = self.quota * EVICT_TO
+        if total <= self.quota:
+            return []
+        now = time.time()
+        busy = {p[0] for p in map(parse, (os.path.basename(f) for f in self.in_use())) if p}
+        rows = self._q(
+            "SELECT f.name, f.path, f.role, f.bytes, f.asset_id FROM files f JOIN assets a ON a.id = f.asset_id "
+            "WHERE a.pinned = 0 AND a.last_access < ? AND coalesce(a.last_reference, 0) < ? "
+            "ORDER BY a.last_access", (now - MIN_AGE, now - HOT_SECONDS))
+        rows = sorted((r for r in rows if r["asset_id"] not in busy), key=lambda r: RANK[r["role"]])
+        removed = []
+        for r in rows:
+            if total <= target:
+                break
+            # without its landmarks an asset is no use, the rest goes with them
+            victims = [r]
+            if r["role"] == "landmarks":
+                victims = self._q("SELECT name, path, bytes FROM files WHERE asset_id = ?", (r["asset_id"],))
+            for v in victims:
+                if v["name"] in removed:
+                    continue
+                try:
+                    if os.path.isdir(v["path"]):
+                        shutil.rmtree(v["path"])
+                    else:
+                        os.remove(v["path"])
+                except FileNotFoundError:
+                    pass
+                self._q("DELETE FROM files WHERE name = ?", (v["name"],))
+                removed.append(v["name"])
+                total -= v["bytes"]
+        self._q("DELETE FROM assets WHERE id NOT IN (SELECT asset_id FROM files)")
+        self.evicted += len(removed)
+        return removed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+                # scan() add()s too, only wakes from elsewhere count
+                self._wake.clear()
+                self.evict()
+                self.error = None
+            except (OSError, sqlite3.Error) as e:
+                self.error = e
+            self._wake.wait(INTERVAL)
+            self._wake.clear()
+
+    def start(self):
+        """Scans and evicts in a daemon thread, every INTERVAL and after add()s."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,165 @@
+"""
+LLM feedback on a whole routine, for /generate_feedback.
+
+The prompt carries motion_summary.summarize() of the landmarks, not raw
+points. Replies are cached on disk keyed by the landmark content hash,
+PROMPT_VERSION and the model, so asking again for the same clip costs
+nothing; bump PROMPT_VERSION when the prompt or the summary changes.
+
+DANCE_LLM picks the client: "openai" (default) or "stub", a local one
+that answers from the summary without any network, for tests and
+benchmarks (DANCE_LLM_STUB_DELAY adds a fake round trip, in seconds).
+"""
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+import metrics
+import motion_summary
+
+PROMPT_VERSION = 1
+MODEL = os.getenv("DANCE_LLM_MODEL", "gpt-4o")
+LLM = os.getenv("DANCE_LLM", "openai")
+STUB_DELAY = float(os.getenv("DANCE_LLM_STUB_DELAY", 0))
+
+SYSTEM = "You are a professional dance instructor."
+PROMPT = """You are a dance coach AI. Below is a summary of one dance routine, computed from pose
+landmarks. Angles are in degrees (180 = straight), distances in shoulder widths.
+angles: per joint mean/std/min/max/range over the routine and the fraction of frames it was seen
+symmetry_deg: mean left/right difference per joint pair
+stability: sway/bounce of the hips, torso lean (0 = upright)
+motion: how much the dancer moves per second and when they move most
+keyframes: held poses through the routine with their joint angles
+
+{summary}
+
+Focus on overall posture, balance, mistakes, and general improvement tips."""
+
+_t_summary = metrics.timer("feedback", "summary")
+_t_llm = metrics.timer("feedback", "llm")
+
+
+def content_hash(lm):
+    """
+    sha256 of the landmark values and the fps the summary uses: a .pkl
+    (no fps) hashes like a .lmk of the same values at DEFAULT_FPS.
+    """
+    h = hashlib.sha256(json.dumps([len(lm), lm.fps or motion_summary.DEFAULT_FPS]).encode())
+    for s in range(0, len(lm), motion_summary.CHUNK):
+        h.update(np.ascontiguousarray(lm.landmarks[s:s + motion_summary.CHUNK], "<f4").tobytes())
+    return h.hexdigest()
+
+
+def build_prompt(summary):
+    # compact separators, the summary is most of the prompt
+    return PROMPT.format(summary=json.dumps(summary, separators=(",", ":")))
+
+
+class ResponseCache:
+    """One JSON file per key in folder, written atomically."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, value):
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, self._path(key))
+
+
+class OpenAIClient:
+    def __init__(self, model=MODEL, api_key=None):
+        self.model = model
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+
+    def complete(self, system, prompt):
+        # only this route needs openai, so it is not loaded at startup
+        import openai
+        openai.api_key = self.api_key
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.5,
+            max_tokens=400
+        )
+        return response['choices'][0]['message']['content']
+
+
+class StubClient:
+    """Deterministic offline replies built from the summary in the prompt."""
+
+    model = "stub"
+
+    def __init__(self, delay=STUB_DELAY):
+        self.delay = delay
+        self.calls = 0
+
+    def complete(self, system, prompt):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        summary = json.loads(prompt.split("\n\n")[1])
+        lines = [f"Routine of {summary['seconds']}s, pose found in {summary['pose_found']:.0%} of frames."]
+        for name, diff in summary.get("symmetry_deg", {}).items():
+            if diff is not None and diff > 15:
+                lines.append(f"Your {name.lower()}s differ by {diff:.0f} degrees on average, work on symmetry.")
+        lean = summary.get("stability", {}).get("lean_deg")
+        if lean is not None and abs(lean) > 10:
+            lines.append(f"You lean {abs(lean):.0f} degrees to one side, keep your torso upright.")
+        if len(lines) == 1:
+            lines.append("Nice! Form looks good!")
+        return "\n".join(lines)
+
+
+def get_client(name=LLM):
+    if name == "stub":
+        return StubClient()
+    if name == "openai":
+        return OpenAIClient()
+    raise ValueError(f"Unknown DANCE_LLM {name!r}, expected openai or stub")
+
+
+def cache_key(landmark_hash, model):
+    key = f"{landmark_hash}:p{PROMPT_VERSION}:s{motion_summary.VERSION}:{model}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def feedback(lm, client, cache=None):
+    """
+    (text, cached) for a landmark_store.LandmarkFile. Failed calls raise
+    and are not cached.
+    """
+    key = cache_key(content_hash(lm), client.model)
+    hit = cache.get(key) if cache is not None else None
+    metrics.inc("dance_feedback_cache_total", result="hit" if hit else "miss")
+    if hit:
+        return hit["feedback"], True
+
+    t0 = time.perf_counter()
+    summary = motion_summary.summarize(lm)
+    t1 = time.perf_counter()
+    text = client.complete(SYSTEM, build_prompt(summary))
+    _t_summary.observe(t1 - t0)
+    _t_llm.observe(time.perf_counter() - t1)
+    if cache is not None:
+        cache.put(key, {"feedback": text, "model": client.model,
+                        "prompt_version": PROMPT_VERSION, "created": time.time()})
+    return text, False
@@ -0,0 +1,181 @@
+"""
+One live comparison between a reference routine and a webcam.
+
+Everything that used to live in module globals (the last angle breakdown,
+the last position score, the smoothing history) and the Pose graph itself
+belong to a ComparisonSession, so a threaded server can run as many
+/compare_feed streams side by side as it has CPU for.
+"""
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+import overlay
+import roi
+import similarity
+import pose_pool
+from hello import as_points, draw_colored_skeleton, generate_feedback
+from proxy import proxy_frame
+from reference_index import ReferenceIndex, build_index
+
+# the live feed favours speed over the preprocessing accuracy
+LIVE_POSE_SETTINGS = dict(model_complexity=0, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+HISTORY = 3
+
+_t_similarity = metrics.timer("compare", "similarity")
+_t_draw = metrics.timer("compare", "draw")
+
+
+def mirrored_landmark_list(raw):
+    """(33, 4) reference landmarks -> x-flipped NormalizedLandmarkList."""
+    from mediapipe.framework.formats import landmark_pb2
+    mirrored = np.array(raw, dtype=np.float32)
+    mirrored[:, 0] = 1 - mirrored[:, 0]
+    return landmark_pb2.NormalizedLandmarkList(
+        landmark=[landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=v)
+                  for x, y, z, v in mirrored.tolist()])
+
+
+def mirrored_points(lm):
+    """
+    Pose landmarks (a NormalizedLandmarkList or a (33, 4) array) -> (33, 4)
+    float32 with x flipped; None stays None.
+    """
+    if lm is None:
+        return None
+    pts = np.array(as_points(lm), dtype=np.float32)
+    pts[:, 0] = 1 - pts[:, 0]
+    return pts
+
+
+class ComparisonSession:
+    """
+    Scores webcam frames against a reference one frame at a time. The
+    reference is a ReferenceIndex (a LandmarkFile gets indexed here).
+    detect() needs a Pose: pass one in, otherwise the session checks one
+    out of pose_pool the first time and hands it back on close(). render()
+    alone, fed with landmarks from the shared camera, never needs one.
+    """
+
+    def __init__(self, reference, pose=None):
+        if not isinstance(reference, ReferenceIndex):
+            reference = build_index(reference)
+        self.reference = reference
+        self._own_pose = pose is None
+        self.pose = pose
+        self.tracker = None
+        self.idx = 0
+        self.history = []
+        self.angle_data = {}
+        self.pos_sim = 0.0
+        self.avg = 0.0
+
+    def close(self):
+        if self._own_pose and self.pose is not None:
+            pose_pool.checkin(self.pose)
+            self.pose = None
+        self.tracker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def score(self, ref, cam):
+        """Updates the session's breakdown and returns the smoothed score."""
+        sim = similarity.compare(ref, cam)
+        self.angle_data = sim.angle_data()
+        if sim.valid:
+            self.pos_sim = float(sim.pos_sim)
+        self.history.append(float(sim.score))
+        if len(self.history) > HISTORY:
+            self.history.pop(0)
+        return sum(self.history) / len(self.history)
+
+    def detect(self, fc):
+        """Mirrors a webcam frame and runs pose on it: (frame, (33, 4) landmarks or None)."""
+        if self.pose is None:
+            self.pose = pose_pool.checkout(**LIVE_POSE_SETTINGS)
+        fc = cv2.flip(fc, 1)
+        if roi.ENABLED:
+            if self.tracker is None:
+                self.tracker = roi.RoiTracker(self.pose)
+            lm = self.tracker.process(fc)
+        else:
+            lm = self.pose.process(cv2.cvtColor(fc, cv2.COLOR_BGR2RGB)).pose_landmarks
+        return fc, None if lm is None else as_points(lm)
+
+    def step(self, fv, fc):
+        """
+        Takes the next reference video frame and a webcam frame (both BGR,
+        not yet mirrored) and returns the side by side annotated frame.
+        """
+        return self.render(fv, *self.detect(fc))
+
+    def evaluate(self, cam_lm, idx=None):
+        """
+        Scores mirrored webcam landmarks (a NormalizedLandmarkList or a
+        (33, 4) array, None if no pose) against reference frame idx, by
+        default the current one, without drawing or advancing.
+        Returns (ref, cam, avg): similarity.Features or None for each side
+        and the smoothed score.
+        """
+        if idx is not None:
+            self.idx = idx % len(self.reference)
+        # the reference side is precomputed, only the webcam is worked out here
+        ref = self.reference[self.idx]
+        cam = similarity.features(as_points(cam_lm)) if cam_lm is not None else None
+
+        if cam is not None and ref is not None:
+            avg = self.score(ref, cam)
+        else:
+            avg = 0.0
+        self.avg = avg
+        return ref, cam, avg
+
+    def render(self, fv, fc, cam_lm, idx=None, mirrored=False):
+        """
+        Scores and draws one pair. fc and cam_lm come from detect(); idx is
+        the reference frame fv was decoded from, by default the one after
+        the previous call. mirrored: fv is a proxy frame, already mirrored
+        and scaled (see proxy.py).
+        """
+        t0 = time.perf_counter()
+        ref, cam, avg = self.evaluate(cam_lm, idx)
+        t1 = time.perf_counter()
+        # proxies are read-only and shared, draw on a copy
+        fv = fv.copy() if mirrored else proxy_frame(fv)
+
+        if ref is not None:
+            draw_colored_skeleton(fv, ref.points, avg, self.angle_data)
+        if cam is not None:
+            draw_colored_skeleton(fc, cam.points, avg, self.angle_data)
+
+        if ref is not None:
+            y_off = 30
+            for k, name in enumerate(similarity.JOINT_NAMES):
+                if ref.joint_ok[k]:
+                    cv2.putText(fv, f"{name}: {ref.angles[k]:.1f}°", (10, y_off), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,0,0), 1)
+                    y_off += 25
+
+        if cam is not None and ref is not None:
+            cv2.putText(fc, f"Sim: {avg:.2f}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+            cv2.putText(fc, f"Pos: {self.pos_sim:.2f}", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+            overlay.draw_landmarks(fc, cam.points)
+
+        combined = np.hstack((fv, fc))
+        fb = "Great" if avg >= 0.8 else ("Acceptable" if avg >= 0.5 else "Wrong")
+        ts, _ = cv2.getTextSize(fb, cv2.FONT_HERSHEY_SIMPLEX, 1.0, 2)
+        x = (combined.shape[1] - ts[0]) // 2
+        cv2.putText(combined, fb, (x, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 2)
+
+        for i, msg in enumerate(generate_feedback(self.angle_data, self.pos_sim)):
+            cv2.putText(combined, msg, (10, combined.shape[0] - 100 + 30*i), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2)
+
+        _t_similarity.observe(t1 - t0)
+        _t_draw.observe(time.perf_counter() - t1)
+        self.idx = (self.idx + 1) % len(self.reference)
+        return combined
@@ -0,0 +1,54 @@
+"""
+Latest-value hand-off between threads.
+
+A LatestSlot holds at most one item. put() never blocks: it overwrites
+an item nobody has taken yet and counts it as dropped. Stages chained by
+slots therefore always work on the newest data, and a slow consumer
+sheds frames instead of building a backlog.
+
+A slot given a stage name also adds its drops to the process-wide
+dance_dropped_frames_total{stage=...} counter served at /metrics.
+"""
+import threading
+
+import metrics
+
+
+class Closed(Exception):
+    pass
+
+
+class LatestSlot:
+    """Single item hand-off between two threads that never blocks the producer."""
+
+    def __init__(self, stage=None):
+        self.stage = stage
+        self._item = None
+        self._full = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full:
+                self.dropped += 1
+                if self.stage:
+                    metrics.inc("dance_dropped_frames_total", stage=self.stage)
+            self._item, self._full = item, True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Waits for the next item; raises Closed once closed and drained."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._full or self._closed, timeout):
+                raise TimeoutError
+            if not self._full:
+                raise Closed
+            item, self._item, self._full = self._item, None, False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
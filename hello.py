@@ -1,12 +1,19 @@
 import cv2
-import mediapipe as mp
-import pickle
 import numpy as np
 import math
-from mediapipe.framework.formats import landmark_pb2
 import os
-angleData = {}
-LengthData = 0.0
+import time
+import similarity
+import pose_pool
+import metrics
+import progressive
+import overlay
+import roi
+from landmark_store import save_landmarks, load_landmarks
+from reference_index import save_index
+
+# settings used for the offline (upload) pose pass
+POSE_SETTINGS = dict(model_complexity=1, min_detection_confidence=0.5, min_tracking_confidence=0.5)
 
 def compute_body_scale(landmarks):
     if not landmarks or len(landmarks) <= 12:
@@ -18,17 +25,59 @@ def compute_body_scale(landmarks):
         return s if s > 0 else 1.0
     return 1.0
 
-def preprocess_and_annotate_video(video_path, output_video_path, landmark_output_path):
+# >1 splits uploads into frame ranges processed in parallel (see segmented.py)
+PREPROCESS_WORKERS = int(os.getenv("DANCE_PREPROCESS_WORKERS", 1))
+# >1 runs pose on every n-th frame only and interpolates the frames between
+PREPROCESS_STRIDE = int(os.getenv("DANCE_PREPROCESS_STRIDE", 1))
+# frames taller than this are scaled down for pose, 0 keeps them as they are
+INFER_HEIGHT = int(os.getenv("DANCE_INFER_HEIGHT", 0))
+# pose on a crop around the previous frame's landmarks, see roi.py
+POSE_ROI = roi.ENABLED
+
+_t_decode = metrics.timer("preprocess", "decode")
+_t_pose   = metrics.timer("preprocess", "pose")
+_t_draw   = metrics.timer("preprocess", "draw")
+_t_write  = metrics.timer("preprocess", "write")
+
+def preprocess_and_annotate_video(video_path, output_video_path, landmark_output_path,
+                                  pose=None, progress=None, workers=None,
+                                  stride=None, infer_height=None, segment_seconds=None,
+                                  track_roi=None):
     """
     Reads video_path, runs MediaPipe pose + draws landmarks,
-    writes out a WebM/VP8 to <base>.webm and pickles landmarks.
+    writes out a WebM/VP8 to <base>.webm and saves landmarks
+    as a .lmk file (see landmark_store) plus its reference_index.
     Returns the full path to the .webm file.
+
+    pose lets a caller pass in an already-built Pose, by default one is
+    checked out of pose_pool for the duration of the call,
+    progress(frames_done, frames_total) is called after every frame.
+    workers > 1 (default PREPROCESS_WORKERS) hands off to
+    segmented.preprocess_parallel, 1 keeps the single-core path.
+    stride, infer_height and track_roi (default PREPROCESS_STRIDE,
+    INFER_HEIGHT, POSE_ROI) trade accuracy for speed, see annotate_range;
+    frames that were interpolated are flagged in the .lmk.
+    segment_seconds (default progressive.SEGMENT_SECONDS) > 0 also
+    publishes the output as it goes, as segments plus a manifest in
+    <base>.parts/ (single worker only); the .webm is stitched from them.
     """
-    mp_pose = mp.solutions.pose
-    pose    = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    drawer  = mp.solutions.drawing_utils
-    styles  = mp.solutions.drawing_styles
-    
+    workers = PREPROCESS_WORKERS if workers is None else workers
+    stride = PREPROCESS_STRIDE if stride is None else stride
+    infer_height = INFER_HEIGHT if infer_height is None else infer_height
+    track_roi = POSE_ROI if track_roi is None else track_roi
+    if workers > 1:
+        from segmented import preprocess_parallel
+        return preprocess_parallel(video_path, output_video_path, landmark_output_path,
+                                   workers=workers, progress=progress,
+                                   stride=stride, infer_height=infer_height, track_roi=track_roi)
+
+    if pose is None:
+        with pose_pool.pose(**POSE_SETTINGS) as pooled:
+            return preprocess_and_annotate_video(video_path, output_video_path, landmark_output_path,
+                                                 pose=pooled, progress=progress, workers=1,
+                                                 stride=stride, infer_height=infer_height,
+                                                 segment_seconds=segment_seconds, track_roi=track_roi)
+
     vid = cv2.VideoCapture(video_path)
     if not vid.isOpened():
         raise IOError(f"Cannot open {video_path}")
@@ -36,61 +85,154 @@ def preprocess_and_annotate_video(video_path, output_video_path, landmark_output
     w = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = vid.get(cv2.CAP_PROP_FPS) or 30
+    total = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
 
     # change extension to .webm
     base, _ = os.path.splitext(output_video_path)
     webm_path = base + ".webm"
 
-    # VP8 fourcc
-    out = cv2.VideoWriter(
-        webm_path,
-        cv2.VideoWriter_fourcc('V','P','8','0'),
-        fps,
-        (w, h)
+    segment_seconds = progressive.SEGMENT_SECONDS if segment_seconds is None else segment_seconds
+    if segment_seconds > 0:
+        out = progressive.SegmentWriter(webm_path, fps, (w, h), segment_seconds)
+    else:
+        # VP8 fourcc
+        out = cv2.VideoWriter(
+            webm_path,
+            cv2.VideoWriter_fourcc('V','P','8','0'),
+            fps,
+            (w, h)
+        )
+
+    all_landmarks, interpolated = annotate_range(
+        vid, pose, out,
+        progress=progress and (lambda n: progress(n, max(total, n))),
+        stride=stride, infer_height=infer_height, track_roi=track_roi
     )
 
-    all_landmarks = []
-    while True:
-        ret, frame = vid.read()
-        if not ret:
-            break
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res = pose.process(rgb)
-        if res.pose_landmarks:
-            lm = [(p.x, p.y, p.z, p.visibility)
-                  for p in res.pose_landmarks.landmark]
-            all_landmarks.append(lm)
-            drawer.draw_landmarks(
-                frame,
-                res.pose_landmarks,
-                mp_pose.POSE_CONNECTIONS,
-                landmark_drawing_spec=styles.get_default_pose_landmarks_style()
-            )
-        else:
-            all_landmarks.append(None)
-        out.write(frame)
-    
     vid.release()
-    out.release()
+    if segment_seconds > 0:
+        out.finish()
+    else:
+        out.release()
 
-    with open(landmark_output_path, 'wb') as f:
-        pickle.dump(all_landmarks, f)
+    save_landmarks(landmark_output_path, all_landmarks, fps, w, h, interpolated=interpolated)
+    save_index(landmark_output_path, all_landmarks, fps)
 
     return webm_path
+
+def _prepare(frame, infer_height=None):
+    """BGR frame -> RGB for pose, scaled down to infer_height if it is taller."""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    h, w = rgb.shape[:2]
+    if infer_height and h > infer_height:
+        rgb = cv2.resize(rgb, (round(w * infer_height / h), infer_height),
+                         interpolation=cv2.INTER_AREA)
+    return rgb
+
+def annotate_range(vid, pose, out, count=None, warmup=0, progress=None,
+                   stride=1, infer_height=None, track_roi=False):
+    """
+    Runs pose over the next warmup + count frames of vid (all remaining
+    if count is None). Warm-up frames only let the tracker settle and are
+    dropped; the rest get landmarks drawn and are written to out (out
+    None only extracts the landmarks).
+
+    stride > 1 runs pose on every stride-th frame only, and on the last
+    one; the frames in between get landmarks interpolated linearly from
+    the two around them (None if either had no pose). infer_height
+    scales taller frames down before pose, track_roi runs it on a crop
+    around the person found last (roi.RoiTracker). Every frame is still
+    drawn and written.
+    Returns (landmarks, interpolated): per frame its landmarks (None
+    where no pose was found) and whether they were interpolated.
+    """
+    clock = time.perf_counter
+    tracker = roi.RoiTracker(pose, infer_height) if track_roi else None
+
+    def draw_and_write(frame, lm):
+        if out is None:
+            return
+        t = clock()
+        if lm is not None:
+            overlay.draw_landmarks(frame, lm, style="pose")
+        t1 = clock()
+        out.write(frame)
+        _t_draw.observe(t1 - t)
+        _t_write.observe(clock() - t1)
+
+    def infer(frame, t0):
+        if tracker:
+            # the tracker converts what it crops, that counts as pose
+            t1 = clock()
+            lm = tracker.process(frame)
+        else:
+            rgb = _prepare(frame, infer_height)
+            t1 = clock()
+            lm = pose.process(rgb).pose_landmarks
+        _t_decode.observe(t1 - t0)
+        _t_pose.observe(clock() - t1)
+        return lm
+
+    all_landmarks, interpolated = [], []
+
+    def emit(frame, lm, interp, pts=None):
+        all_landmarks.append(lm)
+        interpolated.append(interp)
+        # drawing takes the array as is, no NormalizedLandmarkList needed
+        draw_and_write(frame, lm if pts is None else pts)
+        if progress:
+            progress(len(all_landmarks))
+
+    def keyframe(frame, t0, pending):
+        proto = infer(frame, t0)
+        lm = None if proto is None else list(map(tuple, as_points(proto).tolist()))
+        # frames skipped since the previous keyframe, filled in between the two
+        prev = all_landmarks[-1] if all_landmarks else None
+        for k, f in enumerate(pending, 1):
+            if prev is None or lm is None:
+                emit(f, None, True)
+                continue
+            a = k / (len(pending) + 1)
+            pts = (1 - a) * np.asarray(prev) + a * np.asarray(lm)
+            emit(f, list(map(tuple, pts.tolist())), True, pts)
+        emit(frame, lm, False)
+
+    for i in range(warmup):
+        ret, frame = vid.read()
+        if not ret:
+            return [], []
+        # keeps the same spacing into the first kept frame
+        if (warmup - i) % stride == 0:
+            if tracker:
+                tracker.process(frame)
+            else:
+                pose.process(_prepare(frame, infer_height))
+
+    pending = []
+    while count is None or len(all_landmarks) + len(pending) < count:
+        t0 = clock()
+        ret, frame = vid.read()
+        if not ret:
+            break
+        n = len(all_landmarks) + len(pending)
+        last = count is not None and n == count - 1
+        if n % stride and not last:
+            _t_decode.observe(clock() - t0)
+            pending.append(frame)
+            continue
+        keyframe(frame, t0, pending)
+        pending = []
+    if pending:
+        # the video ended between keyframes, its last frame becomes one
+        keyframe(pending[-1], clock(), pending[:-1])
+    return all_landmarks, interpolated
+
 def draw_lines(frame, pose_landmarks):
     """
     Draw exactly the same landmarks+connections you use
     in preprocess_and_annotate_video, but on a live frame.
     """
-    mp_drawing = mp.solutions.drawing_utils
-    mp_styles  = mp.solutions.drawing_styles
-
-    mp_drawing.draw_landmarks(
-        frame,
-        pose_landmarks,
-        mp.solutions.pose.POSE_CONNECTIONS,
-        landmark_drawing_spec=mp_styles.get_default_pose_landmarks_style()
-    )
+    overlay.draw_landmarks(frame, as_points(pose_landmarks), style="pose")
 def calculate_angle(a, b, c):
     ba = (a[0]-b[0], a[1]-b[1])
     bc = (c[0]-b[0], c[1]-b[1])
@@ -101,42 +243,10 @@ def calculate_angle(a, b, c):
     return math.degrees(math.acos(max(-1, min(1, dot/(m1*m2)))))
 
 def calculate_similarity(L1, L2):
-    global angleData, LengthData
+    """Score only; use similarity.compare for the per-joint breakdown."""
     if L1 is None or L2 is None or len(L1) != len(L2):
         return 0.0
-
-    important = [
-        (11,13,15,"Left Elbow"),
-        (12,14,16,"Right Elbow"),
-        (13,11,23,"Left Shoulder"),
-        (14,12,24,"Right Shoulder")
-    ]
-    s1, s2 = compute_body_scale(L1), compute_body_scale(L2)
-    avg_s = (s1 + s2) / 2.0
-
-    pos_diffs = []
-    for i, lm1 in enumerate(L1):
-        lm2 = L2[i]
-        if lm1[3] > 0.5 and lm2[3] > 0.5:
-            pos_diffs.append(math.dist(lm1[:3], lm2[:3]) / avg_s)
-
-    angleData = {}
-    angle_sims = []
-    for a,b,c,name in important:
-        if all(L1[i][3] > 0.5 for i in (a,b,c)) and all(L2[i][3] > 0.5 for i in (a,b,c)):
-            ang1 = calculate_angle(L1[a], L1[b], L1[c])
-            ang2 = calculate_angle(L2[a], L2[b], L2[c])
-            d = abs(ang1 - ang2)
-            angleData[name] = {"video": ang1, "webcam": ang2, "diff": d}
-            angle_sims.append(1 - d/180.0)
-
-    if not pos_diffs or not angle_sims:
-        return 0.0
-
-    avg_pos = sum(pos_diffs) / len(pos_diffs)
-    pos_sim = math.exp(-5 * avg_pos**2)
-    LengthData = pos_sim
-    return 0.2 * pos_sim + 0.8 * (sum(angle_sims) / len(angle_sims))
+    return float(similarity.compare(L1, L2).score)
 
 def resize_to_height(frame, H):
     h, w = frame.shape[:2]
@@ -156,94 +266,33 @@ def generate_feedback(ad, ls, thresh=25):
         msgs = ["Nice! Form looks good!"]
     return msgs
 
-def draw_colored_skeleton(frame, lmlist, score):
-    h, w = frame.shape[:2]
-
-    limb_to_part = {
-        (11,13): "Left Elbow",    (13,15): "Left Elbow",
-        (12,14): "Right Elbow",   (14,16): "Right Elbow",
-        (13,11): "Left Shoulder", (11,23): "Left Shoulder",
-        (14,12): "Right Shoulder",(12,24): "Right Shoulder",
-    }
-
-    for a, b in mp.solutions.pose.POSE_CONNECTIONS:
-        A = lmlist.landmark[a]
-        B = lmlist.landmark[b]
-        if A.visibility > 0.5 and B.visibility > 0.5:
-            x1, y1 = int(A.x*w), int(A.y*h)
-            x2, y2 = int(B.x*w), int(B.y*h)
-
-            part = limb_to_part.get((a,b)) or limb_to_part.get((b,a))
-            if part and part in angleData:
-                diff = angleData[part]["diff"]
-
-                # give shoulders a more lenient green zone
-                if "Shoulder" in part:
-                    green_thresh  =  fifty = 50    # up to 50° is green
-                    yellow_thresh = sixty = 80     # 50–80° is yellow
-                else:
-                    green_thresh  = 40            # elbows still 32°
-                    yellow_thresh = 55           # elbows 32–45°
-
-                if diff < green_thresh:
-                    col = (0,255,0)       # green
-                elif diff < yellow_thresh:
-                    col = (0,165,255)     # yellow‐orange
-                else:
-                    col = (0,0,255)       # red
-            else:
-                col = (200,200,200)      # neutral gray
+def as_points(lmlist):
+    """NormalizedLandmarkList or (33, 4) array -> (33, 4) array of x, y, z, visibility."""
+    if hasattr(lmlist, "landmark"):
+        return np.array([(p.x, p.y, p.z, p.visibility) for p in lmlist.landmark])
+    return np.asarray(lmlist)
 
-            cv2.line(frame, (x1,y1), (x2,y2), col, 2)
-
-    h, w = frame.shape[:2]
-
-    # map each connection to its joint name (if any)
-    limb_to_part = {
-        (11,13): "Left Elbow",   (13,15): "Left Elbow",
-        (12,14): "Right Elbow",  (14,16): "Right Elbow",
-        (13,11): "Left Shoulder",(11,23): "Left Shoulder",
-        (14,12): "Right Shoulder",(12,24): "Right Shoulder",
-    }
-
-    for a, b in mp.solutions.pose.POSE_CONNECTIONS:
-        # pixel coords
-        A = lmlist.landmark[a]
-        B = lmlist.landmark[b]
-        if A.visibility > 0.5 and B.visibility > 0.5:
-            x1, y1 = int(A.x*w), int(A.y*h)
-            x2, y2 = int(B.x*w), int(B.y*h)
-
-            part = limb_to_part.get((a,b)) or limb_to_part.get((b,a))
-            if part and part in angleData:
-                diff = angleData[part]["diff"]
-                # green if <20°, yellow if <45°, red otherwise
-                if diff < 32:
-                    col = (0,255,0)
-                elif diff < 45:
-                    col = (0,165,255)
-                else:
-                    col = (0,0,255)
-            else:
-                col = (200,200,200)
-
-            cv2.line(frame, (x1,y1), (x2,y2), col, 2)
+def draw_colored_skeleton(frame, lmlist, score, angle_data=None):
+    """lmlist is a NormalizedLandmarkList or a (33, 4) array."""
+    overlay.draw_skeleton(frame, as_points(lmlist), angle_data)
 
 def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landmarks_path):
-    with open(landmarks_path, 'rb') as f:
-        all_lm = pickle.load(f)
+    all_lm = load_landmarks(landmarks_path)
 
     vid = cv2.VideoCapture(video_path)
     cam = cv2.VideoCapture(0)
+    import mediapipe as mp
+    from mediapipe.framework.formats import landmark_pb2
     mp_pose = mp.solutions.pose
-    pose    = mp_pose.Pose(model_complexity=0,
-                           min_detection_confidence=0.5,
-                           min_tracking_confidence=0.5)
+    pose    = pose_pool.checkout(model_complexity=0,
+                                 min_detection_confidence=0.5,
+                                 min_tracking_confidence=0.5)
     REF_SCALE = 1
     CAM_SCALE = 1
     H = 720
     history = []
     idx = 0
+    angle_data, pos_sim = {}, 0.0
 
     while True:
         ok1, fv = vid.read()
@@ -258,8 +307,10 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
 
         raw = all_lm[idx]
         ref_list = None
-        if raw:
-            mirrored = [(1-x,y,z,v) for x,y,z,v in raw]
+        if raw is not None:
+            mirrored = raw.copy()
+            mirrored[:, 0] = 1 - mirrored[:, 0]
+            mirrored = mirrored.tolist()
             ref_list = landmark_pb2.NormalizedLandmarkList(
                 landmark=[landmark_pb2.NormalizedLandmark(x=x,y=y,z=z,visibility=v)
                           for x,y,z,v in mirrored]
@@ -278,8 +329,11 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
         if res.pose_landmarks and ref_list:
             cam_raw = [(p.x,p.y,p.z,p.visibility) for p in res.pose_landmarks.landmark]
             ref_raw = [(p.x,p.y,p.z,p.visibility) for p in ref_list.landmark]
-            s = calculate_similarity(ref_raw, cam_raw)
-            history.append(s)
+            sim = similarity.compare(ref_raw, cam_raw)
+            angle_data = sim.angle_data()
+            if sim.valid:
+                pos_sim = float(sim.pos_sim)
+            history.append(float(sim.score))
             if len(history) > 3:
                 history.pop(0)
             avg = sum(history) / len(history)
@@ -288,9 +342,9 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
 
         # Draw color‐coded skeletons
         if ref_list:
-            draw_colored_skeleton(fv, ref_list, avg)
+            draw_colored_skeleton(fv, ref_list, avg, angle_data)
         if res.pose_landmarks:
-            draw_colored_skeleton(fc, res.pose_landmarks, avg)
+            draw_colored_skeleton(fc, res.pose_landmarks, avg, angle_data)
 
         # Draw reference angles
         if ref_list:
@@ -313,12 +367,12 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
         if res.pose_landmarks and ref_list:
             # cv2.putText(fc, f"Sim: {avg:.2f}", (10,30),
             #             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2, cv2.LINE_AA)
-            # cv2.putText(fc, f"Pos: {LengthData:.2f}", (10,60),
+            # cv2.putText(fc, f"Pos: {pos_sim:.2f}", (10,60),
             #             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2, cv2.LINE_AA)
             drawer = mp.solutions.drawing_utils
             drawer.draw_landmarks(fc, res.pose_landmarks, mp_pose.POSE_CONNECTIONS)
             y_off = 90
-            for nm, d in angleData.items():
+            for nm, d in angle_data.items():
                 # col = (0,255,0) if d['diff']<20 else (0,165,255) if d['diff']<45 else (0,0,255)
                 # txt = f"{nm}: V{d['video']:.1f} W{d['webcam']:.1f} D{d['diff']:.1f}"
                 # cv2.putText(fc, txt, (10, y_off),
@@ -338,7 +392,7 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
         # cv2.putText(combined, fb, (x, 50),
         #             cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 2, cv2.LINE_AA)
 
-        for i, msg in enumerate(generate_feedback(angleData, LengthData)):
+        for i, msg in enumerate(generate_feedback(angle_data, pos_sim)):
             cv2.putText(combined, msg, (10, combined.shape[0] - 100 + 30*i),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2, cv2.LINE_AA)
 
@@ -356,8 +410,10 @@ def display_preprocessed_landmarks_and_webcam_with_comparison(video_path, landma
 
         idx = (idx + 1) % len(all_lm)
 
+    pose_pool.checkin(pose)
+    vid.release()
+    cam.release()
 
-    
 if __name__ == "__main__":
-    preprocess_and_annotate_video("advfinal1.mp4", "annotated_video.mp4", "ok.pkl")
-    display_preprocessed_landmarks_and_webcam_with_comparison("advfinal1.mp4", "ok.pkl") #update these two
+    preprocess_and_annotate_video("advfinal1.mp4", "annotated_video.mp4", "ok.lmk")
+    display_preprocessed_landmarks_and_webcam_with_comparison("advfinal1.mp4", "ok.lmk") #update these two
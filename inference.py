@@ -0,0 +1,299 @@
+"""
+Pose in worker processes, frames passed through shared memory.
+
+Every live Pose graph used to run inside the web process, where the
+MediaPipe work competes with request handling for the GIL. An
+InferencePool starts `workers` processes, each with a ring of SLOTS frame
+buffers in one multiprocessing.shared_memory block. Submitting a frame
+copies its pixels into a free slot and sends the worker only (stream,
+slot, shape) down a pipe; the worker runs pose on the slot in place and
+sends back the landmarks as a (33, 4) float32 array (None for no pose),
+which frees the slot. Pixels are never pickled.
+
+    pool = InferencePool(workers=2).start()
+    pose = pool.open(model_complexity=0)    # one stream, a Pose look-alike
+    pose.process(rgb).pose_landmarks        # or pose.submit(rgb) -> Future
+    pose.close()
+
+A stream keeps its own graph in one worker, so MediaPipe's tracking
+works like with a local Pose; streams go to the worker with the fewest
+open, and throughput grows with workers as long as there are streams for
+them. Frames of one stream are answered in order. A worker that dies
+fails what it had in flight and is started again.
+
+DANCE_INFERENCE_WORKERS > 0 makes app.py start a pool and pose_pool
+hand out its streams in place of local graphs (see pose_pool.use).
+Frames with more than MAX_PIXELS pixels are scaled down before they are
+sent; landmarks are normalized, so that only costs a little accuracy.
+"""
+import os
+import time
+import atexit
+import queue
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+import metrics
+
+WORKERS = int(os.getenv("DANCE_INFERENCE_WORKERS", 0))
+SLOTS = int(os.getenv("DANCE_INFERENCE_SLOTS", 4))
+MAX_PIXELS = int(os.getenv("DANCE_INFERENCE_MAX_PIXELS", 1920 * 1080))
+# how long a submit waits for a free slot, and a caller for its result
+TIMEOUT = float(os.getenv("DANCE_INFERENCE_TIMEOUT", 30))
+
+# mediapipe does not survive fork() once the web process has built a graph
+_ctx = multiprocessing.get_context("spawn")
+_ids = itertools.count(1)
+
+_t_wait = metrics.timer("inference", "wait")
+_t_pose = metrics.timer("inference", "pose")
+
+
+class WorkerDied(RuntimeError):
+    pass
+
+
+# ---- worker side ----
+
+def _serve(conn, shm_name, slots, slot_bytes, warm):
+    import pose_pool
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots, slot_bytes), np.uint8, shm.buf)
+    for settings in warm:
+        pose_pool.warm(settings)
+    streams = {}
+    rgb = None
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            if msg[0] == "close":
+                pose = streams.pop(msg[1], None)
+                if pose is not None:
+                    pose_pool.checkin(pose)
+                continue
+            _, stream, slot, shape, settings = msg
+            rgb = frames[slot, :int(np.prod(shape))].reshape(shape)
+            t = time.perf_counter()
+            try:
+                pose = streams.get(stream)
+                if pose is None:
+                    pose = streams[stream] = pose_pool.checkout(**settings)
+                lm = pose.process(rgb).pose_landmarks
+                arr = None if lm is None else \
+                    np.array([(p.x, p.y, p.z, p.visibility) for p in lm.landmark], np.float32)
+                conn.send((slot, arr, time.perf_counter() - t, None))
+            except Exception as e:
+                conn.send((slot, None, time.perf_counter() - t, f"{type(e).__name__}: {e}"))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del rgb, frames
+        shm.close()
+
+
+# ---- web side ----
+
+class _Worker:
+    def __init__(self, index, slots, slot_bytes):
+        self.index = index
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.frames = np.ndarray((slots, slot_bytes), np.uint8, self.shm.buf)
+        self.free = queue.Queue()
+        for i in range(slots):
+            self.free.put(i)
+        self.pending = {}
+        self.streams = 0
+        self.lock = threading.Lock()
+        self.proc = None
+        self.conn = None
+
+    def start(self, warm):
+        self.conn, child = _ctx.Pipe()
+        self.proc = _ctx.Process(target=_serve, name=f"inference-{self.index}", daemon=True,
+                                 args=(child, self.shm.name, self.slots, self.frames.shape[1], warm))
+        self.proc.start()
+        child.close()
+
+    def send(self, msg):
+        with self.lock:
+            self.conn.send(msg)
+
+
+class InferencePool:
+    """
+    `workers` pose processes, each with `slots` frames in flight at most.
+    warm: pose settings every worker builds a graph for at start.
+    """
+
+    def __init__(self, workers=None, slots=SLOTS, max_pixels=MAX_PIXELS, warm=()):
+        self.workers = workers or WORKERS or 1
+        self.slots = slots
+        self.max_pixels = max_pixels
+        self.warm = list(warm)
+        self.restarts = 0
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            for i in range(self.workers):
+                w = _Worker(i, self.slots, self.max_pixels * 3)
+                w.start(self.warm)
+                self._workers.append(w)
+            self._thread = threading.Thread(target=self._collect, name="inference", daemon=True)
+            self._thread.start()
+            # the shared memory outlives the process unless unlinked
+            atexit.register(self.close)
+        return self
+
+    def open(self, **settings):
+        """A new stream with these Pose settings, on the least busy worker."""
+        with self._lock:
+            w = min(self._workers, key=lambda w: w.streams)
+            w.streams += 1
+        return RemotePose(self, w, settings)
+
+    def _submit(self, w, stream, settings, rgb):
+        rgb = self.fit(rgb)
+        try:
+            slot = w.free.get(timeout=TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"inference worker {w.index} has no free slot") from None
+        # the one copy of the pixels, straight into shared memory
+        w.frames[slot, :rgb.size].reshape(rgb.shape)[...] = rgb
+        fut = Future()
+        with w.lock:
+            w.pending[slot] = (fut, time.perf_counter())
+            try:
+                w.conn.send(("frame", stream, slot, rgb.shape, settings))
+            except OSError:
+                # the collector restarts it
+                del w.pending[slot]
+                w.free.put(slot)
+                raise WorkerDied(f"inference worker {w.index} is gone") from None
+        return fut
+
+    def fit(self, rgb):
+        """rgb, scaled down if it has more than max_pixels pixels."""
+        h, w = rgb.shape[:2]
+        if h * w <= self.max_pixels:
+            return rgb
+        s = (self.max_pixels / (h * w)) ** 0.5
+        return cv2.resize(rgb, (max(1, int(w * s)), max(1, int(h * s))), interpolation=cv2.INTER_AREA)
+
+    def _collect(self):
+        while not self._closed:
+            conns = {w.conn: w for w in self._workers}
+            for conn in wait(list(conns), timeout=1):
+                w = conns[conn]
+                try:
+                    slot, arr, dt, err = conn.recv()
+                except (EOFError, OSError):
+                    if not self._closed:
+                        self._restart(w)
+                    continue
+                with w.lock:
+                    fut, t0 = w.pending.pop(slot)
+                w.free.put(slot)
+                _t_pose.observe(dt)
+                _t_wait.observe(time.perf_counter() - t0)
+                if err:
+                    fut.set_exception(RuntimeError(err))
+                else:
+                    fut.set_result(arr)
+
+    def _restart(self, w):
+        """Fails what a dead worker had in flight and starts a new one in its place."""
+        with w.lock:
+            pending, w.pending = w.pending, {}
+            for slot in pending:
+                w.free.put(slot)
+            w.conn.close()
+            w.start(self.warm)
+        for fut, _ in pending.values():
+            fut.set_exception(WorkerDied(f"inference worker {w.index} exited ({w.proc.exitcode})"))
+        self.restarts += 1
+        metrics.inc("dance_inference_restarts_total")
+
+    def stats(self):
+        """Per worker: open streams and frames in flight."""
+        return [{"worker": w.index, "streams": w.streams, "in_flight": len(w.pending),
+                 "alive": w.proc.is_alive()} for w in self._workers]
+
+    def close(self):
+        self._closed = True
+        for w in self._workers:
+            try:
+                w.send(None)
+            except OSError:
+                pass
+        for w in self._workers:
+            w.proc.join(5)
+            if w.proc.is_alive():
+                w.proc.kill()
+        if self._thread is not None:
+            self._thread.join()
+        for w in self._workers:
+            w.conn.close()
+            for fut, _ in w.pending.values():
+                fut.cancel()
+            del w.frames
+            w.shm.close()
+            w.shm.unlink()
+        self._workers = []
+
+
+class RemotePose:
+    """
+    One stream of an InferencePool, usable where a mediapipe Pose is:
+    process(rgb) returns an object with pose_landmarks, here the (33, 4)
+    float32 array (or None) rather than a NormalizedLandmarkList; callers
+    go through hello.as_points, which takes either. reset() starts the
+    stream's tracking over, close() gives its graph back.
+    """
+
+    remote = True
+
+    def __init__(self, pool, worker, settings):
+        self.pool = pool
+        self.worker = worker
+        self.settings = settings
+        self.id = next(_ids)
+        self._closed = False
+
+    def submit(self, rgb):
+        """Future of the (33, 4) float32 landmarks of rgb, or of None."""
+        return self.pool._submit(self.worker, self.id, self.settings, rgb)
+
+    def process(self, rgb):
+        return SimpleNamespace(pose_landmarks=self.submit(rgb).result(TIMEOUT))
+
+    def reset(self):
+        # the worker builds a fresh graph for the new id on its next frame
+        self.worker.send(("close", self.id))
+        self.id = next(_ids)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.worker.send(("close", self.id))
+        except OSError:
+            pass
+        with self.pool._lock:
+            self.worker.streams -= 1
@@ -0,0 +1,267 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import metrics
+import pose_pool
+import progressive
+from hello import preprocess_and_annotate_video, POSE_SETTINGS
+
+# mediapipe does not survive fork() once the web process has built a graph
+_ctx = multiprocessing.get_context("spawn")
+
+# how often (in frames) a worker pushes progress back to the web process
+PROGRESS_EVERY = 10
+# finished jobs kept for status() and dedup, oldest dropped first
+KEEP_FINISHED = int(os.getenv("DANCE_JOBS_KEEP", 500))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+# ---- worker side ----
+
+_settings = None
+
+def _init_worker(settings):
+    # every worker warms a Pose up front and reuses it for its whole life
+    global _settings
+    _settings = settings
+    pose_pool.warm(settings)
+
+def worker_pose():
+    """The warm Pose of this worker process, as a context manager."""
+    return pose_pool.pose(**_settings)
+
+def reporter(task_id, progress, cancelled):
+    """A progress(done, total) callback that also stops a cancelled task."""
+    def report(done, total):
+        if done % PROGRESS_EVERY and done != total:
+            return
+        if task_id in cancelled:
+            raise JobCancelled(task_id)
+        progress[task_id] = (done, total)
+    return report
+
+def _run_job(job_id, in_path, out_path, lm_path, progress, cancelled):
+    report = reporter(job_id, progress, cancelled)
+    # the worker's timings go back with the result, see JobQueue._collect
+    metrics.reset()
+    try:
+        with worker_pose() as pose:
+            webm_path = preprocess_and_annotate_video(in_path, out_path, lm_path,
+                                                      pose=pose, progress=report)
+    except JobCancelled:
+        base, _ = os.path.splitext(out_path)
+        for p in (base + ".webm", lm_path):
+            if os.path.exists(p):
+                os.remove(p)
+        shutil.rmtree(base + progressive.SUFFIX, ignore_errors=True)
+        raise
+    return webm_path, metrics.snapshot()
+
+
+# ---- web side ----
+
+class ProcessQueue:
+    """
+    What JobQueue and batch.BatchGrader share: a pool of spawned pose
+    workers started on first use, the progress and cancel flags its tasks
+    report through, and the state of a task's future.
+    """
+
+    def __init__(self, workers, pose_settings=None, keep_finished=KEEP_FINISHED):
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.pose_settings = pose_settings or POSE_SETTINGS
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._manager = None
+
+    def _start(self):
+        if self._pool is None:
+            self._manager = _ctx.Manager()
+            # cache hits registered before the first submit keep their progress
+            self._progress = self._manager.dict(self._progress)
+            self._cancelled = self._manager.dict()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=_ctx,
+                initializer=_init_worker,
+                initargs=(self.pose_settings,),
+            )
+
+    def _state(self, task_id, fut):
+        """frames_done, frames_total, state and error of a task; the caller adds its result."""
+        done, total = self._progress.get(task_id, (0, 0))
+        st = {"frames_done": done, "frames_total": total}
+        if fut.cancelled():
+            st["state"] = "cancelled"
+        elif not fut.done():
+            st["state"] = "running" if fut.running() else "queued"
+        elif isinstance(fut.exception(), JobCancelled):
+            st["state"] = "cancelled"
+        elif fut.exception() is not None:
+            st["state"] = "failed"
+            st["error"] = str(fut.exception())
+        else:
+            st["state"] = "done"
+        return st
+
+    def _cancel(self, task_id, fut):
+        if not fut.cancel() and not fut.done():
+            # already running, the worker checks this flag between frames
+            self._cancelled[task_id] = True
+
+    def _forget(self, task_id):
+        self._progress.pop(task_id, None)
+        if self._pool is not None:
+            self._cancelled.pop(task_id, None)
+
+    def _drop_oldest(self, entries, finished, dropped):
+        """
+        Removes the oldest finished entries of a dict (in insertion order)
+        beyond keep_finished, calling dropped(key, entry) for each.
+        """
+        done = [k for k, e in entries.items() if finished(e)]
+        for k in done[:max(0, len(done) - self.keep_finished)]:
+            dropped(k, entries.pop(k))
+
+    @staticmethod
+    def _depth(futs):
+        running = sum(1 for f in futs if f.running())
+        return {"queued": sum(1 for f in futs if not f.done()) - running, "running": running}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._progress = dict(self._progress)
+            self._manager.shutdown()
+            self._pool = None
+
+
+class JobQueue(ProcessQueue):
+    """
+    Bounded pool of processes that run preprocess_and_annotate_video.
+    submit() returns a job id right away; status() / cancel() look it up.
+    """
+
+    def __init__(self, workers=2, max_pending=32, pose_settings=None, keep_finished=KEEP_FINISHED):
+        super().__init__(workers, pose_settings, keep_finished)
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._by_key = {}
+
+    def pending(self):
+        return sum(1 for j in self._jobs.values() if not j["future"].done())
+
+    def depth(self):
+        """Jobs not finished yet, by state."""
+        return self._depth([j["future"] for j in list(self._jobs.values())])
+
+    def in_use(self):
+        """Files of the jobs not finished yet."""
+        return [p for j in list(self._jobs.values()) if not j["future"].done() for p in j["paths"]]
+
+    def submit(self, in_path, out_path, lm_path, key=None, **info):
+        """
+        Queues a video. Jobs submitted with the same key while an earlier
+        one is still queued, running or done (and its files still there)
+        share that job id.
+        """
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id and self._reusable(job_id):
+                return job_id
+            self._start()
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already queued")
+            job_id = uuid.uuid4().hex
+            self._progress[job_id] = (0, 0)
+            fut = self._pool.submit(_run_job, job_id, in_path, out_path, lm_path,
+                                    self._progress, self._cancelled)
+            job = self._jobs[job_id] = {"future": fut, "info": info, "key": key,
+                                        "paths": (in_path, out_path, lm_path)}
+            fut.add_done_callback(self._collect)
+            fut.add_done_callback(lambda _: job.update(finished=time.time()))
+            if key is not None:
+                self._by_key[key] = job_id
+            self._prune()
+        return job_id
+
+    def _reusable(self, job_id):
+        st = self.status(job_id)
+        if st is None or st["state"] not in ("queued", "running", "done"):
+            return False
+        if st["state"] == "done":
+            # the catalog may have evicted the video or landmarks since
+            lm_path = self._jobs[job_id]["paths"][2]
+            return os.path.exists(st["result"]) and os.path.exists(lm_path)
+        return True
+
+    def _prune(self):
+        """
+        Drops the oldest finished jobs beyond keep_finished, and the
+        segments of uploads finished progressive.KEEP_SECONDS ago or dropped.
+        """
+        old = time.time() - progressive.KEEP_SECONDS
+        for job in self._jobs.values():
+            if job["future"].done() and job.get("finished", old) <= old:
+                self._drop_segments(job)
+        self._drop_oldest(self._jobs, lambda job: job["future"].done(), self._dropped)
+
+    def _dropped(self, job_id, job):
+        self._drop_segments(job)
+        self._forget(job_id)
+        if self._by_key.get(job["key"]) == job_id:
+            del self._by_key[job["key"]]
+
+    @staticmethod
+    def _drop_segments(job):
+        if job["paths"] and not job.get("segments_removed"):
+            progressive.remove(os.path.splitext(job["paths"][1])[0] + ".webm")
+            job["segments_removed"] = True
+
+    def add_done(self, result, frames=0, **info):
+        """Registers a job whose output already exists (e.g. a cache hit)."""
+        fut = Future()
+        fut.set_result((result, None))
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._progress[job_id] = (frames, frames)
+            self._jobs[job_id] = {"future": fut, "info": info, "paths": (), "key": None}
+            self._prune()
+        return job_id
+
+    def status(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        fut = job["future"]
+        st = {"id": job_id, **self._state(job_id, fut), **job["info"]}
+        if st["state"] == "done":
+            st["result"] = fut.result()[0]
+        return st
+
+    @staticmethod
+    def _collect(fut):
+        # per-stage timings from the worker, so /metrics covers uploads too
+        if not fut.cancelled() and fut.exception() is None:
+            metrics.merge(fut.result()[1])
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        self._cancel(job_id, job["future"])
+        return True
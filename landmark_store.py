@@ -0,0 +1,180 @@
+"""
+Binary landmark files (.lmk), replacing the list-of-tuples pickles.
+
+Layout (little endian):
+    b"DLMK" | u16 version | u32 header length | JSON header | pad to 64
+    float32 (T, 33, 4) landmarks, NaN rows for frames with no pose
+    presence bitmap, np.packbits of T bools
+    interpolated bitmap, same packing, only if the header has
+    "interpolated": true (frames filled in by a strided pose pass)
+
+The landmark block is opened with np.memmap so readers share the page
+cache instead of each holding their own copy of the routine.
+
+    python landmark_store.py migrate uploads/
+"""
+import os
+import sys
+import json
+import glob
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b"DLMK"
+VERSION = 1
+EXT = ".lmk"
+N_LANDMARKS = 33
+_PREFIX = struct.Struct("<4sHI")
+_ALIGN = 64
+
+
+class LandmarkFile:
+    """
+    landmarks: (T, 33, 4) float32, read-only (memory mapped for .lmk)
+    present:   (T,) bool, False where no pose was found
+    interpolated: (T,) bool, True where landmarks were interpolated
+    """
+
+    def __init__(self, landmarks, present, fps=None, width=None, height=None,
+                 interpolated=None):
+        self.landmarks = landmarks
+        self.present = present
+        self.interpolated = np.zeros(len(present), bool) if interpolated is None else interpolated
+        self.fps = fps
+        self.width = width
+        self.height = height
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def __getitem__(self, i):
+        """(33, 4) view of frame i, or None like the old pickles."""
+        return self.landmarks[i] if self.present[i] else None
+
+
+def _as_array(frames):
+    if isinstance(frames, np.ndarray):
+        arr = np.asarray(frames, dtype=np.float32)
+        return arr, ~np.isnan(arr).any(axis=(1, 2))
+    arr = np.full((len(frames), N_LANDMARKS, 4), np.nan, dtype=np.float32)
+    present = np.zeros(len(frames), dtype=bool)
+    for i, fr in enumerate(frames):
+        if fr is not None:
+            arr[i] = fr
+            present[i] = True
+    return arr, present
+
+
+def save_landmarks(path, frames, fps=None, width=None, height=None, interpolated=None):
+    """
+    frames: list of 33-tuples / None, or a (T, 33, 4) array with NaN gaps.
+    interpolated: optional T bools, frames whose landmarks were not inferred.
+    """
+    arr, present = _as_array(frames)
+    meta = {
+        "frames": len(arr), "landmarks": N_LANDMARKS,
+        "fps": fps, "width": width, "height": height,
+    }
+    if interpolated is not None and np.any(interpolated):
+        meta["interpolated"] = True
+    else:
+        interpolated = None
+    header = json.dumps(meta).encode()
+    start = _PREFIX.size + len(header)
+    pad = -start % _ALIGN
+
+    # per process, two workers may be writing the same content addressed file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * pad)
+        f.write(np.ascontiguousarray(arr, dtype="<f4").tobytes())
+        f.write(np.packbits(present).tobytes())
+        if interpolated is not None:
+            f.write(np.packbits(np.asarray(interpolated, bool)).tobytes())
+    os.replace(tmp, path)
+
+
+def _load_lmk(path):
+    with open(path, "rb") as f:
+        magic, version, hlen = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a landmark file")
+        if version > VERSION:
+            raise ValueError(f"{path} has format version {version}, newest known is {VERSION}")
+        meta = json.loads(f.read(hlen))
+
+    n = meta["frames"]
+    offset = _PREFIX.size + hlen
+    offset += -offset % _ALIGN
+    shape = (n, meta["landmarks"], 4)
+    if n == 0:
+        return LandmarkFile(np.empty(shape, np.float32), np.zeros(0, bool),
+                            meta["fps"], meta["width"], meta["height"])
+
+    landmarks = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=shape)
+    bits = np.memmap(path, dtype=np.uint8, mode="r",
+                     offset=offset + landmarks.nbytes, shape=((n + 7) // 8,))
+    present = np.unpackbits(bits, count=n).astype(bool)
+    interpolated = None
+    if meta.get("interpolated"):
+        flags = np.memmap(path, dtype=np.uint8, mode="r",
+                          offset=offset + landmarks.nbytes + bits.nbytes, shape=((n + 7) // 8,))
+        interpolated = np.unpackbits(flags, count=n).astype(bool)
+    return LandmarkFile(landmarks, present, meta["fps"], meta["width"], meta["height"],
+                        interpolated)
+
+
+def load_landmarks(path):
+    """Opens a .lmk file, or a legacy .pkl (copied into memory)."""
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            arr, present = _as_array(pickle.load(f))
+        return LandmarkFile(arr, present)
+    return _load_lmk(path)
+
+
+def _video_info(video_path):
+    import cv2
+    vid = cv2.VideoCapture(video_path)
+    if not vid.isOpened():
+        return None, None, None
+    info = (vid.get(cv2.CAP_PROP_FPS) or None,
+            int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    vid.release()
+    return info
+
+
+def migrate(folder, remove=False):
+    """
+    Converts every <name>.pkl in folder to <name>.lmk, picking fps and
+    size up from <name>.mp4 when it is there. Returns the new paths.
+    """
+    done = []
+    for pkl in sorted(glob.glob(os.path.join(folder, "*.pkl"))):
+        base = os.path.splitext(pkl)[0]
+        out = base + EXT
+        if not os.path.exists(out):
+            with open(pkl, "rb") as f:
+                frames = pickle.load(f)
+            fps = width = height = None
+            for ext in (".mp4", ".mov", ".webm"):
+                if os.path.exists(base + ext):
+                    fps, width, height = _video_info(base + ext)
+                    break
+            save_landmarks(out, frames, fps, width, height)
+            done.append(out)
+        if remove:
+            os.remove(pkl)
+    return done
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "migrate":
+        sys.exit("usage: python landmark_store.py migrate <folder> [--remove]")
+    for p in migrate(sys.argv[2], remove="--remove" in sys.argv):
+        print(p)
@@ -0,0 +1,206 @@
+"""
+Landmark-only live comparison: /compare_stream.
+
+/compare_feed draws both skeletons, stacks the two frames and JPEG
+encodes them on the server, tens of kilobytes per frame per client. A
+LandmarkStream sends what the browser needs to draw that itself - the
+reference frame to show, both skeletons, the score and the feedback -
+in about 400 bytes per frame. Per session the server only scores; pose
+runs once per camera in camera.CameraBroadcaster either way.
+
+Messages, little endian:
+
+    header  u8 0 | JSON: version, fps, frames, joint names, feedback
+            texts by code, coordinate range
+    frame   u8 1 | u32 camera seq | u32 reference frame | f32 score
+            | f32 position score | u8 flags (1 webcam pose, 2 reference pose)
+            | u8 n | n x u8 feedback code
+            | J x u8 joint angle difference in degrees, 255 = not scored
+            | webcam points if flag 1 | reference points if flag 2
+
+points are 33 x (u16 x, u16 y) then 33 x u8 visibility * 255, both
+skeletons mirrored the way /compare_feed shows them; x and y are
+quantised over COORD_RANGE since landmarks can fall off the frame.
+
+format=binary (default) prefixes every message with its u32 length, for
+fetch() + a stream reader; format=sse sends the header as JSON and every
+frame base64 encoded, for EventSource. The reference plays at its own
+fps from the first camera frame on, and the frame index is in every
+message so the client can keep its video in step.
+"""
+import json
+import time
+import base64
+import struct
+import threading
+
+import numpy as np
+
+import camera
+import metrics
+import similarity
+from handoff import Closed
+from hello import generate_feedback
+from comparison import ComparisonSession, mirrored_points
+from pipeline import LatencyStats
+
+VERSION = 1
+COORD_RANGE = (-1.0, 2.0)
+HEADER, FRAME = 0, 1
+HAS_CAM, HAS_REF = 1, 2
+NOT_SCORED = 255
+
+# every text generate_feedback can produce, indexed by its code
+FEEDBACK = ["Nice! Form looks good!", "Body position off"] + [
+    f"{name}: {hint}"
+    for name in similarity.JOINT_NAMES
+    for hint in (("bend more", "straighten") if "Elbow" in name else ("lower arm", "raise arm"))
+]
+_CODES = {msg: i for i, msg in enumerate(FEEDBACK)}
+
+_FRAME = struct.Struct("<BIIffB")
+_LEN = struct.Struct("<I")
+_SCALE = 65535 / (COORD_RANGE[1] - COORD_RANGE[0])
+
+_t_similarity = metrics.timer("stream", "similarity")
+_t_pack = metrics.timer("stream", "pack")
+
+
+def pack_points(pts):
+    xy = np.clip((np.asarray(pts)[:, :2] - COORD_RANGE[0]) * _SCALE, 0, 65535)
+    vis = np.clip(np.asarray(pts)[:, 3] * 255, 0, 255)
+    return (np.rint(xy).astype("<u2").tobytes()
+            + np.rint(np.nan_to_num(vis)).astype(np.uint8).tobytes())
+
+
+def unpack_points(buf, offset=0):
+    """(33, 3) float32 x, y, visibility from pack_points output, and the new offset."""
+    n = similarity.N_LANDMARKS
+    xy = np.frombuffer(buf, "<u2", n * 2, offset).reshape(n, 2) / _SCALE + COORD_RANGE[0]
+    vis = np.frombuffer(buf, np.uint8, n, offset + n * 4) / 255
+    return np.column_stack([xy, vis]).astype(np.float32), offset + n * 5
+
+
+def header(fps, frames):
+    return {"version": VERSION, "fps": fps, "frames": frames,
+            "joints": similarity.JOINT_NAMES, "feedback": FEEDBACK,
+            "coord_range": COORD_RANGE}
+
+
+def pack_header(fps, frames):
+    return bytes([HEADER]) + json.dumps(header(fps, frames)).encode()
+
+
+def pack_frame(seq, ref_idx, score, pos_sim, feedback, angle_diff, cam=None, ref=None):
+    """angle_diff: per joint in similarity.JOINTS, NaN where not scored."""
+    flags = (HAS_CAM if cam is not None else 0) | (HAS_REF if ref is not None else 0)
+    codes = [_CODES.get(msg, NOT_SCORED) for msg in feedback]
+    diffs = np.where(np.isnan(angle_diff), NOT_SCORED, np.clip(np.nan_to_num(angle_diff), 0, 254))
+    out = [_FRAME.pack(FRAME, seq, ref_idx, score, pos_sim, flags),
+           bytes([len(codes)] + codes), np.rint(diffs).astype(np.uint8).tobytes()]
+    if cam is not None:
+        out.append(pack_points(cam))
+    if ref is not None:
+        out.append(pack_points(ref))
+    return b"".join(out)
+
+
+def unpack(msg):
+    """Decodes one message (without its length prefix) into a dict."""
+    if msg[0] == HEADER:
+        return {"type": "header", **json.loads(msg[1:])}
+    _, seq, ref_idx, score, pos_sim, flags = _FRAME.unpack_from(msg)
+    off = _FRAME.size
+    n = msg[off]
+    codes = list(msg[off + 1:off + 1 + n])
+    off += 1 + n
+    j = len(similarity.JOINTS)
+    diffs = [None if d == NOT_SCORED else int(d) for d in msg[off:off + j]]
+    off += j
+    out = {"type": "frame", "seq": seq, "reference_frame": ref_idx, "score": score,
+           "pos_sim": pos_sim, "feedback": [FEEDBACK[c] if c < len(FEEDBACK) else None for c in codes],
+           "angle_diff": diffs, "webcam": None, "reference": None}
+    if flags & HAS_CAM:
+        out["webcam"], off = unpack_points(msg, off)
+    if flags & HAS_REF:
+        out["reference"], off = unpack_points(msg, off)
+    return out
+
+
+class LandmarkStream:
+    """
+    One /compare_stream session. Iterate messages() for packed messages;
+    stop() unsubscribes from the camera. Has the same status() as a
+    ComparisonPipeline so /sessions lists both.
+    """
+
+    def __init__(self, reference, camera_source=None):
+        self.session = ComparisonSession(reference)
+        self.fps = self.session.reference.fps or 30
+        self.stats = LatencyStats()
+        self.bytes_sent = 0
+        self._sub = camera.subscribe(camera_source)
+        self._stop = threading.Event()
+
+    def messages(self):
+        msg = pack_header(self.fps, len(self.session.reference))
+        self.bytes_sent += len(msg)
+        yield msg
+        start = None
+        while not self._stop.is_set():
+            try:
+                frame = self._sub.get(timeout=0.5)
+            except TimeoutError:
+                continue
+            except Closed:
+                break
+            if start is None:
+                start = frame.captured_at
+            # the reference keeps its own pace, whatever the camera's fps
+            idx = int((frame.captured_at - start) * self.fps)
+
+            t0 = time.perf_counter()
+            cam = mirrored_points(frame.landmarks)
+            ref, cam_f, avg = self.session.evaluate(cam, idx)
+            s = self.session
+            t1 = time.perf_counter()
+            diff = np.full(len(similarity.JOINTS), np.nan)
+            if ref is not None and cam_f is not None:
+                for k, name in enumerate(similarity.JOINT_NAMES):
+                    if name in s.angle_data:
+                        diff[k] = s.angle_data[name]["diff"]
+            msg = pack_frame(frame.seq, s.idx, avg, s.pos_sim,
+                             generate_feedback(s.angle_data, s.pos_sim), diff,
+                             cam, ref.points if ref is not None else None)
+            _t_similarity.observe(t1 - t0)
+            _t_pack.observe(time.perf_counter() - t1)
+
+            self.stats.record(frame.captured_at)
+            self.bytes_sent += len(msg)
+            yield msg
+
+    def binary(self):
+        """messages() with a u32 length in front of each."""
+        for msg in self.messages():
+            yield _LEN.pack(len(msg)) + msg
+
+    def sse(self):
+        """messages() as Server-Sent Events."""
+        for msg in self.messages():
+            if msg[0] == HEADER:
+                yield b"event: header\ndata: " + msg[1:] + b"\n\n"
+            else:
+                yield b"event: frame\ndata: " + base64.b64encode(msg) + b"\n\n"
+
+    def stop(self):
+        self._stop.set()
+        self._sub.close()
+        self.session.close()
+
+    def status(self):
+        st = self.stats.summary()
+        st["dropped"] = {"camera": self._sub.dropped}
+        st["reference_frame"] = self.session.idx
+        st["score"] = round(self.session.avg, 3)
+        st["bytes_per_frame"] = round(self.bytes_sent / max(1, self.stats.frames), 1)
+        return st
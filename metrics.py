@@ -0,0 +1,182 @@
+"""
+Per-stage timers for the frame loops, served in Prometheus text format.
+
+Every (pipeline, stage) pair - ("compare", "encode"), ("preprocess",
+"pose"), ... - gets a StageTimer. A timer keeps a cumulative histogram
+(what Prometheus wants: rate() over it gives any window) and the last
+WINDOW observations, from which /metrics also reports p50/p90/p99 of the
+recent frames without a Prometheus server in between.
+
+Hot loops resolve their timers once and then only pay for
+time.perf_counter() and observe(), about a microsecond:
+
+    _t_pose = metrics.timer("preprocess", "pose")
+    ...
+    t = time.perf_counter()
+    res = pose.process(rgb)
+    _t_pose.observe(time.perf_counter() - t)
+
+Upload jobs run in worker processes; they send snapshot() back with their
+result and the web process merge()s it, so /metrics covers them too.
+"""
+import bisect
+import threading
+
+import numpy as np
+
+# seconds, upper bounds of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+WINDOW = 512
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class StageTimer:
+    __slots__ = ("counts", "sum", "count", "recent", "_lock")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(BUCKETS) + 1)
+            self.sum = 0.0
+            self.count = 0
+            self.recent = np.zeros(WINDOW)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.sum += seconds
+            self.recent[self.count % WINDOW] = seconds
+            self.count += 1
+
+    def quantiles(self, qs=QUANTILES):
+        with self._lock:
+            recent = self.recent[:min(self.count, WINDOW)].copy()
+        if not len(recent):
+            return [float("nan")] * len(qs)
+        return np.quantile(recent, qs).tolist()
+
+    def snapshot(self):
+        with self._lock:
+            n = min(self.count, WINDOW)
+            # oldest first, so merging keeps the window order
+            recent = np.roll(self.recent, -(self.count % WINDOW))[-n:] if n == WINDOW else self.recent[:n]
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count,
+                    "recent": recent.tolist()}
+
+    def merge(self, snap):
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, snap["counts"])]
+            self.sum += snap["sum"]
+            for v in snap["recent"][-WINDOW:]:
+                self.recent[self.count % WINDOW] = v
+                self.count += 1
+            # count is the true total, not just what fitted in the window
+            self.count += snap["count"] - len(snap["recent"][-WINDOW:])
+
+
+def _labels(d):
+    if not d:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(d.items())) + "}"
+
+
+def _num(v):
+    if v != v:
+        return "NaN"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Registry:
+
+    def __init__(self):
+        self._timers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def timer(self, pipeline, stage):
+        key = (pipeline, stage)
+        t = self._timers.get(key)
+        if t is None:
+            with self._lock:
+                t = self._timers.setdefault(key, StageTimer())
+        return t
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self):
+        with self._lock:
+            timers, counters = dict(self._timers), dict(self._counters)
+        return {"timers": [[p, s, t.snapshot()] for (p, s), t in timers.items()],
+                "counters": [[n, list(l), v] for (n, l), v in counters.items()]}
+
+    def merge(self, snap):
+        for p, s, t in snap["timers"]:
+            self.timer(p, s).merge(t)
+        for n, labels, v in snap["counters"]:
+            self.inc(n, v, **dict(labels))
+
+    def reset(self):
+        """Zeroes everything in place; modules keep the timers they resolved."""
+        with self._lock:
+            timers = list(self._timers.values())
+            self._counters.clear()
+        for t in timers:
+            t.reset()
+
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition. gauges: (name, help, [(labels, value)])
+        tuples computed by the caller at scrape time.
+        """
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+
+        out = ["# HELP dance_stage_seconds Time per frame spent in each stage.",
+               "# TYPE dance_stage_seconds histogram"]
+        for (p, s), t in timers:
+            lab = {"pipeline": p, "stage": s}
+            cum = 0
+            for bound, c in zip(BUCKETS + ("+Inf",), t.counts):
+                cum += c
+                out.append(f"dance_stage_seconds_bucket{_labels({**lab, 'le': bound})} {cum}")
+            out.append(f"dance_stage_seconds_sum{_labels(lab)} {_num(t.sum)}")
+            out.append(f"dance_stage_seconds_count{_labels(lab)} {t.count}")
+
+        out += [f"# HELP dance_stage_recent_seconds Quantiles over the last {WINDOW} frames per stage.",
+                "# TYPE dance_stage_recent_seconds gauge"]
+        for (p, s), t in timers:
+            for q, v in zip(QUANTILES, t.quantiles()):
+                out.append(f"dance_stage_recent_seconds{_labels({'pipeline': p, 'stage': s, 'quantile': q})} {_num(v)}")
+
+        seen = set()
+        for (name, labels), v in counters:
+            if name not in seen:
+                seen.add(name)
+                out.append(f"# TYPE {name} counter")
+            out.append(f"{name}{_labels(dict(labels))} {_num(v)}")
+
+        for name, help_text, samples in gauges:
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, v in samples:
+                out.append(f"{name}{_labels(labels)} {_num(v)}")
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+timer = registry.timer
+inc = registry.inc
+snapshot = registry.snapshot
+merge = registry.merge
+reset = registry.reset
+render = registry.render
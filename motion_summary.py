@@ -0,0 +1,174 @@
+"""
+A compact summary of a whole routine for /generate_feedback.
+
+One pass over a landmark file in CHUNK frame blocks (a .lmk is memory
+mapped, so a long routine never sits in memory as float64 at once):
+
+  angles      per joint in JOINTS: mean, std, min, max, range of motion,
+              fraction of frames it was visible
+  symmetry    mean |left - right| angle for every left/right pair
+  stability   sway and bounce of the hip centre and torso lean, in
+              shoulder widths / degrees
+  motion      per-frame movement of the visible landmarks; its mean, and
+              the busiest second
+  keyframes   KEYFRAMES held poses spread over the routine (the stillest
+              frame of each equal window) with their joint angles
+
+A few hundred bytes of JSON however long the clip is, in place of raw
+landmarks.
+"""
+import warnings
+
+import numpy as np
+
+import similarity
+
+VERSION = 1
+CHUNK = 2048
+KEYFRAMES = 6
+# what files without an fps (old .pkl landmarks) are summarized at
+DEFAULT_FPS = 30
+
+# (a, b, c, name): angle at b, like similarity.JOINTS but the whole body
+JOINTS = similarity.JOINTS + [
+    (23, 25, 27, "Left Knee"),
+    (24, 26, 28, "Right Knee"),
+    (11, 23, 25, "Left Hip"),
+    (12, 24, 26, "Right Hip"),
+]
+JOINT_NAMES = [j[3] for j in JOINTS]
+PAIRS = [(JOINT_NAMES.index(n), JOINT_NAMES.index("Right" + n[4:]), n[5:])
+         for n in JOINT_NAMES if n.startswith("Left")]
+_A, _B, _C = (np.array([j[i] for j in JOINTS]) for i in range(3))
+
+_L_SHOULDER, _R_SHOULDER, _L_HIP, _R_HIP = 11, 12, 23, 24
+
+
+def _angles(arr):
+    """(T, len(JOINTS)) angles in degrees, NaN where a joint is not visible."""
+    ba = arr[:, _A, :2] - arr[:, _B, :2]
+    bc = arr[:, _C, :2] - arr[:, _B, :2]
+    m = np.hypot(ba[..., 0], ba[..., 1]) * np.hypot(bc[..., 0], bc[..., 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ang = np.degrees(np.arccos(np.clip((ba * bc).sum(-1) / m, -1.0, 1.0)))
+    vis = similarity.visible(arr)
+    return np.where(vis[:, _A] & vis[:, _B] & vis[:, _C] & (m > 0), ang, np.nan)
+
+
+def _centre(arr, a, b):
+    """Midpoint of landmarks a and b, NaN unless both are visible."""
+    vis = similarity.visible(arr)
+    mid = (arr[:, a, :2] + arr[:, b, :2]) / 2
+    return np.where((vis[:, a] & vis[:, b])[:, None], mid, np.nan)
+
+
+def _r(v, nd=1):
+    v = float(v)
+    return None if np.isnan(v) else round(v, nd)
+
+
+def _nanstats(x, axis=0):
+    # all-NaN columns (a joint never seen) warn, their NaN is what we want
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return (np.nanmean(x, axis), np.nanstd(x, axis), np.nanmin(x, axis), np.nanmax(x, axis))
+
+
+def per_frame(landmarks):
+    """
+    The per-frame series summarize() reduces: joint angles, hip centre and
+    torso lean (both scaled by shoulder width) and motion, computed a
+    chunk at a time. landmarks is a (T, 33, 4) array (NaN for no pose).
+    """
+    n = len(landmarks)
+    angles = np.empty((n, len(JOINTS)), np.float32)
+    hip = np.empty((n, 2), np.float32)
+    lean = np.empty(n, np.float32)
+    motion = np.full(n, np.nan, np.float32)
+    prev = None
+    for s in range(0, n, CHUNK):
+        arr = np.asarray(landmarks[s:s + CHUNK], np.float64)
+        # the previous chunk's last frame, so motion is continuous across chunks
+        ext = arr if prev is None else np.concatenate([prev, arr])
+        scale = similarity.body_scale(arr)
+        angles[s:s + len(arr)] = _angles(arr)
+
+        hc = _centre(arr, _L_HIP, _R_HIP)
+        sc = _centre(arr, _L_SHOULDER, _R_SHOULDER)
+        hip[s:s + len(arr)] = hc / scale[:, None]
+        torso = sc - hc
+        # 0 = upright, positive leaning to the image right
+        lean[s:s + len(arr)] = np.degrees(np.arctan2(torso[:, 0], -torso[:, 1]))
+
+        vis = similarity.visible(ext)
+        both = vis[1:] & vis[:-1]
+        step = np.linalg.norm(ext[1:, :, :2] - ext[:-1, :, :2], axis=-1)
+        with np.errstate(invalid="ignore"):
+            m = np.where(both, step, 0).sum(-1) / both.sum(-1)
+        m = m / similarity.body_scale(ext[1:])
+        if prev is None:
+            motion[s + 1:s + len(arr)] = m
+        else:
+            motion[s:s + len(arr)] = m
+        prev = arr[-1:]
+    return angles, hip, lean, motion
+
+
+def summarize(lm, keyframes=KEYFRAMES):
+    """lm: a landmark_store.LandmarkFile. Returns a JSON-able dict."""
+    fps = lm.fps or DEFAULT_FPS
+    n = len(lm)
+    out = {"version": VERSION, "frames": n, "seconds": round(n / fps, 2),
+           "pose_found": round(float(lm.present.mean()), 3) if n else 0.0}
+    if not lm.present.any():
+        return out
+
+    angles, hip, lean, motion = per_frame(lm.landmarks)
+
+    mean, std, lo, hi = _nanstats(angles)
+    seen = (~np.isnan(angles)).mean(0)
+    out["angles"] = {
+        name: {"mean": _r(mean[k]), "std": _r(std[k]), "min": _r(lo[k]), "max": _r(hi[k]),
+               "range": _r(hi[k] - lo[k]), "visible": round(float(seen[k]), 2)}
+        for k, name in enumerate(JOINT_NAMES) if seen[k] > 0
+    }
+
+    sym = {}
+    for l, r, name in PAIRS:
+        d = np.abs(angles[:, l] - angles[:, r])
+        if (~np.isnan(d)).any():
+            sym[name] = _r(np.nanmean(d))
+    out["symmetry_deg"] = sym
+
+    _, hip_std, _, _ = _nanstats(hip)
+    lean_mean, lean_std, _, _ = _nanstats(lean)
+    out["stability"] = {"sway": _r(hip_std[0], 3), "bounce": _r(hip_std[1], 3),
+                        "lean_deg": _r(lean_mean), "lean_std_deg": _r(lean_std)}
+
+    if (~np.isnan(motion)).any():
+        win = max(1, int(round(fps)))
+        filled = np.nan_to_num(motion)
+        per_sec = np.convolve(filled, np.ones(win), "valid")
+        busiest = int(np.argmax(per_sec)) if len(per_sec) else 0
+        # shoulder widths per second
+        out["motion"] = {"mean": _r(np.nanmean(motion) * fps, 3),
+                         "busiest_second": round(busiest / fps, 2)}
+
+    out["keyframes"] = _keyframes(angles, motion, lm.present, fps, keyframes)
+    return out
+
+
+def _keyframes(angles, motion, present, fps, k):
+    """The stillest frame with a pose in each of k equal windows."""
+    stillness = np.where(present & ~np.isnan(motion), motion, np.inf)
+    keys = []
+    for w in np.array_split(np.arange(len(present)), min(k, len(present))):
+        if not present[w].any():
+            continue
+        # frames without a motion value (after a gap) still count as poses
+        i = int(w[np.argmin(stillness[w])]) if np.isfinite(stillness[w]).any() \
+            else int(w[np.argmax(present[w])])
+        keys.append({"t": round(i / fps, 2),
+                     "angles": {name: _r(angles[i, j]) for j, name in enumerate(JOINT_NAMES)
+                                if not np.isnan(angles[i, j])}})
+    return keys
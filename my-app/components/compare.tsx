@@ -2,6 +2,7 @@
 
 import { useState, ChangeEvent } from "react"
 import { Button } from "@/components/ui/button"
+import { waitForJob } from "@/lib/jobs"
 
 const API_BASE = "http://localhost:5000"  // <-- adjust if your Flask is elsewhere
 
@@ -31,7 +32,7 @@ export function CompareSection() {
         const err = await res.json()
         throw new Error(err.error || res.statusText)
       }
-      const data = await res.json()
+      const data = await waitForJob((await res.json()).status_url)
       const raw  = encodeURIComponent(data.raw_filename)
       const pkl  = encodeURIComponent(data.landmarks_filename)
       setStreamUrl(`${API_BASE}/compare_feed?video=${raw}&landmarks=${pkl}`)
@@ -1,9 +1,11 @@
 // UploadSection.tsx (React component)
-import { useState, useRef } from "react"
+import { useState, useRef, useEffect } from "react"
 import { FileVideo, Upload, CheckCircle, ArrowRight } from "lucide-react"
 import { Progress } from "@/components/ui/progress"
 import { Button } from "@/components/ui/button"
 import { motion } from "framer-motion"
+import { waitForJob } from "@/lib/jobs"
+import { canPlaySegments, playSegments } from "@/lib/segments"
 
 interface UploadSectionProps {
   onVideoUploaded: (videoUrl: string) => void
@@ -17,6 +19,18 @@ export function UploadSection({ onVideoUploaded }: UploadSectionProps) {
   const [error, setError] = useState<string | null>(null)
   const [previewUrl, setPreviewUrl] = useState<string | null>(null)
   const fileInputRef = useRef<HTMLInputElement>(null)
+  // segments of the annotated video, played while the rest is processed
+  const [manifestUrl, setManifestUrl] = useState<string | null>(null)
+  const liveVideoRef = useRef<HTMLVideoElement>(null)
+
+  useEffect(() => {
+    if (!manifestUrl || !liveVideoRef.current) return
+    const controller = new AbortController()
+    playSegments(liveVideoRef.current, manifestUrl, controller.signal).catch((err) => {
+      if (!controller.signal.aborted) console.error(err)
+    })
+    return () => controller.abort()
+  }, [manifestUrl])
 
   const handleDragOver = (e: React.DragEvent) => {
     e.preventDefault()
@@ -59,7 +73,11 @@ export function UploadSection({ onVideoUploaded }: UploadSectionProps) {
         body: formData,
       })
       if (!resp.ok) throw new Error("Upload failed " + resp.status)
-      const { video_url } = await resp.json()
+      const { status_url, manifest_url } = await resp.json()
+      if (manifest_url && canPlaySegments()) setManifestUrl(manifest_url)
+      const { video_url } = await waitForJob(status_url, (job) => {
+        if (job.frames_total) setUploadProgress(Math.floor((99 * job.frames_done) / job.frames_total))
+      })
 
       // Fetch the processed video as a Blob
       const mp4resp = await fetch(video_url)
@@ -75,6 +93,7 @@ export function UploadSection({ onVideoUploaded }: UploadSectionProps) {
       console.error(err)
       setError("Failed: " + err.message)
     } finally {
+      setManifestUrl(null)
       setIsUploading(false)
     }
   }
@@ -168,6 +187,11 @@ export function UploadSection({ onVideoUploaded }: UploadSectionProps) {
               <h3 className="text-lg font-jakarta font-medium text-[#333333] mb-6">
                 Uploading and processing video...
               </h3>
+              {manifestUrl && (
+                <div className="w-full max-w-md mb-6 aspect-video rounded-lg overflow-hidden bg-black">
+                  <video ref={liveVideoRef} className="w-full h-full object-contain" controls autoPlay muted />
+                </div>
+              )}
               <div className="w-full max-w-md mb-4">
                 <Progress value={uploadProgress} className="h-1" />
               </div>
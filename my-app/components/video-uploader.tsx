@@ -2,6 +2,7 @@ import { useState } from "react"
 import { Card, CardContent } from "@/components/ui/card"
 import { Button } from "@/components/ui/button"
 import { Upload, FileVideo } from "lucide-react"
+import { waitForJob } from "@/lib/jobs"
 
 interface VideoUploaderProps {
   onVideoUploaded: (videoUrl: string, landmarkUrl: string) => void
@@ -52,8 +53,10 @@ export function VideoUploader({ onVideoUploaded }: VideoUploaderProps) {
         throw new Error(result.error)
       }
 
+      const job = await waitForJob(result.status_url)
+
       // Once processed, pass the video URL and landmark file URL to next stage.
-      onVideoUploaded(result.video_url, result.landmark_url)
+      onVideoUploaded(job.video_url!, result.landmark_url)
     } catch (err: any) {
       console.error("Error uploading and processing video:", err)
       alert("Failed to process video: " + err.message)
@@ -0,0 +1,29 @@
+export interface UploadJob {
+  id: string
+  state: "queued" | "running" | "done" | "failed" | "cancelled"
+  frames_done: number
+  frames_total: number
+  raw_filename: string
+  landmarks_filename: string
+  video_url?: string
+  error?: string
+}
+
+// Polls /jobs/<id> until the upload has been processed.
+export async function waitForJob(
+  statusUrl: string,
+  onProgress?: (job: UploadJob) => void,
+  intervalMs = 1000,
+): Promise<UploadJob> {
+  while (true) {
+    const resp = await fetch(statusUrl)
+    const job: UploadJob = await resp.json()
+    if (!resp.ok) throw new Error(job.error || "Job lookup failed " + resp.status)
+    onProgress?.(job)
+    if (job.state === "done") return job
+    if (job.state === "failed" || job.state === "cancelled") {
+      throw new Error(job.error || "Processing " + job.state)
+    }
+    await new Promise((r) => setTimeout(r, intervalMs))
+  }
+}
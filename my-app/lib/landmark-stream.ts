@@ -0,0 +1,114 @@
+// Client for /compare_stream (binary format), see landmark_stream.py for the layout.
+
+export interface StreamHeader {
+  version: number
+  fps: number
+  frames: number
+  joints: string[]
+  feedback: string[]
+  coord_range: [number, number]
+}
+
+// x, y normalised to the frame, visibility 0..1; already mirrored for display
+export interface Point {
+  x: number
+  y: number
+  visibility: number
+}
+
+export interface StreamFrame {
+  seq: number
+  referenceFrame: number
+  score: number
+  posSim: number
+  feedback: string[]
+  angleDiff: (number | null)[] // per header.joints, null when not scored
+  webcam: Point[] | null
+  reference: Point[] | null
+}
+
+const N_LANDMARKS = 33
+const HAS_CAM = 1
+const HAS_REF = 2
+const NOT_SCORED = 255
+
+function readPoints(view: DataView, offset: number, range: [number, number]): Point[] {
+  const scale = (range[1] - range[0]) / 65535
+  const pts: Point[] = []
+  for (let i = 0; i < N_LANDMARKS; i++) {
+    pts.push({
+      x: view.getUint16(offset + i * 4, true) * scale + range[0],
+      y: view.getUint16(offset + i * 4 + 2, true) * scale + range[0],
+      visibility: view.getUint8(offset + N_LANDMARKS * 4 + i) / 255,
+    })
+  }
+  return pts
+}
+
+export function decodeFrame(msg: Uint8Array, header: StreamHeader): StreamFrame {
+  const view = new DataView(msg.buffer, msg.byteOffset, msg.byteLength)
+  const flags = view.getUint8(17)
+  let off = 18
+  const n = view.getUint8(off++)
+  const feedback = Array.from(msg.subarray(off, off + n), (c) => header.feedback[c] ?? "")
+  off += n
+  const angleDiff = Array.from(msg.subarray(off, off + header.joints.length), (d) =>
+    d === NOT_SCORED ? null : d,
+  )
+  off += header.joints.length
+  const frame: StreamFrame = {
+    seq: view.getUint32(1, true),
+    referenceFrame: view.getUint32(5, true),
+    score: view.getFloat32(9, true),
+    posSim: view.getFloat32(13, true),
+    feedback,
+    angleDiff,
+    webcam: null,
+    reference: null,
+  }
+  if (flags & HAS_CAM) {
+    frame.webcam = readPoints(view, off, header.coord_range)
+    off += N_LANDMARKS * 5
+  }
+  if (flags & HAS_REF) {
+    frame.reference = readPoints(view, off, header.coord_range)
+  }
+  return frame
+}
+
+// Reads /compare_stream until it ends or signal aborts.
+export async function readLandmarkStream(
+  url: string,
+  onHeader: (header: StreamHeader) => void,
+  onFrame: (frame: StreamFrame, header: StreamHeader) => void,
+  signal?: AbortSignal,
+): Promise<void> {
+  const resp = await fetch(url, { signal })
+  if (!resp.ok || !resp.body) throw new Error("Stream failed " + resp.status)
+  const reader = resp.body.getReader()
+  let buf = new Uint8Array(0)
+  let header: StreamHeader | null = null
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) return
+    const joined = new Uint8Array(buf.length + value.length)
+    joined.set(buf)
+    joined.set(value, buf.length)
+    buf = joined
+
+    // every message is a u32 length and then the message
+    while (buf.length >= 4) {
+      const len = new DataView(buf.buffer, buf.byteOffset).getUint32(0, true)
+      if (buf.length < 4 + len) break
+      const msg = buf.subarray(4, 4 + len)
+      buf = buf.subarray(4 + len)
+      if (msg[0] === 0) {
+        header = JSON.parse(new TextDecoder().decode(msg.subarray(1)))
+        onHeader(header!)
+      } else if (header) {
+        onFrame(decodeFrame(msg, header), header)
+      }
+    }
+  }
+}
@@ -0,0 +1,90 @@
+// Plays an upload while it is still being processed, see progressive.py for the manifest.
+
+export interface Segment {
+  file: string
+  start: number
+  duration: number
+  frames: number
+}
+
+export interface Manifest {
+  version: number
+  fps: number
+  width: number
+  height: number
+  segments: Segment[]
+  complete: boolean
+  video: string | null
+  // set by the server once complete
+  video_url?: string
+}
+
+const POLL_MS = 1000
+const MIME = 'video/webm; codecs="vp8"'
+
+export function canPlaySegments(): boolean {
+  return typeof MediaSource !== "undefined" && MediaSource.isTypeSupported(MIME)
+}
+
+function appended(buffer: SourceBuffer): Promise<void> {
+  return new Promise((resolve, reject) => {
+    buffer.addEventListener("updateend", () => resolve(), { once: true })
+    buffer.addEventListener("error", () => reject(new Error("appendBuffer failed")), { once: true })
+  })
+}
+
+// Switches video to the stitched file, at the position it was playing.
+function switchTo(video: HTMLVideoElement, url: string): Promise<void> {
+  const at = video.currentTime
+  const playing = !video.paused
+  video.src = url
+  return new Promise((resolve) => {
+    video.addEventListener(
+      "loadedmetadata",
+      () => {
+        video.currentTime = at
+        if (playing) video.play().catch(() => {})
+        resolve()
+      },
+      { once: true },
+    )
+  })
+}
+
+// Appends segments to video as the manifest lists them, until it is complete
+// or signal aborts, then switches to the stitched video. Resolves with the
+// final manifest.
+export async function playSegments(
+  video: HTMLVideoElement,
+  manifestUrl: string,
+  signal?: AbortSignal,
+): Promise<Manifest> {
+  const base = manifestUrl.slice(0, manifestUrl.lastIndexOf("/") + 1)
+  const source = new MediaSource()
+  const sourceUrl = URL.createObjectURL(source)
+  video.src = sourceUrl
+  await new Promise((resolve) => source.addEventListener("sourceopen", resolve, { once: true }))
+  const buffer = source.addSourceBuffer(MIME)
+  // every segment starts at 0, so play them back to back
+  buffer.mode = "sequence"
+
+  let next = 0
+  while (true) {
+    const resp = await fetch(manifestUrl, { signal, cache: "no-store" })
+    if (!resp.ok) throw new Error("Manifest failed " + resp.status)
+    const manifest: Manifest = await resp.json()
+    if (manifest.complete && manifest.video_url) {
+      await switchTo(video, manifest.video_url)
+      URL.revokeObjectURL(sourceUrl)
+      return manifest
+    }
+    for (; next < manifest.segments.length; next++) {
+      const seg = await fetch(base + manifest.segments[next].file, { signal })
+      if (!seg.ok) throw new Error("Segment failed " + seg.status)
+      const done = appended(buffer)
+      buffer.appendBuffer(await seg.arrayBuffer())
+      await done
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_MS))
+  }
+}
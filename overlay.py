@@ -0,0 +1,139 @@
+"""
+Skeleton and text overlays, drawn in batches.
+
+Pose landmarks go to pixel coordinates once per frame for the whole
+skeleton, limbs get their colour from a table built once from
+POSE_CONNECTIONS, and every colour is one cv2.polylines call instead of
+one cv2.line per limb. draw_landmarks() draws what mediapipe's
+drawing_utils.draw_landmarks draws, pixel for pixel, from a (33, 4)
+array.
+
+Text stays cv2.putText: a few short lines a frame cost 10-25 us each,
+and blending a cached, anti-aliased text layer back in over a new frame
+measured slower than drawing it again.
+
+The comparison overlays (hello.draw_colored_skeleton, comparison.py,
+the annotated uploads, /video_feed) all draw through here.
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+import similarity
+
+VIS_THRESH = similarity.VIS_THRESH
+LINE = 2
+
+GRAY = (200, 200, 200)
+GREEN = (0, 255, 0)
+ORANGE = (0, 165, 255)
+RED = (0, 0, 255)
+# a limb is GREEN below the first angle difference, ORANGE below the
+# second, RED above; limbs of joints not scored are GRAY
+THRESHOLDS = (32, 45)
+_COLORS = (GRAY, GREEN, ORANGE, RED)
+
+# the joint whose angle colours a limb, both ways round
+LIMB_JOINTS = {
+    (11, 13): "Left Elbow",     (13, 15): "Left Elbow",
+    (12, 14): "Right Elbow",    (14, 16): "Right Elbow",
+    (13, 11): "Left Shoulder",  (11, 23): "Left Shoulder",
+    (14, 12): "Right Shoulder", (12, 24): "Right Shoulder",
+}
+
+# mediapipe's DrawingSpec defaults; its "white" point border is 224 too
+_MP_LINE = ((224, 224, 224), 2)
+_MP_POINT = ((0, 0, 255), 2, 2)
+_BORDER = (224, 224, 224)
+
+
+@lru_cache(maxsize=None)
+def connections():
+    """
+    (C, 2) landmark pairs of POSE_CONNECTIONS, and per pair the index in
+    similarity.JOINT_NAMES of the joint that colours it (-1 for none).
+    """
+    import mediapipe as mp
+    pairs = np.array(sorted(mp.solutions.pose.POSE_CONNECTIONS), np.intp)
+    joints = [LIMB_JOINTS.get((a, b)) or LIMB_JOINTS.get((b, a)) for a, b in pairs.tolist()]
+    part = np.array([similarity.JOINT_NAMES.index(j) if j else -1 for j in joints], np.intp)
+    return pairs, part
+
+
+@lru_cache(maxsize=None)
+def landmark_style(name):
+    """
+    Per landmark (colour, thickness, radius) for draw_landmarks: "plain"
+    is drawing_utils' default spec, "pose" get_default_pose_landmarks_style().
+    """
+    if name == "plain":
+        return (_MP_POINT,) * similarity.N_LANDMARKS
+    import mediapipe as mp
+    style = mp.solutions.drawing_styles.get_default_pose_landmarks_style()
+    return tuple((style[i].color, style[i].thickness, style[i].circle_radius)
+                 for i in range(similarity.N_LANDMARKS))
+
+
+def to_pixels(pts, w, h):
+    """(33, 2) int32 pixel coordinates truncated like int(x * w), NaN -> 0."""
+    xy = np.nan_to_num(np.asarray(pts, np.float64)[:, :2]) * (w, h)
+    return xy.astype(np.int32)
+
+
+def _diffs(angle_data):
+    d = np.full(len(similarity.JOINT_NAMES) + 1, np.nan)
+    for k, name in enumerate(similarity.JOINT_NAMES):
+        if name in angle_data:
+            d[k] = angle_data[name]["diff"]
+    # index -1 (no joint) stays NaN
+    return d
+
+
+def draw_skeleton(frame, pts, angle_data=None):
+    """
+    Limbs between visible landmarks, coloured by how far their joint's
+    angle is off (angle_data as from similarity.Similarity.angle_data).
+    pts: (33, 4) array. Worse limbs are drawn over better ones.
+    """
+    pairs, part = connections()
+    pts = np.asarray(pts)
+    h, w = frame.shape[:2]
+    xy = to_pixels(pts, w, h)
+    vis = pts[:, 3] > VIS_THRESH
+    ok = vis[pairs[:, 0]] & vis[pairs[:, 1]]
+
+    diff = _diffs(angle_data or {})[part]
+    with np.errstate(invalid="ignore"):
+        cls = np.where(np.isnan(diff), 0, 1 + np.searchsorted(THRESHOLDS, diff, side="right"))
+    segs = xy[pairs]
+    for c, color in enumerate(_COLORS):
+        sel = ok & (cls == c)
+        if sel.any():
+            cv2.polylines(frame, list(segs[sel]), False, color, LINE)
+
+
+def draw_landmarks(frame, pts, style="plain"):
+    """
+    What mediapipe's draw_landmarks(frame, lm, POSE_CONNECTIONS, ...) draws
+    for the same landmarks as a (33, 4) array; style as in landmark_style.
+    """
+    pairs, _ = connections()
+    pts = np.asarray(pts, np.float64)
+    h, w = frame.shape[:2]
+    x, y = pts[:, 0], pts[:, 1]
+    with np.errstate(invalid="ignore"):
+        ok = ~(pts[:, 3] < VIS_THRESH) & (x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)
+    px = np.minimum(np.floor(np.nan_to_num(x) * w), w - 1).astype(np.int32)
+    py = np.minimum(np.floor(np.nan_to_num(y) * h), h - 1).astype(np.int32)
+    xy = np.stack([px, py], 1)
+
+    sel = ok[pairs[:, 0]] & ok[pairs[:, 1]]
+    if sel.any():
+        cv2.polylines(frame, list(xy[pairs[sel]]), False, *_MP_LINE)
+    # per point, in order: a point's border may cover the one before
+    for i in np.flatnonzero(ok):
+        color, thickness, radius = landmark_style(style)[i]
+        c = (int(xy[i, 0]), int(xy[i, 1]))
+        cv2.circle(frame, c, max(radius + 1, int(radius * 1.2)), _BORDER, thickness)
+        cv2.circle(frame, c, radius, color, thickness)
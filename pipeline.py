@@ -0,0 +1,226 @@
+"""
+Threaded camera -> capture -> render -> encode for the comparison feed.
+
+Each stage runs in its own thread and hands its output to the next one
+through a handoff.LatestSlot: a one item mailbox where a new put()
+replaces whatever the consumer has not picked up yet. So when a stage
+(or the client) is slower than the camera, frames are dropped at that
+point and every stage always works on the newest frame, instead of a
+queue growing and latency with it. The camera read and pose inference
+happen in the shared camera.CameraBroadcaster; the capture stage pairs
+its frames with the reference video.
+
+Every item carries the time its webcam frame was read; when the encoded
+JPEG is handed to the client the difference is recorded as the
+session's glass-to-glass latency (minus the camera's own exposure and
+the network).
+"""
+import time
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+import camera
+import metrics
+import proxy
+from handoff import LatestSlot, Closed
+from comparison import ComparisonSession, mirrored_points
+
+# how many recent frames the latency / fps figures are computed over
+STATS_WINDOW = 120
+
+_t_decode = metrics.timer("compare", "decode")
+_t_encode = metrics.timer("compare", "encode")
+
+
+class LatencyStats:
+    """Rolling capture-to-output latency and output rate for one session."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self._lat = deque(maxlen=window)
+        self._times = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.frames = 0
+
+    def record(self, captured_at, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._lat.append(now - captured_at)
+            self._times.append(now)
+            self.frames += 1
+
+    def summary(self):
+        with self._lock:
+            lat = np.array(self._lat) * 1e3
+            times = list(self._times)
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        out = {"frames": self.frames, "fps": round(fps, 2)}
+        if len(lat):
+            out["latency_ms"] = {
+                "last": round(float(lat[-1]), 1),
+                "p50": round(float(np.percentile(lat, 50)), 1),
+                "p95": round(float(np.percentile(lat, 95)), 1),
+                "max": round(float(lat.max()), 1),
+            }
+        return out
+
+
+class ComparisonPipeline:
+    """
+    Runs a ComparisonSession over a reference video and a camera on
+    background threads. Iterate over it for encoded JPEG frames; stop()
+    (or leaving a `with` block) tears the threads down.
+
+    The reference video is played at its own fps, and each reference
+    frame travels with the webcam frame read alongside it, so dropping a
+    pair never desyncs the skeleton from the video. Reference frames come
+    from the video's shared proxy when it has one, else it is decoded
+    (and the proxy built in the background, on_proxy_built(path) called
+    once it is written).
+    """
+
+    STAGES = ("camera", "capture", "render", "encode")
+
+    def __init__(self, video_path, reference, camera_source=None, jpeg_quality=None,
+                 on_proxy_built=None):
+        self.video_path = video_path
+        self.on_proxy_built = on_proxy_built
+        self.camera_source = camera_source
+        self.session = ComparisonSession(reference)
+        self.stats = LatencyStats()
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if jpeg_quality else []
+        self.error = None
+        # slot i feeds stage i + 1; the last one feeds the consumer. The
+        # first is the camera subscription, filled by the broadcaster.
+        self._sub = camera.subscribe(camera_source)
+        self._slots = [self._sub.slot] + [LatestSlot(name) for name in self.STAGES[1:]]
+        self._stop = threading.Event()
+        self._threads = []
+        self._vid = None
+        self._proxy = None
+
+    # ---- stages ----
+
+    def _capture(self, frame):
+        t = time.perf_counter()
+        if self._proxy is not None:
+            if self._idx >= len(self._proxy):
+                raise Closed
+            fv = self._proxy[self._idx]
+        else:
+            ok, fv = self._vid.read()
+            if not ok:
+                raise Closed
+        fc = cv2.flip(frame.image, 1)
+        item = (frame.captured_at, self._idx, fv, fc, mirrored_points(frame.landmarks))
+        _t_decode.observe(time.perf_counter() - t)
+        self._idx += 1
+        # keeps the reference at its own speed when the camera is faster
+        self._next_at = max(self._next_at + self._period, time.perf_counter() - self._period)
+        self._stop.wait(max(0.0, self._next_at - time.perf_counter()))
+        return item
+
+    def _render(self, item):
+        t, idx, fv, fc, cam_lm = item
+        return t, self.session.render(fv, fc, cam_lm, idx=idx, mirrored=self._proxy is not None)
+
+    def _encode(self, item):
+        t, frame = item
+        t0 = time.perf_counter()
+        ok, buf = cv2.imencode(".jpg", frame, self.jpeg_params)
+        _t_encode.observe(time.perf_counter() - t0)
+        return (t, buf.tobytes()) if ok else None
+
+    def _run(self, fn, inp, out):
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = inp.get(timeout=0.5)
+                except TimeoutError:
+                    continue
+                except Closed:
+                    break
+                res = fn(item)
+                if res is not None:
+                    out.put(res)
+        except Closed:
+            pass
+        except Exception as e:
+            self.error = self.error or e
+            self._stop.set()
+        finally:
+            out.close()
+
+    # ---- control ----
+
+    def start(self):
+        self._proxy = proxy.open_for(self.video_path, on_built=self.on_proxy_built)
+        if self._proxy is not None:
+            fps = self._proxy.fps
+        else:
+            self._vid = cv2.VideoCapture(self.video_path)
+            if not self._vid.isOpened():
+                self.stop()
+                raise IOError(f"cannot open {self.video_path}")
+            fps = self._vid.get(cv2.CAP_PROP_FPS)
+        self._period = 1.0 / (fps or 30)
+        self._next_at = time.perf_counter()
+        self._idx = 0
+        fns = [self._capture, self._render, self._encode]
+        for name, fn, inp, out in zip(self.STAGES[1:], fns, self._slots, self._slots[1:]):
+            th = threading.Thread(target=self._run, args=(fn, inp, out),
+                                  name=f"compare-{name}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def frames(self):
+        """Yields encoded JPEG bytes until the stream ends."""
+        last = self._slots[-1]
+        while True:
+            try:
+                t, jpg = last.get(timeout=0.5)
+            except TimeoutError:
+                if self._stop.is_set():
+                    break
+                continue
+            except Closed:
+                break
+            self.stats.record(t)
+            yield jpg
+        if self.error is not None:
+            raise self.error
+
+    def __iter__(self):
+        return self.frames()
+
+    def stop(self):
+        self._stop.set()
+        self._sub.close()
+        for slot in self._slots:
+            slot.close()
+        for th in self._threads:
+            th.join()
+        self._threads = []
+        if self._vid is not None:
+            self._vid.release()
+        self.session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def status(self):
+        """
+        Latency / fps summary plus, per stage, how many of its outputs were
+        replaced before the next stage (or the client) got to them.
+        """
+        st = self.stats.summary()
+        st["dropped"] = {name: slot.dropped for name, slot in zip(self.STAGES, self._slots)}
+        st["reference_frame"] = self.session.idx
+        st["score"] = round(self.session.avg, 3)
+        return st
@@ -0,0 +1,149 @@
+"""
+Pool of ready-to-use MediaPipe Pose graphs.
+
+Building a Pose loads the model and starts a calculator graph, and its
+first process() call is much slower than the rest; doing that on every
+upload, comparison or camera start is wasted time. The pool keeps idle
+graphs per settings, hands them out with checkout() and takes them back
+with checkin(), which resets the tracker so the next video starts clean.
+reset() restarts the graph, which makes the next frame as slow as a first
+one, so checkin also pushes a blank frame through right away: that cost
+lands on the caller giving the graph back, not on the next one to use it.
+
+    with pose_pool.pose(**POSE_SETTINGS) as pose:
+        pose.process(rgb)
+
+warm() builds graphs ahead of time and pushes a blank frame through them;
+run it off the request path (warm_async) so the web process starts fast
+and the first request still finds a warm graph.
+
+mediapipe itself is imported on first use, it is the slowest import the
+app has.
+
+use(inference_pool) makes checkout() open a stream of an
+inference.InferencePool instead, so the graphs run in worker processes;
+checkin() closes those streams, and warm() leaves it to the workers.
+"""
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Pose() defaults, so {} and the same values spelled out share a key
+_DEFAULTS = dict(static_image_mode=False, model_complexity=1, smooth_landmarks=True,
+                 enable_segmentation=False, smooth_segmentation=True,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5)
+MAX_IDLE = 4
+_BLANK = np.zeros((256, 256, 3), np.uint8)
+
+
+def settings_key(settings):
+    full = {**_DEFAULTS, **settings}
+    return tuple(sorted(full.items()))
+
+
+class PosePool:
+
+    def __init__(self, max_idle=MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.remote = None
+
+    def _build(self, key):
+        import mediapipe as mp
+        pose = mp.solutions.pose.Pose(**dict(key))
+        with self._lock:
+            self.created += 1
+        return pose
+
+    def use(self, remote):
+        """Hands out streams of remote (an inference.InferencePool) from now on; None: local graphs."""
+        self.remote = remote
+
+    def checkout(self, **settings):
+        """An idle Pose with these settings, or a new one."""
+        if self.remote is not None:
+            return self.remote.open(**settings)
+        key = settings_key(settings)
+        with self._lock:
+            idle = self._idle.get(key)
+            pose = idle.pop() if idle else None
+        if pose is None:
+            pose = self._build(key)
+        with self._lock:
+            self._keys[id(pose)] = key
+        return pose
+
+    def checkin(self, pose):
+        """Resets pose and keeps it for the next checkout (closes it if the pool is full)."""
+        if getattr(pose, "remote", False):
+            pose.close()
+            return
+        with self._lock:
+            key = self._keys.pop(id(pose), None)
+            full = key is None or len(self._idle.get(key, [])) >= self.max_idle
+        if full:
+            pose.close()
+            return
+        pose.reset()
+        pose.process(_BLANK)
+        self._keep(key, pose)
+
+    def _keep(self, key, pose):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(pose)
+                return
+        pose.close()
+
+    @contextmanager
+    def pose(self, **settings):
+        p = self.checkout(**settings)
+        try:
+            yield p
+        finally:
+            self.checkin(p)
+
+    def warm(self, settings, count=1):
+        """Makes sure `count` idle graphs with these settings have run a frame."""
+        if self.remote is not None:
+            return
+        key = settings_key(settings)
+        with self._lock:
+            have = len(self._idle.get(key, []))
+        for _ in range(max(0, min(count, self.max_idle) - have)):
+            p = self._build(key)
+            p.process(_BLANK)
+            self._keep(key, p)
+
+    def warm_async(self, *settings_list, count=1):
+        th = threading.Thread(target=lambda: [self.warm(s, count) for s in settings_list],
+                              name="pose-warmup", daemon=True)
+        th.start()
+        return th
+
+    def idle(self):
+        with self._lock:
+            return {k: len(v) for k, v in self._idle.items() if v}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for poses in idle.values():
+            for p in poses:
+                p.close()
+
+
+# one pool per process
+_pool = PosePool()
+
+checkout = _pool.checkout
+checkin = _pool.checkin
+use = _pool.use
+pose = _pool.pose
+warm = _pool.warm
+warm_async = _pool.warm_async
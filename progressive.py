@@ -0,0 +1,134 @@
+"""
+Annotated output written as a growing list of short segments, so the
+client can start playing an upload while the rest is still processed.
+
+    <base>.parts/
+        manifest.json   rewritten whenever a segment is complete
+        00000.webm      SEGMENT_SECONDS of annotated video each
+        00001.webm
+        ...
+
+manifest.json:
+
+    {"version": 1, "fps": 30.0, "width": 1280, "height": 720,
+     "segments": [{"file": "00000.webm", "start": 0.0, "duration": 2.0,
+                   "frames": 60}, ...],
+     "complete": false, "video": null}
+
+Only segments in the manifest are finished files. Once the last one is
+written they are stitched into <base>.webm (segmented.stitch, a stream
+copy with ffmpeg) and the manifest gets "complete": true and "video":
+the name of that file. The segments stay listed for viewers still
+playing them until the job is pruned or KEEP_SECONDS have passed (see
+jobs.JobQueue); after that the manifest is done_manifest(), with no
+segments, for as long as the .webm is there. Without ffmpeg stitching would decode and re-encode every
+frame again, so DANCE_SEGMENT_SECONDS defaults to 0 then, which turns
+this off and writes the single .webm directly, as before.
+"""
+import os
+import json
+import shutil
+
+import cv2
+
+VERSION = 1
+# same lookup as segmented.find_ffmpeg, which imports this module
+_FFMPEG = os.getenv("DANCE_FFMPEG") or shutil.which("ffmpeg")
+SEGMENT_SECONDS = float(os.getenv("DANCE_SEGMENT_SECONDS", 2 if _FFMPEG else 0))
+# how long the segments of a finished upload stay after stitching
+KEEP_SECONDS = float(os.getenv("DANCE_SEGMENT_KEEP_SECONDS", 600))
+MANIFEST = "manifest.json"
+SUFFIX = ".parts"
+
+
+def parts_dir(webm_path):
+    return os.path.splitext(webm_path)[0] + SUFFIX
+
+
+def read_manifest(folder):
+    """The manifest in folder, or None if there is none (yet)."""
+    try:
+        with open(os.path.join(folder, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def remove(webm_path):
+    """Deletes the segments of webm_path, if there are any."""
+    shutil.rmtree(parts_dir(webm_path), ignore_errors=True)
+
+
+def done_manifest(webm_path):
+    """The manifest of a finished upload whose segments are removed."""
+    return {"version": VERSION, "segments": [], "complete": True,
+            "video": os.path.basename(webm_path)}
+
+
+class SegmentWriter:
+    """
+    Drop-in for the cv2.VideoWriter preprocessing writes to: write() and
+    release(), rolling over to a new segment file every `seconds`.
+    finish() stitches the segments into the final .webm.
+    """
+
+    def __init__(self, webm_path, fps, size, seconds=SEGMENT_SECONDS):
+        self.webm_path = webm_path
+        self.dir = parts_dir(webm_path)
+        self.fps = fps
+        self.size = size
+        self.frames_per_segment = max(1, round(fps * seconds))
+        self.segments = []
+        self.frames = 0
+        self._writer = None
+        self._in_segment = 0
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir)
+        self._write_manifest()
+
+    def _write_manifest(self, video=None):
+        doc = {"version": VERSION, "fps": self.fps, "width": self.size[0], "height": self.size[1],
+               "segments": self.segments, "complete": video is not None, "video": video}
+        tmp = os.path.join(self.dir, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(doc, f)
+        os.replace(tmp, os.path.join(self.dir, MANIFEST))
+
+    def write(self, frame):
+        if self._writer is None:
+            name = f"{len(self.segments):05d}.webm"
+            self._writer = cv2.VideoWriter(os.path.join(self.dir, name),
+                                           cv2.VideoWriter_fourcc(*"VP80"), self.fps, self.size)
+            self._name = name
+        self._writer.write(frame)
+        self._in_segment += 1
+        self.frames += 1
+        if self._in_segment >= self.frames_per_segment:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._writer is None:
+            return
+        self._writer.release()
+        start = (self.frames - self._in_segment) / self.fps
+        self.segments.append({"file": self._name, "start": round(start, 4),
+                              "duration": round(self._in_segment / self.fps, 4),
+                              "frames": self._in_segment})
+        self._writer = None
+        self._in_segment = 0
+        self._write_manifest()
+
+    def release(self):
+        self._close_segment()
+
+    def finish(self):
+        """Stitches the segments into webm_path and marks the manifest complete."""
+        from segmented import stitch, _writer
+        self.release()
+        if self.segments:
+            stitch([os.path.join(self.dir, s["file"]) for s in self.segments],
+                   self.webm_path, self.fps, self.size)
+        else:
+            _writer(self.webm_path, self.fps, self.size).release()
+        self._write_manifest(video=os.path.basename(self.webm_path))
+        return self.webm_path
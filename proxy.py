@@ -0,0 +1,225 @@
+"""
+Reference video proxies for the live comparison.
+
+Every /compare_feed tick used to decode a full resolution frame of the
+reference video, mirror it and scale it to HEIGHT, and every viewer of
+the same reference did all of that again. A proxy holds those frames
+already mirrored and scaled, as JPEGs, written next to the video the
+first time it is opened as a reference:
+
+    <id>.mp4 -> <id>.proxy
+
+Layout (little endian), like landmark_store's .lmk:
+    b"DPRX" | u16 version | u32 header length | JSON header (frames, fps,
+    width, height, quality, index), space padded | pad to 64
+    JPEG frames back to back
+    u64 (frames + 1) offsets of the frames, at `index`
+
+A frame is some 40 kB (raw, a 480p frame is about 1.2 MB, some 6.5 GB
+for a 3 minute clip) and decodes in a few ms, still well under
+decoding, mirroring and scaling a frame of the video.
+
+Proxies are opened with np.memmap, and open ones are shared by every
+session in the process through a small LRU (CACHE_MB of proxy files),
+each keeping its last few decoded frames, so sessions watching the same
+part of a reference decode it once. The asset catalog counts proxies
+toward the disk quota and evicts them like annotated videos.
+"""
+import os
+import json
+import struct
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import metrics
+from hello import resize_to_height
+
+MAGIC = b"DPRX"
+VERSION = 2
+SUFFIX = ".proxy"
+# the height ComparisonSession.render shows the reference at
+HEIGHT = 480
+CACHE_MB = float(os.getenv("DANCE_PROXY_CACHE_MB", 2048))
+QUALITY = int(os.getenv("DANCE_PROXY_QUALITY", 90))
+# decoded frames each open proxy keeps for the next session asking
+DECODED = 32
+_PREFIX = struct.Struct("<4sHI")
+_HEADER = 192
+_ALIGN = 64
+
+
+def proxy_path(video_path):
+    return os.path.splitext(video_path)[0] + SUFFIX
+
+
+def proxy_frame(frame, height=HEIGHT):
+    """One reference frame the way render() shows it: mirrored, then scaled."""
+    return resize_to_height(cv2.flip(frame, 1), height)
+
+
+class Proxy:
+    """
+    Frames of a proxy, BGR uint8 (read-only, shared: copy before drawing).
+    data: the JPEGs (memory mapped), offsets: frame i is data[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, data, offsets, fps):
+        self.data = data
+        self.offsets = offsets
+        self.fps = fps
+        self.nbytes = data.nbytes
+        self._decoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        with self._lock:
+            frame = self._decoded.get(i)
+            if frame is not None:
+                self._decoded.move_to_end(i)
+                return frame
+        frame = cv2.imdecode(self.data[self.offsets[i]:self.offsets[i + 1]], cv2.IMREAD_COLOR)
+        frame.flags.writeable = False
+        with self._lock:
+            self._decoded[i] = frame
+            if len(self._decoded) > DECODED:
+                self._decoded.popitem(last=False)
+        return frame
+
+
+def _header(frames, fps, width, height, index=0, quality=QUALITY):
+    meta = json.dumps({"frames": frames, "fps": fps, "width": width, "height": height,
+                       "quality": quality, "index": index}).encode()
+    return _PREFIX.pack(MAGIC, VERSION, _HEADER) + meta.ljust(_HEADER)
+
+
+def build(video_path, path=None, height=HEIGHT, quality=QUALITY):
+    """Decodes video_path once into its proxy. Returns the proxy path."""
+    path = path or proxy_path(video_path)
+    vid = cv2.VideoCapture(video_path)
+    if not vid.isOpened():
+        raise IOError(f"Cannot open {video_path}")
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30
+    start = _PREFIX.size + _HEADER
+    start += -start % _ALIGN
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    offsets, size = [start], (0, 0)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * start)
+            while True:
+                ok, frame = vid.read()
+                if not ok:
+                    break
+                small = proxy_frame(frame, height)
+                size = small.shape[1], small.shape[0]
+                ok, buf = cv2.imencode(".jpg", small, params)
+                if not ok:
+                    raise IOError(f"Cannot encode a frame of {video_path}")
+                f.write(buf.tobytes())
+                offsets.append(offsets[-1] + len(buf))
+            index = offsets[-1]
+            f.write(np.array(offsets, "<u8").tobytes())
+            # the frame count is only known now
+            f.seek(0)
+            f.write(_header(len(offsets) - 1, fps, *size, index=index, quality=quality))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        vid.release()
+    os.replace(tmp, path)
+    return path
+
+
+def load(path):
+    with open(path, "rb") as f:
+        magic, version, hlen = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a proxy")
+        if version != VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {VERSION}")
+        meta = json.loads(f.read(hlen))
+    n = meta["frames"]
+    index = meta["index"]
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    offsets = np.frombuffer(data, "<u8", count=n + 1, offset=index).astype(np.int64)
+    return Proxy(data, offsets, meta["fps"])
+
+
+class ProxyCache:
+    """
+    Open proxies by path, least recently used dropped once their files
+    add up to more than max_mb. Sessions still holding a dropped one keep
+    reading it; a proxy rewritten on disk is reopened.
+    """
+
+    def __init__(self, max_mb=CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """The Proxy at path, or None if there is none."""
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            hit = self._open.get(path)
+            if hit is not None and hit[0] == mtime:
+                self._open.move_to_end(path)
+                metrics.inc("dance_proxy_cache_total", result="hit")
+                return hit[1]
+        p = load(path)
+        metrics.inc("dance_proxy_cache_total", result="miss")
+        with self._lock:
+            self._open[path] = (mtime, p)
+            self._open.move_to_end(path)
+            total = sum(q.nbytes for _, q in self._open.values())
+            while total > self.max_bytes and len(self._open) > 1:
+                _, (_, old) = self._open.popitem(last=False)
+                total -= old.nbytes
+        return p
+
+
+cache = ProxyCache()
+_building = set()
+_building_lock = threading.Lock()
+
+
+def open_for(video_path, build_missing=True, on_built=None):
+    """
+    The shared Proxy of a reference video, or None when it has none yet;
+    then one is built in the background (once) for the next session, and
+    on_built(path) called once it is in place.
+    """
+    path = proxy_path(video_path)
+    p = cache.get(path)
+    if p is None and build_missing and os.path.isfile(video_path):
+        with _building_lock:
+            if path in _building:
+                return None
+            _building.add(path)
+
+        def run():
+            try:
+                build(video_path, path)
+                if on_built is not None:
+                    on_built(path)
+            except (IOError, OSError):
+                pass
+            finally:
+                with _building_lock:
+                    _building.discard(path)
+
+        threading.Thread(target=run, name="proxy-build", daemon=True).start()
+    return p
@@ -0,0 +1,163 @@
+"""
+Per-frame reference features, computed once when a routine is uploaded.
+
+The live comparison shows the reference mirrored, and for every webcam
+frame it used to mirror the reference landmarks again, wrap them in a
+NormalizedLandmarkList, unwrap that into tuples and recompute the
+reference joint angles and body scale - for a routine that never
+changes. The index holds all of that for every frame:
+
+    points    (T, 33, 4)  float32  mirrored landmarks (x -> 1 - x), NaN where no pose
+    visible   (T, 33)     bool     visibility > similarity.VIS_THRESH
+    scale     (T,)        float32  similarity.body_scale
+    angles    (T, J)      float32  similarity.joint_angles, J = len(similarity.JOINTS)
+    joint_ok  (T, J)      bool     similarity.joint_visible
+    present   (T,)        bool     frame has a pose
+
+so per webcam frame the reference side is one lookup. It is stored next
+to <key>.lmk as <key>.ref, laid out like a .lmk:
+
+    b"DREF" | u16 version | u32 header length | JSON header | pad to 64
+    the arrays above in that order, each padded to 64
+
+and opened with np.memmap, so every session comparing against a routine
+shares one copy of it in the page cache. Indexes missing or older than
+their .lmk (uploads from before this, a new VERSION) are rebuilt on load.
+"""
+import os
+import json
+import struct
+import threading
+
+import numpy as np
+
+import similarity
+from landmark_store import load_landmarks
+
+MAGIC = b"DREF"
+VERSION = 2
+SUFFIX = ".ref"
+_FIELDS = similarity.Features._fields
+_PREFIX = struct.Struct("<4sHI")
+_ALIGN = 64
+
+
+def index_path(landmarks_path):
+    return os.path.splitext(landmarks_path)[0] + SUFFIX
+
+
+class ReferenceIndex:
+
+    def __init__(self, feats, present, fps=None):
+        self.features = feats
+        self.present = present
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.present)
+
+    def __getitem__(self, i):
+        """similarity.Features for frame i (views into the index), or None."""
+        if not self.present[i]:
+            return None
+        return similarity.Features(*(f[i] for f in self.features))
+
+    @property
+    def points(self):
+        return self.features.points
+
+
+def build_index(landmarks, fps=None):
+    """landmarks: a LandmarkFile, a (T, 33, 4) array or a list of 33-tuples / None."""
+    if hasattr(landmarks, "landmarks"):
+        fps = fps or landmarks.fps
+        landmarks = landmarks.landmarks
+    arr = np.array(similarity.to_array(landmarks), dtype=np.float32)
+    # mirrored in float32, exactly like the NormalizedLandmarkList it replaces
+    arr[..., 0] = 1 - arr[..., 0]
+    feats = similarity.features(arr.astype(np.float64))
+    # kept in float32 like on disk, so a built index scores like a loaded one
+    feats = similarity.Features(*(f if f.dtype == bool else f.astype(np.float32) for f in feats))
+    present = ~np.isnan(arr[:, 0, 0])
+    return ReferenceIndex(feats, present, fps)
+
+
+def _arrays(idx):
+    return list(zip(_FIELDS, idx.features)) + [("present", idx.present)]
+
+
+def _write(path, idx):
+    fields = []
+    for name, a in _arrays(idx):
+        fields.append({"name": name, "dtype": "|b1" if a.dtype == bool else "<f4",
+                       "shape": list(a.shape)})
+    header = json.dumps({"fps": idx.fps, "frames": len(idx), "fields": fields}).encode()
+    offset = _PREFIX.size + len(header)
+
+    # unique per writer: a request thread and a worker may rebuild the same index
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for field, (_, a) in zip(fields, _arrays(idx)):
+                f.write(b"\0" * (-offset % _ALIGN))
+                offset += -offset % _ALIGN
+                data = np.ascontiguousarray(a, dtype=field["dtype"]).tobytes()
+                f.write(data)
+                offset += len(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read(path):
+    """The index at path, memory mapped; None if it is of another VERSION."""
+    with open(path, "rb") as f:
+        magic, version, hlen = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a reference index")
+        if version != VERSION:
+            return None
+        meta = json.loads(f.read(hlen))
+    offset = _PREFIX.size + hlen
+    arrays = {}
+    for field in meta["fields"]:
+        offset += -offset % _ALIGN
+        dtype, shape = np.dtype(field["dtype"]), tuple(field["shape"])
+        if meta["frames"] == 0:
+            a = np.empty(shape, dtype)
+        else:
+            a = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        arrays[field["name"]] = a
+        offset += a.nbytes
+    feats = similarity.Features(*(arrays[k] for k in _FIELDS))
+    return ReferenceIndex(feats, arrays["present"], meta["fps"])
+
+
+def save_index(landmarks_path, landmarks=None, fps=None):
+    """
+    Builds the index for a landmark file and writes it beside it; pass the
+    landmarks if they are already in memory. Returns the path.
+    """
+    if landmarks is None:
+        landmarks = load_landmarks(landmarks_path)
+    path = index_path(landmarks_path)
+    _write(path, build_index(landmarks, fps))
+    return path
+
+
+def load_index(landmarks_path):
+    """The index for a landmark file, (re)built first if needed."""
+    path = index_path(landmarks_path)
+    fresh = (os.path.exists(path)
+             and os.path.getmtime(path) >= os.path.getmtime(landmarks_path))
+    if fresh:
+        idx = _read(path)
+        if idx is not None:
+            return idx
+    idx = build_index(load_landmarks(landmarks_path))
+    _write(path, idx)
+    return idx
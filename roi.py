@@ -0,0 +1,148 @@
+"""
+Pose on a crop around the dancer instead of the whole frame.
+
+pose.process used to get every frame whole, converted to RGB whole, even
+when the dancer is a small part of a wide 1080p shot: mediapipe then
+copies and scales the full image for every frame, and the landmark model
+sees the dancer at a fraction of its input size. A RoiTracker keeps a
+square box around the previous frame's landmarks, padded by PAD of the
+body size on every side, and runs pose on that crop only (colour
+conversion included). Landmarks come back in full-frame normalized
+coordinates, like a plain pose.process would give them.
+
+The box stays put while the body stays well inside it, so mediapipe's
+own tracker keeps seeing the same view; it moves when the body gets
+within MARGIN of an edge or shrinks to less than half of it. No pose in
+the crop drops the box and the same frame is run whole again, as are
+frames where the box would not fit in the frame or cover most of it.
+
+DANCE_POSE_ROI=1 turns it on for uploads and the camera.
+"""
+import os
+
+import cv2
+import numpy as np
+
+import metrics
+
+ENABLED = os.getenv("DANCE_POSE_ROI", "0") == "1"
+# padding around the landmarks' bounding box, as a fraction of its longer side
+PAD = float(os.getenv("DANCE_ROI_PAD", 0.3))
+# the box moves once a landmark is closer than this (of the box side) to its edge
+MARGIN = 0.08
+# boxes smaller than this many pixels are grown to it
+MIN_SIDE = 160
+# boxes covering more than this of the frame area are not worth a crop
+MAX_AREA = 0.6
+
+
+def _rgb(image, infer_height=None):
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    h, w = rgb.shape[:2]
+    if infer_height and h > infer_height:
+        rgb = cv2.resize(rgb, (round(w * infer_height / h), infer_height),
+                         interpolation=cv2.INTER_AREA)
+    return rgb
+
+
+class RoiTracker:
+    """
+    Wraps a Pose: process(frame) takes a BGR frame and returns its
+    pose_landmarks (or None), a NormalizedLandmarkList or, from an
+    inference.RemotePose, a (33, 4) array. One tracker per video or
+    camera, like the Pose itself. infer_height scales taller crops down
+    before pose.
+    """
+
+    def __init__(self, pose, infer_height=None, pad=PAD):
+        self.pose = pose
+        self.infer_height = infer_height
+        self.pad = pad
+        self.box = None         # (x0, y0, side_w, side_h) in pixels, None = whole frame
+        self._moved = False
+
+    def reset(self):
+        self.box = None
+        self._moved = False
+
+    def process(self, frame):
+        h, w = frame.shape[:2]
+        if self.box is not None:
+            x0, y0, bw, bh = self.box
+            rgb = _rgb(frame[y0:y0 + bh, x0:x0 + bw], self.infer_height)
+            lm = self.pose.process(rgb).pose_landmarks
+            if lm is None and self._moved:
+                # mediapipe tracked the person where they were in the old
+                # view, which misses in the new one and makes it detect
+                # afresh on the next call: this one
+                lm = self.pose.process(rgb).pose_landmarks
+            self._moved = False
+            if lm is not None:
+                metrics.inc("dance_pose_roi_total", result="crop")
+                lm = _to_frame(lm, self.box, w, h)
+                self._follow(lm, w, h)
+                return lm
+            # lost it: the whole frame, this frame
+            metrics.inc("dance_pose_roi_total", result="lost")
+            self.box = None
+        metrics.inc("dance_pose_roi_total", result="full")
+        lm = self.pose.process(_rgb(frame, self.infer_height)).pose_landmarks
+        if lm is not None:
+            self._follow(lm, w, h)
+        return lm
+
+    def _follow(self, lm, w, h):
+        """Keeps the box or moves it, for landmarks in frame coordinates."""
+        # off-frame guesses too: a crop cut by the frame edge would show
+        # pose less of the person than the whole frame does
+        pts = _points(lm)[:, :2] * (w, h)
+        lo, hi = pts.min(0), pts.max(0)
+        if self.box is not None:
+            x0, y0, bw, bh = self.box
+            m = MARGIN * max(bw, bh)
+            # an edge on the frame border has nowhere to move to
+            near_lo = np.where((x0, y0) > np.zeros(2), (x0 + m, y0 + m), 0)
+            near_hi = np.where((x0 + bw, y0 + bh) < np.array((w, h)), (x0 + bw - m, y0 + bh - m), (w, h))
+            inside = (lo >= near_lo).all() and (hi <= near_hi).all()
+            if inside and (hi - lo).max() > 0.5 * max(bw, bh) * (1 - 2 * MARGIN):
+                return
+        box = _square(lo, hi, self.pad, w, h)
+        self._moved = box != self.box
+        self.box = box
+
+
+def _square(lo, hi, pad, w, h):
+    """
+    A square box around lo..hi padded by pad, moved into the frame; None
+    if it does not fit or is most of the frame.
+    """
+    side = int(max((hi - lo).max() * (1 + 2 * pad), MIN_SIDE))
+    if side > min(w, h) or side * side > MAX_AREA * w * h:
+        return None
+    cx, cy = (lo + hi) / 2
+    x0 = int(np.clip(round(cx - side / 2), 0, w - side))
+    y0 = int(np.clip(round(cy - side / 2), 0, h - side))
+    return x0, y0, side, side
+
+
+def _points(lm):
+    """Like hello.as_points, which cannot be imported here (hello imports roi)."""
+    if hasattr(lm, "landmark"):
+        return np.array([(p.x, p.y, p.z, p.visibility) for p in lm.landmark])
+    return np.asarray(lm)
+
+
+def _to_frame(lm, box, w, h):
+    """Crop-normalized landmarks -> frame-normalized; a NormalizedLandmarkList in place."""
+    x0, y0, bw, bh = box
+    sx, sy, ox, oy = bw / w, bh / h, x0 / w, y0 / h
+    if not hasattr(lm, "landmark"):
+        pts = np.array(lm, np.float32)
+        pts[:, :3] = pts[:, :3] * (sx, sy, sx) + (ox, oy, 0)
+        return pts
+    for p in lm.landmark:
+        p.x = p.x * sx + ox
+        p.y = p.y * sy + oy
+        # z is on the same scale as x
+        p.z = p.z * sx
+    return lm
@@ -0,0 +1,150 @@
+"""
+Parallel preprocessing for long videos.
+
+The video is cut into frame ranges. Each range goes to its own process
+with its own Pose, which first runs over WARMUP_FRAMES frames before the
+range so tracking has converged by the first frame that is kept. The
+per-range landmarks are concatenated and the encoded pieces stitched,
+so the outputs match preprocess_and_annotate_video.
+
+Stitching uses `ffmpeg -c copy` when an ffmpeg binary is around (set
+DANCE_FFMPEG or put it on PATH); that way the VP8 encode, the slowest
+stage, also runs in parallel. Without ffmpeg the pieces are written as
+MJPG and re-encoded to VP8 once at the end.
+"""
+import os
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+import metrics
+import pose_pool
+from hello import annotate_range, POSE_SETTINGS
+from landmark_store import save_landmarks
+from reference_index import save_index
+
+WARMUP_FRAMES = 15
+# ranges shorter than this are not worth a process of their own
+MIN_SEGMENT_FRAMES = 120
+
+_ctx = multiprocessing.get_context("spawn")
+
+
+def find_ffmpeg():
+    return os.getenv("DANCE_FFMPEG") or shutil.which("ffmpeg")
+
+
+def plan_segments(total, workers, min_len=None):
+    """Splits [0, total) into at most `workers` contiguous (start, stop) ranges."""
+    n = max(1, min(workers, total // (min_len or MIN_SEGMENT_FRAMES)))
+    bounds = [total * i // n for i in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _writer(path, fps, size):
+    fourcc = "VP80" if path.endswith(".webm") else "MJPG"
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+
+
+def _run_segment(video_path, start, count, seg_path, warmup, settings, stride=1, infer_height=None,
+                 track_roi=False):
+    metrics.reset()
+    vid = cv2.VideoCapture(video_path)
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    first = max(0, start - warmup)
+    if first:
+        vid.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    out = _writer(seg_path, fps, size)
+    with pose_pool.pose(**settings) as pose:
+        landmarks = annotate_range(vid, pose, out, count=count, warmup=start - first,
+                                   stride=stride, infer_height=infer_height, track_roi=track_roi)
+    out.release()
+    vid.release()
+    return landmarks, metrics.snapshot()
+
+
+def stitch(seg_paths, out_path, fps, size):
+    """Joins the segment files into out_path (a .webm)."""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg and all(p.endswith(".webm") for p in seg_paths):
+        listing = out_path + ".txt"
+        with open(listing, "w") as f:
+            f.writelines(f"file '{os.path.abspath(p)}'\n" for p in seg_paths)
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", listing, "-c", "copy", out_path], check=True)
+        finally:
+            os.remove(listing)
+        return
+
+    out = _writer(out_path, fps, size)
+    for p in seg_paths:
+        seg = cv2.VideoCapture(p)
+        while True:
+            ret, frame = seg.read()
+            if not ret:
+                break
+            out.write(frame)
+        seg.release()
+    out.release()
+
+
+def preprocess_parallel(video_path, output_video_path, landmark_output_path,
+                        workers=None, warmup=WARMUP_FRAMES, progress=None,
+                        pose_settings=None, stride=1, infer_height=None, track_roi=False):
+    """
+    Same contract as hello.preprocess_and_annotate_video, spread over
+    `workers` processes. progress(frames_done, frames_total) is called as
+    each range finishes.
+    """
+    workers = workers or os.cpu_count() or 1
+    vid = cv2.VideoCapture(video_path)
+    if not vid.isOpened():
+        raise IOError(f"Cannot open {video_path}")
+    size = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30
+    total = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
+    vid.release()
+
+    webm_path = os.path.splitext(output_video_path)[0] + ".webm"
+    ranges = [(start, stop - start) for start, stop in plan_segments(total, workers)]
+    # the container's frame count can be off, so the last range reads to the end
+    ranges[-1] = (ranges[-1][0], None)
+    ext = ".webm" if find_ffmpeg() else ".avi"
+
+    tmp = tempfile.mkdtemp(prefix="segments-", dir=os.path.dirname(os.path.abspath(webm_path)))
+    try:
+        seg_paths = [os.path.join(tmp, f"{i:04d}{ext}") for i in range(len(ranges))]
+        parts = [None] * len(ranges)
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=_ctx) as pool:
+            futs = {
+                pool.submit(_run_segment, video_path, start, count, seg_paths[i],
+                            warmup, pose_settings or POSE_SETTINGS, stride, infer_height, track_roi): i
+                for i, (start, count) in enumerate(ranges)
+            }
+            try:
+                for fut in as_completed(futs):
+                    parts[futs[fut]], timings = fut.result()
+                    metrics.merge(timings)
+                    if progress:
+                        done = sum(len(p[0]) for p in parts if p is not None)
+                        progress(done, max(total, done))
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        stitch(seg_paths, webm_path, fps, size)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    all_landmarks = [lm for part, _ in parts for lm in part]
+    interpolated = [f for _, flags in parts for f in flags]
+    save_landmarks(landmark_output_path, all_landmarks, fps, *size, interpolated=interpolated)
+    save_index(landmark_output_path, all_landmarks, fps)
+    return webm_path
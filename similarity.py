@@ -0,0 +1,139 @@
+"""
+Array based pose similarity.
+
+Works on (33, 4) frames or (T, 33, 4) sequences of (x, y, z, visibility).
+Missing frames (None in the old pickles) become rows of NaN and score 0.
+Gives the same numbers as the old per-landmark loop in calculate_similarity.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+N_LANDMARKS = 33
+VIS_THRESH = 0.5
+
+# (a, b, c, name): angle at b between b->a and b->c
+JOINTS = [
+    (11, 13, 15, "Left Elbow"),
+    (12, 14, 16, "Right Elbow"),
+    (13, 11, 23, "Left Shoulder"),
+    (14, 12, 24, "Right Shoulder"),
+]
+JOINT_NAMES = [j[3] for j in JOINTS]
+_A, _B, _C = (np.array([j[i] for j in JOINTS]) for i in range(3))
+
+
+def to_array(landmarks):
+    """
+    Turns a frame (list of 33 tuples / None) or a list of frames into a
+    float64 array of shape (33, 4) or (T, 33, 4). None -> NaN.
+    """
+    if isinstance(landmarks, np.ndarray):
+        return landmarks.astype(np.float64, copy=False)
+    if landmarks is None:
+        return np.full((N_LANDMARKS, 4), np.nan)
+    if len(landmarks) == 0:
+        return np.empty((0, N_LANDMARKS, 4))
+    if landmarks[0] is None or np.ndim(landmarks[0]) == 2:
+        out = np.full((len(landmarks), N_LANDMARKS, 4), np.nan)
+        for i, fr in enumerate(landmarks):
+            if fr is not None:
+                out[i] = fr
+        return out
+    return np.asarray(landmarks, dtype=np.float64)
+
+
+def visible(arr):
+    # NaN compares False, so missing frames are never visible
+    return arr[..., 3] > VIS_THRESH
+
+
+def body_scale(arr):
+    """Shoulder width in 2D, 1.0 when a shoulder is hidden (same as compute_body_scale)."""
+    vis = visible(arr)
+    s = np.hypot(arr[..., 11, 0] - arr[..., 12, 0], arr[..., 11, 1] - arr[..., 12, 1])
+    ok = vis[..., 11] & vis[..., 12] & (s > 0)
+    return np.where(ok, s, 1.0)
+
+
+def joint_angles(arr):
+    """2D angle in degrees for every joint in JOINTS, shape (..., len(JOINTS))."""
+    ba = arr[..., _A, :2] - arr[..., _B, :2]
+    bc = arr[..., _C, :2] - arr[..., _B, :2]
+    dot = (ba * bc).sum(-1)
+    m = np.hypot(ba[..., 0], ba[..., 1]) * np.hypot(bc[..., 0], bc[..., 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = np.clip(dot / m, -1.0, 1.0)
+    return np.where(m == 0, 0.0, np.degrees(np.arccos(cos)))
+
+
+def joint_visible(arr):
+    vis = visible(arr)
+    return vis[..., _A] & vis[..., _B] & vis[..., _C]
+
+
+class Similarity(NamedTuple):
+    """
+    Result of compare(). Every field has the broadcast batch shape of the
+    inputs (scalars for single frames); per-joint fields add a trailing
+    len(JOINTS) axis with NaN where the joint was not visible in both.
+    """
+    score: np.ndarray
+    pos_sim: np.ndarray
+    valid: np.ndarray
+    ref_angles: np.ndarray
+    cam_angles: np.ndarray
+    angle_diff: np.ndarray
+
+    def angle_data(self, i=None):
+        """The {"Left Elbow": {"video", "webcam", "diff"}} dict generate_feedback expects."""
+        sel = (lambda a: a) if i is None else (lambda a: a[i])
+        ref, cam, diff = sel(self.ref_angles), sel(self.cam_angles), sel(self.angle_diff)
+        return {
+            name: {"video": float(ref[k]), "webcam": float(cam[k]), "diff": float(diff[k])}
+            for k, name in enumerate(JOINT_NAMES) if not np.isnan(diff[k])
+        }
+
+
+class Features(NamedTuple):
+    """Everything compare() needs from one side, see features()."""
+    points: np.ndarray      # (..., 33, 4) float64
+    visible: np.ndarray     # (..., 33) bool
+    scale: np.ndarray       # (...) body_scale
+    angles: np.ndarray      # (..., len(JOINTS)) joint_angles
+    joint_ok: np.ndarray    # (..., len(JOINTS)) joint_visible
+
+
+def features(landmarks):
+    arr = to_array(landmarks)
+    return Features(arr, visible(arr), body_scale(arr), joint_angles(arr), joint_visible(arr))
+
+
+def compare(ref, cam):
+    """
+    Scores ref against cam: 0.2 * position similarity + 0.8 * mean joint
+    angle similarity, 0 where either has nothing visible to compare.
+    Either side may be a precomputed Features (see reference_index).
+    """
+    ref = ref if isinstance(ref, Features) else features(ref)
+    cam = cam if isinstance(cam, Features) else features(cam)
+
+    both = ref.visible & cam.visible
+    avg_s = (ref.scale + cam.scale) / 2.0
+    dist = np.linalg.norm(ref.points[..., :3] - cam.points[..., :3], axis=-1) / avg_s[..., None]
+    n_pos = both.sum(-1)
+    with np.errstate(invalid="ignore"):
+        avg_pos = np.where(both, dist, 0.0).sum(-1) / n_pos
+    pos_sim = np.exp(-5 * avg_pos ** 2)
+
+    a_ok = ref.joint_ok & cam.joint_ok
+    a1, a2 = ref.angles, cam.angles
+    diff = np.where(a_ok, np.abs(a1 - a2), np.nan)
+    n_ang = a_ok.sum(-1)
+    with np.errstate(invalid="ignore"):
+        ang_sim = np.where(a_ok, 1 - diff / 180.0, 0.0).sum(-1) / n_ang
+
+    valid = (n_pos > 0) & (n_ang > 0)
+    score = np.where(valid, 0.2 * pos_sim + 0.8 * ang_sim, 0.0)
+    return Similarity(score, np.where(valid, pos_sim, 0.0), valid,
+                      np.where(a_ok, a1, np.nan), np.where(a_ok, a2, np.nan), diff)
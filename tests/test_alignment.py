@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alignment
+
+
+def _landmarks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    arr = rng.uniform(0.2, 0.8, (n, 33, 4))
+    arr[..., 3] = 1.0
+    return arr
+
+
+def test_attempt_too_long_for_reference_raises_value_error():
+    # j moves on by at most 2 per reference frame, no path reaches the end
+    with pytest.raises(ValueError, match="length ratio"):
+        alignment.align(_landmarks(5), _landmarks(300, seed=1))
+
+
+def test_same_sequence_aligns_to_itself():
+    ref = _landmarks(60)
+    res = alignment.align(ref, ref)
+    assert np.array_equal(res.path, np.arange(60))
+    assert res.median_lag == 0.0
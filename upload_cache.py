@@ -0,0 +1,42 @@
+"""
+Content addressed naming for uploads.
+
+An upload is hashed while it streams to disk. Its id is derived from that
+hash plus everything that changes the derived files (pose settings and the
+landmark format version), so re-uploading the same clip maps to the same
+<key>.lmk / <key>_annotated.webm and is never processed twice, while a
+settings change gives new ids.
+"""
+import os
+import json
+import hashlib
+
+import landmark_store
+
+CHUNK = 1 << 20
+
+
+def save_and_hash(stream, path):
+    """Copies stream to path chunk by chunk, returns the sha256 hex of the bytes."""
+    h = hashlib.sha256()
+    with open(path, "wb") as out:
+        while True:
+            chunk = stream.read(CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            out.write(chunk)
+    return h.hexdigest()
+
+
+def cache_key(content_hash, pose_settings):
+    """32 hex chars, same shape as the uuid4 ids uploads used before."""
+    h = hashlib.sha256(content_hash.encode())
+    h.update(json.dumps(pose_settings, sort_keys=True).encode())
+    h.update(b"lmk%d" % landmark_store.VERSION)
+    return h.hexdigest()[:32]
+
+
+def lookup(webm_path, lm_path):
+    """True when both derived files for a key are already on disk."""
+    return os.path.isfile(webm_path) and os.path.isfile(lm_path)